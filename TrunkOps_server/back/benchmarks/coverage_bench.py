@@ -0,0 +1,334 @@
+"""Coverage engine benchmarks with a stored baseline.
+
+Runs synthetic scenarios (sites x radius x step) through the stages of
+a `/coverage/calc` request and records, per stage, the wall time (best
+of `--repeat` runs), the peak traced memory (one extra run under
+`tracemalloc`, which NumPy reports its buffers to) and cells per
+second:
+
+* `grid` - `build_grid`
+* `scalar` - `calc_rx_level` for every site at up to `SCALAR_CELLS`
+  cells (the `hata_path_loss` reference path), scaled to cells/s
+* `propagation` - the in-process batched engine (`best_server`)
+* `serialize_cells` - the default per-cell JSON body, up to
+  `MAX_JSON_CELLS` cells
+* `serialize_binary` - the binary raster body
+
+Scenarios larger than `--max-cells` are recorded as skipped, so the
+default run finishes in a few minutes; pass `--max-cells 0` for the
+full matrix. Everything is offline and single-process.
+
+    python -m TrunkOps_server.back.benchmarks.coverage_bench \\
+        --output bench.json --compare
+
+compares against `baseline.json` next to this file and exits with 1
+when a stage is slower (or uses more memory) than the baseline by
+more than the tolerance; `--save-baseline` replaces the baseline.
+Baselines are only comparable on the same machine.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ..coverage_schemas import CoverageRequest, GridConfig, Site
+from ..routers.coverage_calc import _encode_result
+from ..services import raster_codec
+from ..services.coverage_engine import best_server
+from ..services.grid_service import build_grid
+from ..services.propagation_service import calc_rx_level
+
+
+FORMAT_VERSION = 1
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+SITE_COUNTS = (1, 10, 100)
+RADII_KM = (5.0, 20.0, 50.0)
+STEPS_M = (25.0, 100.0, 250.0)
+
+CENTER_LAT = 50.45
+CENTER_LON = 30.52
+
+# Cells evaluated by the scalar stage; it is orders of magnitude slower.
+SCALAR_CELLS = 500
+
+# The per-cell JSON body is only built up to this many cells.
+MAX_JSON_CELLS = 250_000
+
+# Larger scenarios are skipped unless --max-cells is raised.
+DEFAULT_MAX_CELLS = 2_000_000
+
+# Stage changes below this many seconds are treated as noise.
+MIN_DELTA_S = 0.005
+
+
+def scenario_name(n_sites: int, radius_km: float, step_m: float) -> str:
+    return f"s{n_sites}_r{radius_km:g}_st{step_m:g}"
+
+
+def synthetic_sites(n_sites: int, radius_km: float, seed: int = 0) -> List[Site]:
+    """Deterministic sites spread over the calculation circle."""
+    rng = np.random.default_rng(seed + n_sites)
+    r = radius_km * np.sqrt(rng.uniform(0.0, 1.0, n_sites))
+    theta = rng.uniform(0.0, 2.0 * np.pi, n_sites)
+    dlat = r * np.cos(theta) / 111.32
+    dlon = r * np.sin(theta) / (111.32 * np.cos(np.radians(CENTER_LAT)))
+    channels = 400.0 + 12.5 * rng.integers(0, 8, n_sites)
+    return [
+        Site(
+            id=f"bs{i}",
+            lat=CENTER_LAT + float(dlat[i]),
+            lon=CENTER_LON + float(dlon[i]),
+            tx_power_dbm=float(rng.uniform(37.0, 44.0)),
+            antenna_gain_dbi=float(rng.uniform(2.0, 9.0)),
+            antenna_height_m=float(rng.uniform(25.0, 80.0)),
+            frequency_mhz=float(channels[i]),
+        )
+        for i in range(n_sites)
+    ]
+
+
+def expected_cells(radius_km: float, step_m: float) -> int:
+    return int(np.pi * (radius_km * 1000.0 / step_m) ** 2)
+
+
+def _measure(fn: Callable[[], object], repeat: int, trace: bool):
+    """(best wall time, peak traced MB or None, last result)."""
+    best = float("inf")
+    result = None
+    for _ in range(max(1, repeat)):
+        result = None
+        gc.collect()
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    peak_mb = None
+    if trace:
+        result = None
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return best, peak_mb, result
+
+
+def _stage(wall_s: float, peak_mb: Optional[float], cells: int) -> Dict[str, object]:
+    return {
+        "wall_s": round(wall_s, 6),
+        "peak_mb": None if peak_mb is None else round(peak_mb, 3),
+        "cells_per_s": round(cells / wall_s, 1) if wall_s > 0 else None,
+    }
+
+
+def run_scenario(n_sites: int,
+                 radius_km: float,
+                 step_m: float,
+                 model: str = "hata",
+                 repeat: int = 3,
+                 trace: bool = True) -> Dict[str, object]:
+    sites = synthetic_sites(n_sites, radius_km)
+    req = CoverageRequest(
+        sites=sites,
+        grid=GridConfig(
+            center_lat=CENTER_LAT, center_lon=CENTER_LON,
+            radius_km=radius_km, step_m=step_m,
+        ),
+        model=model,
+    )
+    stages: Dict[str, Dict[str, object]] = {}
+
+    wall, peak, grid = _measure(
+        lambda: build_grid(CENTER_LAT, CENTER_LON, radius_km, step_m), repeat, trace
+    )
+    n_cells = len(grid)
+    stages["grid"] = _stage(wall, peak, n_cells)
+
+    idx = np.linspace(0, n_cells - 1, min(n_cells, SCALAR_CELLS)).astype(np.int64)
+    sample = list(zip(grid.lats[idx].tolist(), grid.lons[idx].tolist()))
+
+    def scalar():
+        return [
+            max(calc_rx_level(site, lat, lon, req.rx_height_m, model) for site in sites)
+            for lat, lon in sample
+        ]
+
+    wall, peak, _ = _measure(scalar, 1, trace)
+    stages["scalar"] = _stage(wall, peak, len(sample))
+
+    wall, peak, result = _measure(
+        lambda: best_server(grid.lats, grid.lons, sites, req.rx_height_m, model),
+        repeat, trace,
+    )
+    stages["propagation"] = _stage(wall, peak, n_cells)
+
+    def cells_body():
+        response = _encode_result(None, req, grid, result, "cells", "float32")
+        return response.model_dump_json(exclude_none=True)
+
+    if n_cells <= MAX_JSON_CELLS:
+        wall, peak, _ = _measure(cells_body, repeat, trace)
+        stages["serialize_cells"] = _stage(wall, peak, n_cells)
+    else:
+        stages["serialize_cells"] = {"skipped": f"{n_cells} cells > {MAX_JSON_CELLS}"}
+
+    wall, peak, _ = _measure(
+        lambda: raster_codec.encode_binary(grid, result.rx_level_dbm, step_m),
+        repeat, trace,
+    )
+    stages["serialize_binary"] = _stage(wall, peak, n_cells)
+
+    return {
+        "scenario": scenario_name(n_sites, radius_km, step_m),
+        "n_sites": n_sites,
+        "radius_km": radius_km,
+        "step_m": step_m,
+        "model": model,
+        "n_cells": n_cells,
+        "stages": stages,
+    }
+
+
+def machine_info() -> Dict[str, object]:
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+
+def run_suite(site_counts: Sequence[int] = SITE_COUNTS,
+              radii_km: Sequence[float] = RADII_KM,
+              steps_m: Sequence[float] = STEPS_M,
+              model: str = "hata",
+              repeat: int = 3,
+              max_cells: int = DEFAULT_MAX_CELLS,
+              trace: bool = True,
+              log: Callable[[str], None] = lambda line: None) -> Dict[str, object]:
+    results = []
+    for n_sites in site_counts:
+        for radius_km in radii_km:
+            for step_m in steps_m:
+                name = scenario_name(n_sites, radius_km, step_m)
+                estimate = expected_cells(radius_km, step_m)
+                if max_cells and estimate > max_cells:
+                    results.append({"scenario": name, "skipped": f"~{estimate} cells > max_cells"})
+                    log(f"{name}: skipped (~{estimate} cells)")
+                    continue
+                result = run_scenario(n_sites, radius_km, step_m, model, repeat, trace)
+                results.append(result)
+                log(f"{name}: {result['n_cells']} cells, " + ", ".join(
+                    f"{stage} {values['wall_s'] * 1000:.1f} ms"
+                    for stage, values in result["stages"].items() if "wall_s" in values
+                ))
+    return {
+        "version": FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "machine": machine_info(),
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, object],
+            baseline: Dict[str, object],
+            time_tolerance: float = 0.25,
+            memory_tolerance: float = 0.25) -> List[Dict[str, object]]:
+    """Stages slower or larger than the baseline by more than the tolerances."""
+    base = {r["scenario"]: r for r in baseline["results"] if "stages" in r}
+    regressions = []
+    for result in current["results"]:
+        old = base.get(result["scenario"])
+        if old is None or "stages" not in result:
+            continue
+        for stage, values in result["stages"].items():
+            before = old["stages"].get(stage)
+            if before is None or "wall_s" not in before or "wall_s" not in values:
+                continue
+            wall, old_wall = values["wall_s"], before["wall_s"]
+            if wall > old_wall * (1.0 + time_tolerance) and wall - old_wall > MIN_DELTA_S:
+                regressions.append({
+                    "scenario": result["scenario"], "stage": stage, "metric": "wall_s",
+                    "baseline": old_wall, "current": wall,
+                })
+            peak, old_peak = values.get("peak_mb"), before.get("peak_mb")
+            if peak is not None and old_peak and peak > old_peak * (1.0 + memory_tolerance):
+                regressions.append({
+                    "scenario": result["scenario"], "stage": stage, "metric": "peak_mb",
+                    "baseline": old_peak, "current": peak,
+                })
+    return regressions
+
+
+def _floats(text: str) -> List[float]:
+    return [float(v) for v in text.split(",") if v]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sites", type=_floats, default=list(SITE_COUNTS))
+    parser.add_argument("--radius", type=_floats, default=list(RADII_KM), help="km")
+    parser.add_argument("--step", type=_floats, default=list(STEPS_M), help="m")
+    parser.add_argument("--model", default="hata")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-cells", type=int, default=DEFAULT_MAX_CELLS,
+                        help="skip larger scenarios (0 = no limit)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--compare", action="store_true", help="flag regressions against the baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    report = run_suite(
+        site_counts=[int(n) for n in args.sites],
+        radii_km=args.radius,
+        steps_m=args.step,
+        model=args.model,
+        repeat=args.repeat,
+        max_cells=args.max_cells,
+        trace=not args.no_memory,
+        log=lambda line: print(line, file=sys.stderr),
+    )
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+
+    if not args.compare:
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}", file=sys.stderr)
+        return 2
+    regressions = compare(
+        report, json.loads(args.baseline.read_text()),
+        args.time_tolerance, args.memory_tolerance,
+    )
+    for r in regressions:
+        print(
+            f"REGRESSION {r['scenario']} {r['stage']} {r['metric']}: "
+            f"{r['baseline']} -> {r['current']}",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
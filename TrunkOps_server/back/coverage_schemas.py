@@ -1,7 +1,30 @@
 from __future__ import annotations
 
-from typing import List, Literal
-from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Annotated, Dict, List, Literal, Optional
+from pydantic import AfterValidator, BaseModel, Field, model_validator
+
+from .services.antenna_patterns import patterns
+from .services.propagation_models import MODELS, get_model, model_names
+
+
+def _known_model(name: str) -> str:
+    get_model(name)
+    return name
+
+
+# Name of a model registered in `services.propagation_models`.
+PropagationModelName = Annotated[
+    str,
+    AfterValidator(_known_model),
+    Field(json_schema_extra={"enum": model_names()}),
+]
+
+
+def _known_pattern(name: Optional[str]) -> Optional[str]:
+    if name is not None:
+        patterns.get(name)
+    return name
 
 
 class Site(BaseModel):
@@ -13,14 +36,44 @@ class Site(BaseModel):
     antenna_gain_dbi: float = Field(0.0, description="Base station antenna gain, dBi")
     antenna_height_m: float = Field(..., description="Base station antenna height above ground, m")
     frequency_mhz: float = Field(..., description="Carrier frequency, MHz (e.g., 410)")
+    pattern: Annotated[Optional[str], AfterValidator(_known_pattern)] = Field(
+        None,
+        description="Antenna pattern from ANTENNA_PATTERN_DIR (see /coverage/patterns); "
+        "omni when unset. antenna_gain_dbi is then the boresight gain.",
+    )
+    azimuth_deg: float = Field(0.0, description="Boresight azimuth of a directional antenna, degrees clockwise from north")
+    downtilt_deg: float = Field(0.0, description="Mechanical downtilt of a directional antenna, degrees below the horizon")
 
 
 class GridConfig(BaseModel):
     """Grid configuration for coverage calculation."""
-    center_lat: float = Field(..., description="Latitude of grid center")
-    center_lon: float = Field(..., description="Longitude of grid center")
-    radius_km: float = Field(..., description="Radius of calculation area, km")
-    step_m: float = Field(..., description="Grid step over the surface, meters")
+    # Strictly inside the poles: the longitude spacing divides by cos(lat).
+    center_lat: float = Field(..., gt=-90, lt=90, description="Latitude of grid center")
+    center_lon: float = Field(..., ge=-180, le=180, description="Longitude of grid center")
+    radius_km: float = Field(..., gt=0, description="Radius of calculation area, km")
+    step_m: float = Field(..., gt=0, description="Grid step over the surface, meters")
+
+
+class AdaptiveConfig(BaseModel):
+    """Adaptive refinement: coarse blocks first, fine cells only where needed."""
+    coarse_factor: int = Field(
+        8, ge=1, le=256,
+        description="Edge of the initial blocks in grid cells (rounded down to a power of 2)",
+    )
+    thresholds_dbm: List[float] = Field(
+        [-80.0, -95.0, -110.0],
+        description="Class boundaries (stable/degraded/critical) to resolve at full detail",
+    )
+    margin_db: float = Field(1.0, description="Refine blocks whose neighbourhood level range comes this close to a threshold, dB")
+    gradient_db: float = Field(6.0, description="Refine blocks differing more than this from a neighbour, dB")
+
+
+class CoverageMetricsConfig(BaseModel):
+    """Per-cell overlap and interference metrics to return with the levels."""
+    server_threshold_dbm: float = Field(
+        -110.0,
+        description="Level at which a site counts as a usable server, dBm",
+    )
 
 
 class CoverageRequest(BaseModel):
@@ -28,17 +81,66 @@ class CoverageRequest(BaseModel):
     sites: List[Site]
     rx_height_m: float = Field(1.5, description="Subscriber antenna height, m")
     grid: GridConfig
-    model: Literal["hata", "longley_rice"] = Field(
+    model: PropagationModelName = Field(
         "hata",
-        description="Radio propagation model; currently only 'hata' is implemented.",
+        description="Radio propagation model: "
+        + "; ".join(f"'{name}': {MODELS[name].description}" for name in model_names()),
+    )
+    adaptive: Optional[AdaptiveConfig] = Field(
+        None,
+        description="Evaluate a coarse grid first and refine only near thresholds and sharp changes.",
+    )
+    metrics: Optional[CoverageMetricsConfig] = Field(
+        None,
+        description="Also return the second-best server, server count and co-channel C/I per cell.",
+    )
+
+
+class CoverageClassThresholds(BaseModel):
+    """Lower bounds of the stable, degraded and critical level classes, dBm."""
+    stable_dbm: float = -80.0
+    degraded_dbm: float = -95.0
+    critical_dbm: float = -110.0
+
+    @model_validator(mode="after")
+    def _ordered(self) -> "CoverageClassThresholds":
+        # Classes are found by searchsorted over the bounds.
+        if not self.critical_dbm <= self.degraded_dbm <= self.stable_dbm:
+            raise ValueError("thresholds must satisfy critical_dbm <= degraded_dbm <= stable_dbm")
+        return self
+
+
+class CoverageClassRequest(CoverageRequest):
+    """Coverage request whose result is reduced to level classes."""
+    thresholds: Optional[CoverageClassThresholds] = Field(
+        None,
+        description="Class bounds; defaults to the device model's sensitivity plus margins, then -80/-95/-110.",
+    )
+    device_model_id: Optional[int] = Field(
+        None,
+        description="DeviceModel whose sensitivity_dbm is the critical bound when thresholds are not given",
     )
 
 
+class CoverageSummaryRequest(CoverageClassRequest):
+    """Coverage request answered with area statistics instead of cells."""
+    histogram_step_db: float = Field(1.0, ge=0.1, le=50.0, description="Histogram bin width, dB")
+    percentiles: List[float] = Field([5.0, 50.0, 95.0], description="Area percentiles of the level to report, %")
+
+
 class CoverageCell(BaseModel):
-    """Single grid cell with calculated received level."""
+    """Single grid cell with calculated received level.
+
+    The remaining fields are only set when the request asks for `metrics`.
+    """
     lat: float
     lon: float
     rx_level_dbm: float
+    best_site_id: Optional[str] = None
+    second_site_id: Optional[str] = None
+    second_rx_level_dbm: Optional[float] = None
+    server_count: Optional[int] = Field(None, description="Sites at or above server_threshold_dbm")
+    ci_db: Optional[float] = Field(None, description="Best level over summed co-channel sites; null without interferers")
 
 
 class CoverageResponse(BaseModel):
@@ -46,3 +148,239 @@ class CoverageResponse(BaseModel):
     crs: str = "EPSG:4326"
     grid_step_m: float
     cells: List[CoverageCell]
+
+
+class PredictionPoint(BaseModel):
+    """Location to predict the signal at, e.g. a checkpoint."""
+    lat: float
+    lon: float
+    id: Optional[str] = None
+
+
+class PredictionRoute(BaseModel):
+    """Polyline (e.g. a patrol route) sampled every `sample_step_m`."""
+    id: Optional[str] = None
+    points: List[PredictionPoint] = Field(..., min_length=1, description="Route vertices in order")
+    sample_step_m: float = Field(50.0, gt=0, description="Distance between samples along the route, m")
+
+
+class SignalPredictionRequest(BaseModel):
+    """Best-server prediction at arbitrary points instead of a grid."""
+    sites: List[Site]
+    rx_height_m: float = Field(1.5, description="Subscriber antenna height, m")
+    model: PropagationModelName = "hata"
+    points: List[PredictionPoint] = []
+    routes: List[PredictionRoute] = []
+
+
+class PredictedPoint(BaseModel):
+    """Predicted level at a requested point or route sample."""
+    lat: float
+    lon: float
+    rx_level_dbm: float
+    best_site_id: Optional[str] = None
+    point_id: Optional[str] = Field(None, description="Id of the requested point")
+    route_id: Optional[str] = Field(None, description="Id of the route the sample belongs to")
+    route_index: Optional[int] = Field(None, description="Index of the route in the request")
+    distance_m: Optional[float] = Field(None, description="Distance of the sample along its route, m")
+
+
+class SignalPredictionResponse(BaseModel):
+    """Requested points first, then the samples of each route in order."""
+    points: List[PredictedPoint]
+
+
+class CoveragePercentile(BaseModel):
+    percent: float
+    rx_level_dbm: float
+
+
+class CoverageHistogram(BaseModel):
+    """Area (km^2) per level bin; bin i covers `start_dbm + i * step_db` upwards."""
+    start_dbm: float
+    step_db: float
+    area_km2: List[float]
+
+
+class CoverageSummary(BaseModel):
+    """Area-weighted coverage statistics of a grid.
+
+    The class percentages use the same definitions as `CoverageZone`;
+    `uncovered_percent` is the area below `critical_dbm`.
+    """
+    n_cells: int
+    area_km2: float
+    thresholds: CoverageClassThresholds
+    stable_percent: float
+    degraded_percent: float
+    critical_percent: float
+    uncovered_percent: float
+    min_rx_level_dbm: Optional[float] = None
+    max_rx_level_dbm: Optional[float] = None
+    mean_rx_level_dbm: Optional[float] = None
+    percentiles: List[CoveragePercentile] = []
+    histogram: CoverageHistogram
+
+
+class CoverageContourRequest(CoverageClassRequest):
+    """Coverage request answered with class polygons."""
+    tolerance_m: Optional[float] = Field(
+        None, ge=0,
+        description="Douglas-Peucker simplification tolerance, m; defaults to the grid step",
+    )
+
+
+class CoverageContours(BaseModel):
+    """Class polygons ready to be stored as a `CoverageZone`.
+
+    `geometry` is a GeoJSON FeatureCollection (text) with one
+    MultiPolygon feature per class (`properties.class`).
+    """
+    geometry: str
+    stable_percent: float
+    degraded_percent: float
+    critical_percent: float
+    algorithm: str
+    thresholds: CoverageClassThresholds
+    n_vertices: int
+
+
+class CoverageScenario(BaseModel):
+    """Variant of the request's deployment; unset fields keep the base values."""
+    id: Optional[str] = None
+    rx_height_m: Optional[float] = Field(None, description="Subscriber antenna height, m")
+    frequency_mhz: Dict[str, float] = Field(
+        {}, description="Carrier frequency by site id, MHz",
+    )
+    disabled_sites: List[str] = Field([], description="Ids of sites switched off")
+
+
+class CoverageScenarioRequest(BaseModel):
+    """Several what-if variants of one deployment over a shared grid."""
+    sites: List[Site]
+    rx_height_m: float = Field(1.5, description="Subscriber antenna height, m")
+    grid: GridConfig
+    model: PropagationModelName = "hata"
+    scenarios: List[CoverageScenario] = Field(..., min_length=1)
+    output: Literal["summary", "raster"] = Field(
+        "summary", description="Summaries only, or also the levels raster of each scenario",
+    )
+    dtype: Literal["float32", "int16", "int8"] = Field(
+        "float32", description="Level encoding of the rasters",
+    )
+    thresholds: Optional[CoverageClassThresholds] = Field(
+        None,
+        description="Class bounds; defaults to the device model's sensitivity plus margins, then -80/-95/-110.",
+    )
+    device_model_id: Optional[int] = Field(
+        None,
+        description="DeviceModel whose sensitivity_dbm is the critical bound when thresholds are not given",
+    )
+    histogram_step_db: float = Field(1.0, ge=0.1, le=50.0, description="Histogram bin width, dB")
+    percentiles: List[float] = Field([5.0, 50.0, 95.0], description="Area percentiles of the level to report, %")
+
+
+class NodeCoverageConfig(BaseModel):
+    """Calculation settings for coverage computed from stored nodes."""
+    radius_km: float = Field(30.0, gt=0, description="Radius of calculation area around the node, km")
+    step_m: float = Field(200.0, gt=0, description="Grid step over the surface, meters")
+    rx_height_m: float = Field(1.5, description="Subscriber antenna height, m")
+    model: PropagationModelName = "hata"
+    tolerance_m: Optional[float] = Field(
+        None, ge=0,
+        description="Polygon simplification tolerance, m; defaults to the grid step",
+    )
+
+
+class CoverageRaster(BaseModel):
+    """Compact raster encoding of a coverage result.
+
+    Cell (row, col) lies at `lat0 + row * dlat_deg`,
+    `lon0 + col * dlon_deg`. `mask` is the base64 of the row-major
+    in-circle mask packed 8 cells per byte (MSB first); `data` is the
+    base64 of the little-endian levels of the masked cells only, in
+    the same row-major order, with `rx_level_dbm = offset + scale * value`.
+    """
+    crs: str = "EPSG:4326"
+    grid_step_m: float
+    lat0: float
+    lon0: float
+    dlat_deg: float
+    dlon_deg: float
+    n_rows: int
+    n_cols: int
+    n_cells: int
+    dtype: Literal["float32", "int16", "int8"]
+    scale: float = 1.0
+    offset: float = 0.0
+    mask: str
+    data: str
+
+
+class CoverageScenarioResult(BaseModel):
+    """Outcome of one scenario, in request order."""
+    index: int
+    id: Optional[str] = None
+    summary: CoverageSummary
+    raster: Optional[CoverageRaster] = Field(None, description="Only with output 'raster'")
+
+
+class CoverageScenarioResponse(BaseModel):
+    scenarios: List[CoverageScenarioResult]
+
+
+class CoverageJobStatus(BaseModel):
+    """State of an asynchronous coverage job."""
+    id: str
+    status: Literal["queued", "running", "done", "failed", "cancelled"]
+    progress_percent: float = Field(0.0, description="Share of grid cells computed, %")
+    n_cells: Optional[int] = Field(None, description="Grid size, known once the job starts")
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+class AntennaPatternInfo(BaseModel):
+    """Pattern available for `Site.pattern`."""
+    name: str
+    gain_dbi: Optional[float] = Field(None, description="GAIN from the file, dBi")
+    frequency_mhz: Optional[float] = None
+    max_attenuation_db: float
+
+
+class AntennaPatternList(BaseModel):
+    patterns: List[AntennaPatternInfo]
+    errors: Dict[str, str] = Field({}, description="Pattern files that could not be read, by file name")
+
+
+class CoverageTileSet(BaseModel):
+    """Site set referenced by map tile requests."""
+    sites: List[Site]
+    rx_height_m: float = Field(1.5, description="Subscriber antenna height, m")
+    model: PropagationModelName = "hata"
+
+
+class CoverageTileSetRef(BaseModel):
+    """Registered tile set; `tile_url` is an XYZ template relative to the API root."""
+    id: str
+    tile_url: str
+
+
+class CoverageEstimate(BaseModel):
+    """Pre-flight cost of a coverage request and whether it would be admitted."""
+    n_cells: int = Field(..., description="Expected number of grid cells")
+    n_sites: int
+    work_units: int = Field(..., description="Cell x site path-loss evaluations (terrain models count profile samples)")
+    memory_bytes: int = Field(..., description="Expected peak server memory, including the encoded response")
+    response_bytes: int = Field(..., description="Expected size of the response body")
+    admitted: bool = Field(..., description="Within the per-request limits")
+    reason: Optional[str] = Field(None, description="Which limit is exceeded")
+    suggested_step_m: Optional[float] = Field(
+        None, description="Smallest grid step that fits the limits, when the request does not"
+    )
+    max_cells: int
+    max_work_units: int
+    max_memory_bytes: int
+    in_flight_work_units: int = Field(..., description="Work currently admitted server-wide")
+    global_work_units: int = Field(..., description="Server-wide budget of concurrent work")
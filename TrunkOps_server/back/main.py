@@ -13,6 +13,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from . import database
+from .services import coverage_jobs, coverage_pool, node_coverage
 from .routers import (
     auth,
     units,
@@ -43,6 +44,17 @@ app.add_middleware(
 def on_startup() -> None:
     """Initialize the database on application startup."""
     database.init_db()
+    # Rasters of zones removed while the server was down
+    with database.get_db() as db:
+        node_coverage.collect_raster_garbage(db)
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    """Stop coverage jobs and the worker pool on application shutdown."""
+    coverage_jobs.job_manager.shutdown()
+    node_coverage.refresher.shutdown()
+    coverage_pool.shutdown_pool()
 
 
 # Include routers
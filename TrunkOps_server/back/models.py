@@ -116,6 +116,7 @@ class NetworkNode(Base):
     unit = relationship("Unit", back_populates="nodes")
     device_model = relationship("DeviceModel", back_populates="nodes")
     coverage_zones = relationship("CoverageZone", back_populates="node", cascade="all, delete-orphan")
+    coverage_state = relationship("NodeCoverageState", back_populates="node", uselist=False, cascade="all, delete-orphan")
     status_history = relationship("NodeStatusHistory", back_populates="node", cascade="all, delete-orphan")
 
 
@@ -133,6 +134,26 @@ class CoverageZone(Base):
     node = relationship("NetworkNode", back_populates="coverage_zones")
 
 
+class NodeCoverageState(Base):
+    """Bookkeeping of the coverage computed from a node's stored radio data.
+
+    `params_hash` fingerprints the radio parameters (node and device
+    model) and `config` the calculation settings the zone was computed
+    with; the zone is recomputed when either changes.
+    """
+    __tablename__ = "node_coverage_state"
+    node_id = Column(Integer, ForeignKey("network_node.id", ondelete="CASCADE"), primary_key=True)
+    zone_id = Column(Integer, ForeignKey("coverage_zone.id", ondelete="SET NULL"))
+    params_hash = Column(String(64))
+    config = Column(Text, nullable=False)  # JSON of NodeCoverageConfig
+    status = Column(String(20), nullable=False, default="stale")  # fresh / stale / failed
+    error = Column(Text)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    node = relationship("NetworkNode", back_populates="coverage_state")
+    zone = relationship("CoverageZone")
+
+
 class NodeStatusHistory(Base):
     __tablename__ = "node_status_history"
     id = Column(Integer, primary_key=True)
@@ -7,13 +7,75 @@ for selected base stations.
 
 from __future__ import annotations
 
-from typing import List
+import json
+import math
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Literal, Optional, Tuple
 
-from fastapi import APIRouter
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
-from ..coverage_schemas import CoverageRequest, CoverageResponse, CoverageCell
-from ..services.grid_service import generate_grid
-from ..services.propagation_service import calc_rx_level
+from .. import database, models
+from ..coverage_schemas import (
+    AntennaPatternInfo,
+    AntennaPatternList,
+    CoverageRequest,
+    CoverageResponse,
+    CoverageCell,
+    CoverageClassRequest,
+    CoverageContourRequest,
+    CoverageContours,
+    CoverageEstimate,
+    CoverageRaster,
+    CoverageJobStatus,
+    CoverageScenarioRequest,
+    CoverageScenarioResponse,
+    CoverageScenarioResult,
+    CoverageSummary,
+    CoverageSummaryRequest,
+    CoverageTileSet,
+    CoverageTileSetRef,
+    PredictedPoint,
+    SignalPredictionRequest,
+    SignalPredictionResponse,
+)
+from ..services import raster_codec
+from ..services.adaptive_grid import adaptive_best_server
+from ..services.antenna_patterns import patterns
+from ..services.coverage_budget import (
+    ADMISSION_WAIT_S,
+    AdmissionTicket,
+    AdmissionTimeout,
+    OverBudget,
+    admission,
+    check,
+    estimate,
+    exceeded,
+    work_units,
+)
+from ..services.coverage_cache import CoverageResult, coverage_cache, request_key
+from ..services.contour_service import class_zone
+from ..services.coverage_summary import (
+    CoverageSummaryAccumulator,
+    resolve_thresholds,
+    summary_cache,
+)
+from ..services.coverage_engine import BestServer, Scenario, best_server_scenarios
+from ..services.coverage_jobs import TooManyJobs, job_manager
+from ..services.coverage_pool import best_server_tiled
+from ..services.grid_service import (
+    STREAM_ROWS_PER_BLOCK,
+    Grid,
+    build_grid,
+    iter_grid_blocks,
+    polyline_sample_count,
+    sample_polyline,
+)
+from ..services.raster_store import raster_store
+from ..services.site_raster_cache import site_raster_cache
+from ..services.tile_service import MAX_ZOOM, TILE_SIZE, tile_service, tile_work_units
 
 
 router = APIRouter(
@@ -23,51 +85,755 @@ router = APIRouter(
 
 print(">>> coverage_calc router imported")
 
+# Cells per written chunk of a stream.
+STREAM_CHUNK_CELLS = 4096
+
+
+def _check_budget(req: CoverageRequest, output: str, n_scenarios: int = 1) -> CoverageEstimate:
+    """Pre-flight cost; 413 with the estimate and a suggested step if too large."""
+    try:
+        return check(req, output, n_scenarios)
+    except OverBudget as exc:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail={
+                "message": f"Coverage request too large: {exc.estimate.reason}",
+                "estimate": exc.estimate.model_dump(),
+            },
+        )
+
+
+def _capacity_exhausted() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Coverage capacity exhausted, retry later",
+        headers={"Retry-After": str(int(math.ceil(ADMISSION_WAIT_S)))},
+    )
+
+
+def _acquire(work_units: int) -> AdmissionTicket:
+    """Take the request's share of the server-wide budget, or 503."""
+    try:
+        return admission.acquire(work_units)
+    except AdmissionTimeout:
+        raise _capacity_exhausted()
+
+
+@contextmanager
+def _admitted(work_units: int) -> Iterator[None]:
+    ticket = _acquire(work_units)
+    try:
+        yield
+    finally:
+        ticket.release()
+
+
+def _server_threshold(req: CoverageRequest) -> Optional[float]:
+    return req.metrics.server_threshold_dbm if req.metrics is not None else None
+
+
+def _compute_coverage(
+    req: CoverageRequest,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> CoverageResult:
+    """Build the grid and run the best-server engine for a request.
+
+    `on_progress(done_cells, total_cells)` is reported while computing;
+    an exception raised from it aborts the run.
+    """
+    # Генеруємо сітку точок навколо центру
+    grid = build_grid(
+        center_lat=req.grid.center_lat,
+        center_lon=req.grid.center_lon,
+        radius_km=req.grid.radius_km,
+        step_m=req.grid.step_m,
+    )
+
+    # Адаптивний режим: груба сітка, деталізація лише біля порогів
+    if req.adaptive is not None:
+        adaptive = adaptive_best_server(
+            grid,
+            req.sites,
+            rx_height_m=req.rx_height_m,
+            model=req.model,
+            config=req.adaptive,
+            on_progress=on_progress,
+            server_threshold_dbm=_server_threshold(req),
+        )
+        return grid, adaptive.best
+
+    # Небагато БС: збираємо карту з кешованих растрів окремих БС, тож
+    # зміна однієї станції перераховує лише її растр
+    if site_raster_cache.eligible(len(req.sites), len(grid)):
+        n_cells = len(grid)
+        result = site_raster_cache.best_server(
+            grid,
+            req.grid,
+            req.sites,
+            rx_height_m=req.rx_height_m,
+            model=req.model,
+            on_site=(
+                None if on_progress is None
+                else lambda done, total: on_progress(n_cells * done // total, n_cells)
+            ),
+            server_threshold_dbm=_server_threshold(req),
+        )
+        return grid, result
+
+    # Найкращий рівень сигналу від усіх БС; великі сітки рахуються
+    # тайлами у пулі процесів
+    result = best_server_tiled(
+        grid.lats,
+        grid.lons,
+        req.sites,
+        rx_height_m=req.rx_height_m,
+        model=req.model,
+        on_tile=on_progress,
+        server_threshold_dbm=_server_threshold(req),
+    )
+
+    return grid, result
+
+
+def _select_format(request: Request, fmt: Optional[str]) -> str:
+    """Pick the response encoding from `?format=` or the Accept header."""
+    if fmt is not None:
+        return fmt
+    accept = request.headers.get("accept", "")
+    if raster_codec.RASTER_JSON_MEDIA_TYPE in accept:
+        return "raster"
+    if (
+        raster_codec.RASTER_BINARY_MEDIA_TYPE in accept
+        or "application/octet-stream" in accept
+    ):
+        return "binary"
+    return "cells"
+
+
+def _metric_columns(req: CoverageRequest, result: BestServer) -> Dict[str, list]:
+    """Per-cell `CoverageCell` metric fields as lists (empty without metrics)."""
+    metrics = result.metrics
+    if metrics is None:
+        return {}
+    # Site index -1 ("no site") picks the trailing None.
+    ids: List[Optional[str]] = [site.id for site in req.sites] + [None]
+    return {
+        "best_site_id": [ids[i] for i in result.site_index.tolist()],
+        "second_site_id": [ids[i] for i in metrics.second_site_index.tolist()],
+        "second_rx_level_dbm": metrics.second_rx_level_dbm.tolist(),
+        "server_count": metrics.server_count.tolist(),
+        "ci_db": [None if math.isnan(v) else v for v in metrics.ci_db.tolist()],
+    }
+
+
+def _encode_result(
+    request: Request,
+    req: CoverageRequest,
+    grid: Grid,
+    result: BestServer,
+    format: Optional[str],
+    dtype: str,
+):
+    """Encode a computed grid in the format the client asked for."""
+    fmt = _select_format(request, format)
+    if fmt == "raster":
+        raster = raster_codec.encode_json(
+            grid, result.rx_level_dbm, req.grid.step_m, dtype
+        )
+        return Response(
+            content=raster.model_dump_json(),
+            media_type=raster_codec.RASTER_JSON_MEDIA_TYPE,
+        )
+    if fmt == "binary":
+        return Response(
+            content=raster_codec.encode_binary(
+                grid, result.rx_level_dbm, req.grid.step_m, dtype
+            ),
+            media_type=raster_codec.RASTER_BINARY_MEDIA_TYPE,
+        )
+
+    columns = _metric_columns(req, result)
+    cells: List[CoverageCell] = [
+        CoverageCell(
+            lat=lat,
+            lon=lon,
+            rx_level_dbm=rx,
+            **{name: values[i] for name, values in columns.items()},
+        )
+        for i, (lat, lon, rx) in enumerate(zip(
+            grid.lats.tolist(), grid.lons.tolist(), result.rx_level_dbm.tolist()
+        ))
+    ]
+
+    return CoverageResponse(
+        grid_step_m=req.grid.step_m,
+        cells=cells,
+    )
+
+
+_RASTER_RESPONSES = {
+    200: {
+        "content": {
+            raster_codec.RASTER_JSON_MEDIA_TYPE: {
+                "schema": CoverageRaster.model_json_schema(),
+            },
+            raster_codec.RASTER_BINARY_MEDIA_TYPE: {},
+        },
+    },
+}
 
-@router.post("/calc", response_model=CoverageResponse)
+
+@router.post(
+    "/calc",
+    response_model=CoverageResponse,
+    response_model_exclude_none=True,
+    responses=_RASTER_RESPONSES,
+)
 def calculate_coverage(
     req: CoverageRequest,
-) -> CoverageResponse:
+    request: Request,
+    format: Optional[Literal["cells", "raster", "binary"]] = Query(
+        None,
+        description="Response encoding; defaults to the Accept header, then 'cells'.",
+    ),
+    dtype: Literal["float32", "int16", "int8"] = Query(
+        "float32",
+        description="Level encoding for the raster formats.",
+    ),
+):
     """Calculate coverage for the given base stations and grid.
 
     The endpoint is intentionally stateless and does not persist
     any data. It is designed to be called from the frontend
     (e.g. Flutter app) to quickly estimate coverage on demand.
+
+    Besides the per-cell JSON list the result can be returned as a
+    compact raster (`format=raster` / `format=binary`, or the
+    matching Accept media types), see `services.raster_codec`.
+    Per-cell `metrics` are only included in the 'cells' format.
+
+    Requests over the per-request limits are rejected with 413 (see
+    `/coverage/estimate`); while the server-wide budget is exhausted
+    they wait up to `COVERAGE_ADMISSION_WAIT_S`, then get 503.
     """
-    # Генеруємо сітку точок навколо центру
-    points = generate_grid(
+    # Оцінюємо вартість до початку розрахунку
+    cost = _check_budget(req, _select_format(request, format))
+
+    def compute() -> CoverageResult:
+        with _admitted(cost.work_units):
+            return _compute_coverage(req)
+
+    # Повторні однакові запити віддаються з кешу
+    grid, result = coverage_cache.get_or_compute(req, compute)
+
+    return _encode_result(request, req, grid, result, format, dtype)
+
+
+@router.post("/estimate", response_model=CoverageEstimate)
+def estimate_coverage(
+    req: CoverageRequest,
+    output: Literal["cells", "raster", "binary", "stream", "summary", "contours"] = Query(
+        "cells",
+        description="How the result would be requested: a /coverage/calc format, "
+        "'stream' (/coverage/calc/stream), 'summary' or 'contours'.",
+    ),
+) -> CoverageEstimate:
+    """Expected cells, work and memory of a request, without computing it.
+
+    `admitted` tells whether the request fits the per-request limits;
+    if not, `suggested_step_m` is the finest step that would.
+    """
+    return estimate(req, output)
+
+
+@router.get("/patterns", response_model=AntennaPatternList)
+def list_antenna_patterns() -> AntennaPatternList:
+    """Antenna patterns usable as `Site.pattern` (from `ANTENNA_PATTERN_DIR`)."""
+    return AntennaPatternList(
+        patterns=[
+            AntennaPatternInfo(
+                name=p.name,
+                gain_dbi=p.gain_dbi,
+                frequency_mhz=p.frequency_mhz,
+                max_attenuation_db=p.max_attenuation_db,
+            )
+            for p in patterns.all()
+        ],
+        errors=patterns.errors,
+    )
+
+
+@router.get("/cache/stats")
+def coverage_cache_stats() -> dict:
+    """Hit, miss and eviction counters of the coverage caches."""
+    return {
+        **coverage_cache.stats(),
+        "site_rasters": site_raster_cache.stats(),
+        "tiles": tile_service.stats(),
+        "summaries": summary_cache.stats(),
+        "zone_rasters": raster_store.stats(),
+    }
+
+
+def _compute_job(req: CoverageRequest, on_progress) -> CoverageResult:
+    cost = estimate(req, "raster")
+
+    def compute() -> CoverageResult:
+        # Jobs queue for the budget without a time limit, but stay cancellable.
+        with admission.admit(
+            cost.work_units, wait_s=None, poll=lambda: on_progress(0, cost.n_cells)
+        ):
+            return _compute_coverage(req, on_progress)
+
+    # Jobs can be cancelled mid-run, so they never lead a computation that
+    # /coverage/calc requests are waiting on.
+    return coverage_cache.get_or_compute(req, compute, coalesce=False)
+
+
+def _get_job_or_404(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.post(
+    "/jobs",
+    response_model=CoverageJobStatus,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def create_coverage_job(req: CoverageRequest) -> CoverageJobStatus:
+    """Queue a coverage calculation and return its job id right away.
+
+    Jobs over the per-request limits are rejected with 413; admitted
+    jobs stay queued while the server-wide budget is exhausted.
+    """
+    _check_budget(req, "raster")
+    try:
+        job = job_manager.submit(req, _compute_job)
+    except TooManyJobs:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many coverage jobs in progress",
+        )
+    return job.to_status()
+
+
+@router.get("/jobs/{job_id}", response_model=CoverageJobStatus)
+def read_coverage_job(job_id: str) -> CoverageJobStatus:
+    """Status and percent complete of a coverage job."""
+    return _get_job_or_404(job_id).to_status()
+
+
+@router.get(
+    "/jobs/{job_id}/result",
+    response_model=CoverageResponse,
+    response_model_exclude_none=True,
+    responses=_RASTER_RESPONSES,
+)
+def read_coverage_job_result(
+    job_id: str,
+    request: Request,
+    format: Optional[Literal["cells", "raster", "binary"]] = Query(None),
+    dtype: Literal["float32", "int16", "int8"] = Query("float32"),
+):
+    """Result of a finished job, in any of the `/coverage/calc` formats."""
+    job = _get_job_or_404(job_id)
+    if job.status != "done" or job.result is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {job.status}",
+        )
+    grid, result = job.result
+    return _encode_result(request, job.req, grid, result, format, dtype)
+
+
+@router.delete("/jobs/{job_id}", response_model=CoverageJobStatus)
+def cancel_coverage_job(job_id: str) -> CoverageJobStatus:
+    """Cancel a queued or running job; delete a finished one."""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job.to_status()
+
+
+@router.post("/tiles", response_model=CoverageTileSetRef)
+def register_tile_set(tile_set: CoverageTileSet) -> CoverageTileSetRef:
+    """Register a site set for `/coverage/tiles/{z}/{x}/{y}.png`.
+
+    The id is a hash of the set, so registering the same set again
+    yields the same id and cached tiles. With the disk tile cache the
+    set is stored there too and stays valid across workers and restarts.
+    Sets whose tiles exceed the per-request limits are rejected with 413.
+    """
+    reason = exceeded(TILE_SIZE * TILE_SIZE, tile_work_units(tile_set))
+    if reason is not None:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Tile set too large: {reason}",
+        )
+    set_id = tile_service.register(tile_set)
+    return CoverageTileSetRef(
+        id=set_id,
+        tile_url=f"/coverage/tiles/{{z}}/{{x}}/{{y}}.png?set_id={set_id}",
+    )
+
+
+@router.get(
+    "/tiles/{z}/{x}/{y}.png",
+    response_class=Response,
+    responses={200: {"content": {"image/png": {}}}},
+)
+def read_coverage_tile(
+    z: int,
+    x: int,
+    y: int,
+    set_id: str = Query(..., description="Id returned by POST /coverage/tiles"),
+    layer: Literal["level", "server"] = Query(
+        "level",
+        description="'level' colours received level classes, 'server' the best server.",
+    ),
+) -> Response:
+    """Render one web-mercator tile of coverage for a registered site set."""
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid tile")
+    try:
+        png = tile_service.get_tile(set_id, z, x, y, layer)
+    except AdmissionTimeout:
+        raise _capacity_exhausted()
+    if png is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tile set not found")
+    return Response(
+        content=png,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=3600"},
+    )
+
+
+def _iter_blocks(req: CoverageRequest) -> Iterator[Tuple[Grid, BestServer]]:
+    """Compute the grid band by band, yielding each band with its result."""
+    for block in iter_grid_blocks(
         center_lat=req.grid.center_lat,
         center_lon=req.grid.center_lon,
         radius_km=req.grid.radius_km,
         step_m=req.grid.step_m,
+        rows_per_block=STREAM_ROWS_PER_BLOCK,
+    ):
+        if req.adaptive is not None:
+            result = adaptive_best_server(
+                block,
+                req.sites,
+                rx_height_m=req.rx_height_m,
+                model=req.model,
+                config=req.adaptive,
+                server_threshold_dbm=_server_threshold(req),
+            ).best
+        else:
+            result = best_server_tiled(
+                block.lats,
+                block.lons,
+                req.sites,
+                rx_height_m=req.rx_height_m,
+                model=req.model,
+                server_threshold_dbm=_server_threshold(req),
+            )
+        yield block, result
+
+
+def _iter_coverage_ndjson(req: CoverageRequest) -> Iterator[bytes]:
+    """Encode each computed band as NDJSON.
+
+    The first line is the response header (`crs`, `grid_step_m`);
+    every following line is one `CoverageCell`.
+    """
+    header = CoverageResponse(grid_step_m=req.grid.step_m, cells=[])
+    yield (json.dumps(header.model_dump(exclude={"cells"})) + "\n").encode()
+
+    for block, result in _iter_blocks(req):
+        lats = block.lats.tolist()
+        lons = block.lons.tolist()
+        levels = result.rx_level_dbm.tolist()
+        columns = _metric_columns(req, result)
+        for start in range(0, len(lats), STREAM_CHUNK_CELLS):
+            stop = start + STREAM_CHUNK_CELLS
+            if columns:
+                yield "".join(
+                    json.dumps({
+                        "lat": lats[i],
+                        "lon": lons[i],
+                        "rx_level_dbm": levels[i],
+                        **{name: values[i] for name, values in columns.items()},
+                    }) + "\n"
+                    for i in range(start, min(stop, len(lats)))
+                ).encode()
+                continue
+            yield "".join(
+                f'{{"lat":{lat!r},"lon":{lon!r},"rx_level_dbm":{rx!r}}}\n'
+                for lat, lon, rx in zip(
+                    lats[start:stop], lons[start:stop], levels[start:stop]
+                )
+            ).encode()
+
+
+@router.post("/calc/stream")
+def calculate_coverage_stream(
+    req: CoverageRequest,
+) -> StreamingResponse:
+    """Stream coverage as NDJSON while it is being computed.
+
+    Same calculation as `/coverage/calc`, but cells are sent tile by
+    tile, so memory stays bounded regardless of grid size and the
+    client can start rendering before the run finishes.
+    """
+    ticket = _acquire(_check_budget(req, "stream").work_units)
+
+    def stream() -> Iterator[bytes]:
+        try:
+            yield from _iter_coverage_ndjson(req)
+        finally:
+            ticket.release()
+
+    # The background task also releases the budget when the client
+    # disconnects before the stream starts.
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(ticket.release),
     )
 
-    cells: List[CoverageCell] = []
 
-    for lat, lon in points:
-        best_rx: float | None = None
+def _class_thresholds(req: CoverageClassRequest | CoverageScenarioRequest):
+    """Resolve class bounds; the database is only used for `device_model_id`."""
+    sensitivity = None
+    if req.thresholds is None and req.device_model_id is not None:
+        with database.get_db() as db:
+            device = db.query(models.DeviceModel).filter(
+                models.DeviceModel.id == req.device_model_id
+            ).first()
+            if device is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device model not found")
+            if device.sensitivity_dbm is not None:
+                sensitivity = float(device.sensitivity_dbm)
+    return resolve_thresholds(req.thresholds, sensitivity)
 
-        # Шукаємо найкращий рівень сигналу від усіх БС
-        for site in req.sites:
-            rx = calc_rx_level(
-                site=site,
-                target_lat=lat,
-                target_lon=lon,
-                rx_height_m=req.rx_height_m,
-                model=req.model,
-            )
-            if best_rx is None or rx > best_rx:
-                best_rx = rx
-
-        cells.append(
-            CoverageCell(
-                lat=lat,
-                lon=lon,
-                rx_level_dbm=best_rx if best_rx is not None else -200.0,
-            )
+
+def _base_request(req: CoverageClassRequest) -> CoverageRequest:
+    """The plain levels request behind a class request (shares its cache entry)."""
+    return CoverageRequest(
+        **req.model_dump(include=set(CoverageRequest.model_fields) - {"metrics"})
+    )
+
+
+@router.post("/summary", response_model=CoverageSummary)
+def calculate_coverage_summary(req: CoverageSummaryRequest) -> CoverageSummary:
+    """Area share of each level class plus level statistics.
+
+    Computes the same coverage as `/coverage/calc` but reduces it band
+    by band, so no per-cell list is built and the response stays a few
+    kilobytes. Class bounds default to the device model's sensitivity
+    (critical) plus margins for degraded and stable.
+    """
+    thresholds = _class_thresholds(req)
+
+    key = request_key(
+        req.model_copy(update={"thresholds": thresholds, "device_model_id": None})
+    )
+    summary = summary_cache.get(key)
+    if summary is not None:
+        return summary
+
+    coverage_req = _base_request(req)
+    acc = CoverageSummaryAccumulator(thresholds)
+    # Якщо повний результат уже в кеші, рахуємо статистику по ньому
+    cached = coverage_cache.peek(coverage_req)
+    if cached is not None:
+        grid, result = cached
+        acc.add(grid, result.rx_level_dbm)
+    else:
+        with _admitted(_check_budget(coverage_req, "summary").work_units):
+            for block, result in _iter_blocks(coverage_req):
+                acc.add(block, result.rx_level_dbm)
+
+    summary = acc.summary(req.histogram_step_db, req.percentiles)
+    summary_cache.put(key, summary, len(summary.model_dump_json()))
+    return summary
+
+
+@router.post("/contours", response_model=CoverageContours)
+def calculate_coverage_contours(req: CoverageContourRequest) -> CoverageContours:
+    """Simplified GeoJSON polygons of the stable/degraded/critical classes.
+
+    The response can be stored as is in `CoverageZone` (add `node_id`)
+    and is orders of magnitude smaller than the cell list.
+    """
+    thresholds = _class_thresholds(req)
+    coverage_req = _base_request(req)
+    cost = _check_budget(coverage_req, "contours")
+
+    def compute() -> CoverageResult:
+        with _admitted(cost.work_units):
+            return _compute_coverage(coverage_req)
+
+    grid, result = coverage_cache.get_or_compute(coverage_req, compute)
+
+    # Ізолінії по растру рівнів, спрощені до заданого допуску
+    tolerance_m = req.tolerance_m if req.tolerance_m is not None else req.grid.step_m
+    return class_zone(grid, result.rx_level_dbm, thresholds, tolerance_m, req.model)
+
+
+@router.post(
+    "/predict",
+    response_model=SignalPredictionResponse,
+    response_model_exclude_none=True,
+)
+def predict_signal(req: SignalPredictionRequest) -> SignalPredictionResponse:
+    """Best-server level and server at arbitrary points and along routes.
+
+    Routes are sampled every `sample_step_m` along the polyline (plus
+    the final vertex). All points go through the same batched engine as
+    `/coverage/calc`, without building a grid.
+    """
+    point_ids: List[Optional[str]] = [p.id for p in req.points]
+    routes = [
+        ([p.lat for p in route.points], [p.lon for p in route.points], route.sample_step_m)
+        for route in req.routes
+    ]
+
+    # Кількість відліків рахуємо з довжини маршрутів, до їх побудови
+    n_points = len(point_ids) + sum(polyline_sample_count(*route) for route in routes)
+    work = work_units(n_points, len(req.sites), req.model)
+    reason = exceeded(n_points, work)
+    if reason is not None:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Prediction request too large: {reason}",
         )
 
-    return CoverageResponse(
-        grid_step_m=req.grid.step_m,
-        cells=cells,
+    lat_parts = [np.array([p.lat for p in req.points], dtype=np.float64)]
+    lon_parts = [np.array([p.lon for p in req.points], dtype=np.float64)]
+    samples = []
+    for index, (route, route_in) in enumerate(zip(routes, req.routes)):
+        r_lats, r_lons, dist = sample_polyline(*route)
+        samples.append((index, route_in.id, dist.tolist()))
+        lat_parts.append(r_lats)
+        lon_parts.append(r_lons)
+    lats = np.concatenate(lat_parts)
+    lons = np.concatenate(lon_parts)
+
+    with _admitted(work):
+        result = best_server_tiled(
+            lats,
+            lons,
+            req.sites,
+            rx_height_m=req.rx_height_m,
+            model=req.model,
+        )
+
+    ids: List[Optional[str]] = [site.id for site in req.sites] + [None]
+    levels = result.rx_level_dbm.tolist()
+    lats = lats.tolist()
+    lons = lons.tolist()
+    servers = [ids[i] for i in result.site_index.tolist()]
+    out = [
+        PredictedPoint(
+            lat=lats[i], lon=lons[i], rx_level_dbm=levels[i],
+            best_site_id=servers[i], point_id=point_ids[i],
+        )
+        for i in range(len(point_ids))
+    ]
+    i = len(point_ids)
+    for index, route_id, dist in samples:
+        for d in dist:
+            out.append(PredictedPoint(
+                lat=lats[i], lon=lons[i], rx_level_dbm=levels[i], best_site_id=servers[i],
+                route_id=route_id, route_index=index, distance_m=d,
+            ))
+            i += 1
+    return SignalPredictionResponse(points=out)
+
+
+def _scenarios(req: CoverageScenarioRequest) -> List[Scenario]:
+    """Apply each scenario's overrides to the request's sites."""
+    known = {site.id for site in req.sites}
+    scenarios = []
+    for index, variant in enumerate(req.scenarios):
+        unknown = (set(variant.frequency_mhz) | set(variant.disabled_sites)) - known
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Scenario {variant.id or index} refers to unknown sites: {sorted(unknown)}",
+            )
+        sites = [
+            site.model_copy(update={"frequency_mhz": variant.frequency_mhz[site.id]})
+            if site.id in variant.frequency_mhz else site
+            for site in req.sites
+        ]
+        disabled = set(variant.disabled_sites)
+        scenarios.append(Scenario(
+            sites=sites,
+            rx_height_m=req.rx_height_m if variant.rx_height_m is None else variant.rx_height_m,
+            enabled=np.array([site.id not in disabled for site in req.sites], dtype=bool),
+        ))
+    return scenarios
+
+
+@router.post(
+    "/scenarios",
+    response_model=CoverageScenarioResponse,
+    response_model_exclude_none=True,
+)
+def evaluate_scenarios(req: CoverageScenarioRequest) -> CoverageScenarioResponse:
+    """Compare what-if variants of one deployment side by side.
+
+    Each scenario may change the subscriber height, the frequency of
+    some sites or switch sites off (e.g. a candidate site). The grid
+    and the cell-to-site distances are computed once for all of them,
+    so N scenarios cost far less than N `/coverage/calc` calls. Every
+    scenario gets a `/coverage/summary`-style summary and, with
+    `output=raster`, its levels as a `CoverageRaster`.
+    """
+    thresholds = _class_thresholds(req)
+    scenarios = _scenarios(req)
+    base = CoverageRequest(
+        sites=req.sites, rx_height_m=req.rx_height_m, grid=req.grid, model=req.model,
     )
+    cost = _check_budget(base, req.output, len(scenarios))
+
+    accumulators = [CoverageSummaryAccumulator(thresholds) for _ in scenarios]
+    rasters: List[Optional[CoverageRaster]] = [None] * len(scenarios)
+    with _admitted(cost.work_units):
+        if req.output == "raster":
+            grid = build_grid(
+                center_lat=req.grid.center_lat,
+                center_lon=req.grid.center_lon,
+                radius_km=req.grid.radius_km,
+                step_m=req.grid.step_m,
+            )
+            results = best_server_scenarios(grid.lats, grid.lons, scenarios, req.model)
+            for i, (acc, result) in enumerate(zip(accumulators, results)):
+                acc.add(grid, result.rx_level_dbm)
+                rasters[i] = raster_codec.encode_json(
+                    grid, result.rx_level_dbm, req.grid.step_m, req.dtype
+                )
+        else:
+            # Лише статистика: рахуємо смугами, без повної сітки в пам'яті
+            for block in iter_grid_blocks(
+                center_lat=req.grid.center_lat,
+                center_lon=req.grid.center_lon,
+                radius_km=req.grid.radius_km,
+                step_m=req.grid.step_m,
+                rows_per_block=STREAM_ROWS_PER_BLOCK,
+            ):
+                results = best_server_scenarios(block.lats, block.lons, scenarios, req.model)
+                for acc, result in zip(accumulators, results):
+                    acc.add(block, result.rx_level_dbm)
+
+    return CoverageScenarioResponse(scenarios=[
+        CoverageScenarioResult(
+            index=index,
+            id=variant.id,
+            summary=acc.summary(req.histogram_step_db, req.percentiles),
+            raster=raster,
+        )
+        for index, (variant, acc, raster) in enumerate(zip(req.scenarios, accumulators, rasters))
+    ])
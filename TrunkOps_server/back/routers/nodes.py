@@ -4,14 +4,31 @@ Provides endpoints to create and read network nodes and their associated
 coverage zones. Coverage zones store the geometry (as GeoJSON/WKT)
 and percentage values for stable, degraded and critical areas. Only
 authenticated users may create entries.
+
+Zones can also be generated from the nodes' stored radio parameters
+(`POST /nodes/coverage`); they are kept up to date in the background
+when those parameters change, see `services.node_coverage`. The levels
+raster behind a generated zone can be read window by window from
+`GET /nodes/{node_id}/coverage/{zone_id}/raster`. Reading the zones of a
+node never writes; `X-Coverage-Stale` tells whether they are being
+recomputed.
+
+`POST /nodes/links` computes the link margins between nodes and the
+connectivity graph they form, see `services.node_links`.
 """
 
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import math
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
 from .. import database, models, schemas
+from ..services import node_coverage, node_links, raster_codec
+from ..services.coverage_budget import ADMISSION_WAIT_S, AdmissionTimeout, OverBudget
+from ..services.raster_store import raster_store
 from .auth import get_current_user
 
 router = APIRouter(prefix="/nodes", tags=["nodes"])
@@ -32,6 +49,49 @@ def create_node(node_in: schemas.NetworkNodeCreate, db: Session = Depends(databa
     return node
 
 
+@router.post("/coverage", response_model=list[schemas.CoverageZoneRead])
+def compute_nodes_coverage(req: schemas.NodeCoverageRequest, db: Session = Depends(database.get_db), user: models.AppUser = Depends(get_current_user)):
+    # grids over the per-request limits are refused before anything is computed
+    try:
+        zones, missing = node_coverage.compute_nodes(db, req.node_ids, req.config)
+    except OverBudget as exc:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail={
+                "message": f"Coverage request too large: {exc.estimate.reason}",
+                "estimate": exc.estimate.model_dump(),
+            },
+        )
+    except AdmissionTimeout:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Coverage capacity exhausted, retry later",
+            headers={"Retry-After": str(int(math.ceil(ADMISSION_WAIT_S)))},
+        )
+    if missing:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Nodes not found: {missing}")
+    db.commit()
+    for zone in zones:
+        db.refresh(zone)
+    return zones
+
+
+@router.post("/links", response_model=schemas.NodeLinkGraph)
+def compute_node_links(req: schemas.NodeLinkRequest, db: Session = Depends(database.get_db), user: models.AppUser = Depends(get_current_user)):
+    # pairs out of range are pruned; the dense matrix is limited to NODE_LINK_MATRIX_MAX_NODES
+    try:
+        graph, missing = node_links.link_graph(db, req)
+    except node_links.LinkMatrixTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc))
+    if missing:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Nodes not found: {missing}")
+    return graph
+
+
 @router.get("/{node_id}", response_model=schemas.NetworkNodeRead)
 def read_node(node_id: int, db: Session = Depends(database.get_db), user: models.AppUser = Depends(get_current_user)):
     node = db.query(models.NetworkNode).filter(models.NetworkNode.id == node_id).first()
@@ -40,12 +100,42 @@ def read_node(node_id: int, db: Session = Depends(database.get_db), user: models
     return node
 
 
+@router.patch("/{node_id}", response_model=schemas.NetworkNodeRead)
+def update_node(node_id: int, node_in: schemas.NetworkNodeUpdate, db: Session = Depends(database.get_db), user: models.AppUser = Depends(get_current_user)):
+    node = db.query(models.NetworkNode).filter(models.NetworkNode.id == node_id).first()
+    if not node:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Node not found")
+    for field, value in node_in.dict(exclude_unset=True).items():
+        setattr(node, field, value)
+    # radio changes mark generated coverage stale on commit
+    db.commit()
+    db.refresh(node)
+    return node
+
+
 @router.get("/{node_id}/coverage", response_model=list[schemas.CoverageZoneRead])
-def read_coverage_zones(node_id: int, db: Session = Depends(database.get_db), user: models.AppUser = Depends(get_current_user)):
+def read_coverage_zones(node_id: int, response: Response, db: Session = Depends(database.get_db), user: models.AppUser = Depends(get_current_user)):
+    # serve stored zones; a stale generated one is refreshed in the background, reading writes nothing
+    stale = False
+    for node in node_coverage.load_nodes(db, [node_id]):
+        stale = node_coverage.schedule_if_changed(node)
+    response.headers["X-Coverage-Stale"] = "true" if stale else "false"
     zones = db.query(models.CoverageZone).filter(models.CoverageZone.node_id == node_id).all()
     return zones
 
 
+@router.get("/{node_id}/coverage/state", response_model=schemas.NodeCoverageStateRead)
+def read_coverage_state(node_id: int, db: Session = Depends(database.get_db), user: models.AppUser = Depends(get_current_user)):
+    node = next(iter(node_coverage.load_nodes(db, [node_id])), None)
+    if not node or not node.coverage_state:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No generated coverage for node")
+    state = schemas.NodeCoverageStateRead.model_validate(node.coverage_state, from_attributes=True)
+    # inputs changed behind the orm's back: reported stale until the refresher picks it up
+    if state.status != "stale" and node_coverage.is_stale(node):
+        state.status = "stale"
+    return state
+
+
 @router.post("/{node_id}/coverage", response_model=schemas.CoverageZoneRead)
 def create_coverage_zone(node_id: int, zone_in: schemas.CoverageZoneCreate, db: Session = Depends(database.get_db), user: models.AppUser = Depends(get_current_user)):
     # ensure zone_in.node_id matches path
@@ -60,3 +150,48 @@ def create_coverage_zone(node_id: int, zone_in: schemas.CoverageZoneCreate, db:
     db.commit()
     db.refresh(zone)
     return zone
+
+
+def _parse_bbox(bbox: Optional[str]):
+    if bbox is None:
+        return None
+    try:
+        south, west, north, east = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="bbox must be 'south,west,north,east' in degrees",
+        )
+    return south, west, north, east
+
+
+@router.get("/{node_id}/coverage/{zone_id}/raster")
+def read_coverage_raster(
+    node_id: int,
+    zone_id: int,
+    bbox: Optional[str] = Query(None, description="'south,west,north,east' in degrees; default the whole raster"),
+    max_size: int = Query(1024, ge=1, le=4096, description="Maximum cells per side; larger windows are read from overviews"),
+    format: Literal["raster", "binary"] = Query("raster", description="CoverageRaster JSON or the binary raster encoding"),
+    dtype: Literal["float32", "int16", "int8"] = Query("float32", description="Level encoding"),
+    db: Session = Depends(database.get_db),
+    user: models.AppUser = Depends(get_current_user),
+):
+    # only the pages of the window (or of a matching overview) are read from disk
+    zone = db.query(models.CoverageZone).filter(
+        models.CoverageZone.id == zone_id, models.CoverageZone.node_id == node_id
+    ).first()
+    if not zone:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Coverage zone not found")
+    window = raster_store.window(zone.id, zone.algorithm, _parse_bbox(bbox), max_size)
+    if window is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No stored raster for zone")
+    grid, levels, step_m = window
+    if format == "binary":
+        return Response(
+            content=raster_codec.encode_binary(grid, levels, step_m, dtype),
+            media_type=raster_codec.RASTER_BINARY_MEDIA_TYPE,
+        )
+    return Response(
+        content=raster_codec.encode_json(grid, levels, step_m, dtype).model_dump_json(),
+        media_type=raster_codec.RASTER_JSON_MEDIA_TYPE,
+    )
@@ -10,9 +10,11 @@ included. Relationships are flattened to IDs where appropriate.
 from __future__ import annotations
 
 from datetime import datetime, date
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+from .coverage_schemas import NodeCoverageConfig, PropagationModelName
 
 
 class Token(BaseModel):
@@ -120,6 +122,28 @@ class NetworkNodeCreate(NetworkNodeBase):
     pass
 
 
+class NetworkNodeUpdate(BaseModel):
+    name: Optional[str] = None
+    unit_id: Optional[int] = None
+    device_model_id: Optional[int] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    altitude_m: Optional[float] = None
+    status: Optional[str] = None
+    description: Optional[str] = None
+    frequency_mhz: Optional[float] = None
+    erp_w: Optional[float] = None
+    antenna_height_m: Optional[float] = None
+
+    @field_validator("name", "device_model_id", "latitude", "longitude")
+    @classmethod
+    def _not_null(cls, value):
+        # May be omitted, but the columns are NOT NULL.
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+
 class NetworkNodeRead(NetworkNodeBase):
     id: int
     created_at: datetime
@@ -149,6 +173,74 @@ class CoverageZoneRead(CoverageZoneBase):
         orm_mode = True
 
 
+class NodeCoverageRequest(BaseModel):
+    node_ids: List[int]
+    config: NodeCoverageConfig = Field(default_factory=NodeCoverageConfig)
+
+
+class NodeCoverageStateRead(BaseModel):
+    node_id: int
+    zone_id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    class Config:
+        orm_mode = True
+
+
+# Node-to-node link schemas
+class NodeLinkRoute(BaseModel):
+    source_id: int
+    target_id: int
+
+
+class NodeLinkRequest(BaseModel):
+    node_ids: Optional[List[int]] = Field(None, description="Nodes to connect; all nodes when omitted")
+    model: PropagationModelName = "hata"
+    min_margin_db: float = Field(
+        0.0, description="Margin over the receiver's sensitivity a link needs in both directions, dB",
+    )
+    routes: List[NodeLinkRoute] = Field(
+        default_factory=list, description="Node pairs to find the best relay path between",
+    )
+    include_matrix: bool = Field(False, description="Also return the dense margin matrix")
+
+
+class NodeLink(BaseModel):
+    a_id: int
+    b_id: int
+    distance_km: float
+    margin_ab_db: float
+    margin_ba_db: float
+
+
+class NodeRelayPath(BaseModel):
+    source_id: int
+    target_id: int
+    node_ids: List[int] = Field(description="Nodes along the path, empty when unreachable")
+    bottleneck_margin_db: Optional[float] = Field(None, description="Margin of the weakest link on the path")
+
+
+class NodeLinkExcluded(BaseModel):
+    node_id: int
+    error: str
+
+
+class NodeLinkGraph(BaseModel):
+    node_ids: List[int] = Field(description="Nodes in the graph, in matrix order")
+    excluded: List[NodeLinkExcluded] = Field(default_factory=list)
+    links: List[NodeLink]
+    components: List[List[int]] = Field(description="Connected components, largest first")
+    articulation_points: List[int] = Field(description="Nodes whose loss splits their component")
+    routes: List[NodeRelayPath] = Field(default_factory=list)
+    margin_db: Optional[List[List[Optional[float]]]] = Field(
+        None,
+        description="margin_db[i][j]: margin of the link from node i to node j; "
+                    "null on the diagonal and for pairs pruned as out of range",
+    )
+    evaluated_pairs: int = Field(description="Directed pairs evaluated after spatial pruning")
+
+
 # Asset type schemas
 class AssetTypeBase(BaseModel):
     title: str
@@ -0,0 +1,192 @@
+"""Adaptive multi-resolution coverage evaluation.
+
+The fine grid is covered by square blocks of `coarse_factor` cells
+whose level is evaluated once, at the block centre. A block is split
+into four children (quadtree) when a threshold lies within the level
+range of the block and its neighbours (widened by `margin_db`), when
+it differs sharply from a neighbouring block, when its best server
+(or, with metrics, its second server) differs from a neighbour's, or
+when it contains a site; this repeats down to single cells. Cells of
+blocks that were not split take their block's value, so the output is
+a regular fine-grid result that every encoder can consume, while
+only a fraction of the cells is actually evaluated. Optional
+`ServerMetrics` are taken from the same evaluations.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from ..coverage_schemas import AdaptiveConfig, Site
+from .coverage_engine import BestServer, NO_SIGNAL_DBM, ServerMetrics, best_server
+from .grid_service import Grid
+
+
+@dataclass
+class AdaptiveResult:
+    best: BestServer
+    evaluated: int
+
+
+def _neighbour_range(values: np.ndarray):
+    """Per-block (min, max, spread) over the block and its 4-neighbours.
+
+    NaN marks blocks that were not evaluated at this level; they are
+    ignored. `spread` is the largest absolute step to a neighbour.
+    """
+    lo = values.copy()
+    hi = values.copy()
+    spread = np.zeros_like(values)
+    for axis in (0, 1):
+        for shift in (1, -1):
+            other = np.roll(values, shift, axis=axis)
+            edge = [slice(None), slice(None)]
+            edge[axis] = slice(0, 1) if shift == 1 else slice(-1, None)
+            other[tuple(edge)] = np.nan
+            lo = np.fmin(lo, other)
+            hi = np.fmax(hi, other)
+            step = np.abs(values - other)
+            spread = np.fmax(spread, np.where(np.isnan(step), 0.0, step))
+    return lo, hi, spread
+
+
+def _differs_from_neighbour(index: np.ndarray) -> np.ndarray:
+    """Per-block: a 4-neighbour holds another site index (-2 = not evaluated)."""
+    values = np.where(index == -2, np.nan, index.astype(np.float64))
+    return _neighbour_range(values)[2] > 0
+
+
+def _unique_blocks(r: np.ndarray, c: np.ndarray):
+    """Distinct (r, c) pairs of non-negative block indices."""
+    width = int(c.max()) + 1 if c.size else 1
+    keys = np.unique(r * width + c)
+    return keys // width, keys % width
+
+
+def adaptive_best_server(grid: Grid,
+                         sites: Sequence[Site],
+                         rx_height_m: float,
+                         model: str,
+                         config: AdaptiveConfig,
+                         on_progress: Optional[Callable[[int, int], None]] = None,
+                         server_threshold_dbm: Optional[float] = None,
+                         ) -> AdaptiveResult:
+    """Best-server over `grid` evaluating only blocks that need detail.
+
+    `grid` may be a band of a larger raster (`iter_grid_blocks`); the
+    quadtree is built in coordinates local to its bounding box.
+    """
+    n_cells = len(grid)
+    if n_cells == 0 or not sites:
+        return AdaptiveResult(
+            best_server(grid.lats, grid.lons, sites, rx_height_m, model,
+                        server_threshold_dbm=server_threshold_dbm),
+            0,
+        )
+    with_metrics = server_threshold_dbm is not None
+    best_rx = np.full(n_cells, NO_SIGNAL_DBM, dtype=np.float64)
+    best_idx = np.full(n_cells, -1, dtype=np.int32)
+    metric_names = list(ServerMetrics.__dataclass_fields__) if with_metrics else []
+    metric_out = {name: None for name in metric_names}
+
+    size = 1 << (max(int(config.coarse_factor), 1).bit_length() - 1)
+    r_off = (int(grid.rows.min()) // size) * size
+    c_off = (int(grid.cols.min()) // size) * size
+    rows = grid.rows.astype(np.int64) - r_off
+    cols = grid.cols.astype(np.int64) - c_off
+    n_rows = int(rows.max()) + 1
+    n_cols = int(cols.max()) + 1
+
+    thresholds = np.asarray(config.thresholds_dbm, dtype=np.float64).reshape(-1)
+    site_rows = np.floor(
+        (np.array([s.lat for s in sites]) - grid.lat0) / grid.dlat_deg + 0.5
+    ).astype(np.int64) - r_off
+    site_cols = np.floor(
+        (np.array([s.lon for s in sites]) - grid.lon0) / grid.dlon_deg + 0.5
+    ).astype(np.int64) - c_off
+
+    assigned = np.zeros(n_cells, dtype=bool)
+    evaluated = 0
+
+    # Blocks of the current level that have to be evaluated.
+    br, bc = _unique_blocks(rows // size, cols // size)
+
+    while br.size:
+        shape = (-(-n_rows // size), -(-n_cols // size))
+        r = np.minimum(br * size + size // 2, n_rows - 1) + r_off
+        c = np.minimum(bc * size + size // 2, n_cols - 1) + c_off
+        res = best_server(
+            grid.lat0 + r * grid.dlat_deg,
+            grid.lon0 + c * grid.dlon_deg,
+            sites, rx_height_m, model,
+            server_threshold_dbm=server_threshold_dbm,
+        )
+        evaluated += int(br.size)
+
+        level_rx = np.full(shape, np.nan)
+        level_idx = np.full(shape, -2, dtype=np.int32)
+        level_rx[br, bc] = res.rx_level_dbm
+        level_idx[br, bc] = res.site_index
+        level_metrics = {}
+        for name in metric_names:
+            values = getattr(res.metrics, name)
+            if metric_out[name] is None:
+                metric_out[name] = np.empty(n_cells, dtype=values.dtype)
+            level_metrics[name] = np.zeros(shape, dtype=values.dtype)
+            level_metrics[name][br, bc] = values
+
+        if size > 1:
+            lo, hi, spread = (a[br, bc] for a in _neighbour_range(level_rx))
+            # A threshold inside the level range around the block means a
+            # class boundary may cross it.
+            near = (
+                (thresholds[None, :] >= lo[:, None] - config.margin_db)
+                & (thresholds[None, :] <= hi[:, None] + config.margin_db)
+            ).any(axis=1)
+            has_site = np.zeros(shape, dtype=bool)
+            inside = (
+                (site_rows >= 0) & (site_rows < n_rows)
+                & (site_cols >= 0) & (site_cols < n_cols)
+            )
+            has_site[site_rows[inside] // size, site_cols[inside] // size] = True
+            # Server borders are resolved like class borders, so the
+            # server layer and the metrics hold along cell edges too.
+            server = _differs_from_neighbour(level_idx)[br, bc]
+            if with_metrics:
+                second = np.full(shape, -2, dtype=np.int32)
+                second[br, bc] = res.metrics.second_site_index
+                server |= _differs_from_neighbour(second)[br, bc]
+            split = near | (spread > config.gradient_db) | server | has_site[br, bc]
+        else:
+            split = np.zeros(br.shape, dtype=bool)
+
+        final = np.zeros(shape, dtype=bool)
+        final[br[~split], bc[~split]] = True
+        todo = np.flatnonzero(~assigned)
+        cr, cc = rows[todo] // size, cols[todo] // size
+        take = final[cr, cc]
+        cells = todo[take]
+        best_rx[cells] = level_rx[cr[take], cc[take]]
+        best_idx[cells] = level_idx[cr[take], cc[take]]
+        for name, level in level_metrics.items():
+            metric_out[name][cells] = level[cr[take], cc[take]]
+        assigned[cells] = True
+        if on_progress is not None:
+            on_progress(int(assigned.sum()), n_cells)
+
+        if not split.any():
+            break
+        # Children of split blocks that still contain unassigned cells.
+        size //= 2
+        parent_split = np.zeros(shape, dtype=bool)
+        parent_split[br[split], bc[split]] = True
+        todo = np.flatnonzero(~assigned)
+        child_r, child_c = rows[todo] // size, cols[todo] // size
+        keep = parent_split[child_r // 2, child_c // 2]
+        br, bc = _unique_blocks(child_r[keep], child_c[keep])
+
+    metrics = ServerMetrics(**metric_out) if with_metrics else None
+    return AdaptiveResult(BestServer(best_rx, best_idx, metrics), evaluated)
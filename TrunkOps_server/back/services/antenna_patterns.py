@@ -0,0 +1,278 @@
+"""Directional antenna patterns from MSI/Planet files.
+
+Pattern files (`*.msi`, `*.pln`, `*.ant`) are read once from
+`ANTENNA_PATTERN_DIR` on first use and kept in memory; a pattern is
+named after its file stem. The file's `HORIZONTAL` and `VERTICAL`
+sections list attenuation (dB, >= 0) relative to boresight by angle:
+horizontal angles clockwise from the boresight, vertical angles
+downwards from the horizon. Both are resampled to `TABLE_BINS` steps
+per turn, and a lookup is two gathers plus linear interpolation for
+any number of cell x site pairs. Files are treated as immutable: give an edited
+pattern a new name so cached coverage is not reused.
+
+`Site.antenna_gain_dbi` stays the boresight gain; the pattern only
+attenuates it. The two planes are summed (the usual 2-D
+approximation), capped at the deepest value of either table so the
+back lobe is not counted twice. The elevation angle uses heights
+above ground and the chord distance (terrain is ignored).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .grid_service import EARTH_RADIUS_KM, unit_vectors
+
+if TYPE_CHECKING:
+    from ..coverage_schemas import Site
+
+
+PATTERN_DIR: Optional[str] = os.getenv("ANTENNA_PATTERN_DIR") or None
+PATTERN_SUFFIXES = (".msi", ".pln", ".ant")
+
+# dBd to dBi for the GAIN header.
+DBD_TO_DBI = 2.15
+
+# Table steps per full turn.
+TABLE_BINS = 512
+
+# Lookups use each table repeated over three turns, so every relative
+# angle the loss can see maps to an index without wrapping.
+_ROW_BINS = 3 * TABLE_BINS + 1
+
+# Float64 cell x site temporaries held by `PatternLoss`.
+PATTERN_ARRAYS = 6
+
+
+@dataclass
+class AntennaPattern:
+    """Attenuation tables, `TABLE_BINS + 1` values with the first repeated."""
+    name: str
+    gain_dbi: Optional[float]
+    frequency_mhz: Optional[float]
+    horizontal: np.ndarray
+    vertical: np.ndarray
+
+    @property
+    def max_attenuation_db(self) -> float:
+        return float(max(self.horizontal.max(), self.vertical.max()))
+
+
+def _resample(angles: List[float], values: List[float]) -> np.ndarray:
+    """Periodic table over a full turn with the 0 degree value repeated at the end."""
+    if not angles:
+        return np.zeros(TABLE_BINS + 1, dtype=np.float64)
+    table = np.interp(
+        np.arange(TABLE_BINS + 1, dtype=np.float64) * (360.0 / TABLE_BINS),
+        np.mod(np.array(angles, dtype=np.float64), 360.0),
+        np.array(values, dtype=np.float64),
+        period=360.0,
+    )
+    return np.abs(table)
+
+
+def parse_msi(text: str, name: str) -> AntennaPattern:
+    """Parse an MSI/Planet pattern; raises ValueError on malformed files."""
+    gain = frequency = None
+    planes: Dict[str, tuple] = {"HORIZONTAL": ([], []), "VERTICAL": ([], [])}
+    current = None
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        head = fields[0].upper()
+        if head in planes:
+            current = planes[head]
+            continue
+        try:
+            if current is not None and len(fields) >= 2 and _is_number(head):
+                current[0].append(float(fields[0]))
+                current[1].append(float(fields[1]))
+                continue
+            current = None
+            if head == "GAIN" and len(fields) >= 2:
+                gain = float(fields[1])
+                if len(fields) > 2 and fields[2].lower() == "dbd":
+                    gain += DBD_TO_DBI
+            elif head == "FREQUENCY" and len(fields) >= 2:
+                frequency = float(fields[1])
+        except ValueError:
+            raise ValueError(f"Malformed pattern {name!r}: {line.strip()!r}") from None
+    if not planes["HORIZONTAL"][0]:
+        raise ValueError(f"Pattern {name!r} has no HORIZONTAL section")
+    return AntennaPattern(
+        name=name,
+        gain_dbi=gain,
+        frequency_mhz=frequency,
+        horizontal=_resample(*planes["HORIZONTAL"]),
+        vertical=_resample(*planes["VERTICAL"]),
+    )
+
+
+def _is_number(text: str) -> bool:
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+class PatternLibrary:
+    """Patterns of a directory, parsed on first use.
+
+    Files that fail to parse are skipped and listed in `errors`.
+    """
+
+    def __init__(self, directory: Optional[str] = PATTERN_DIR) -> None:
+        self.directory = directory
+        self.errors: Dict[str, str] = {}
+        self._patterns: Optional[Dict[str, AntennaPattern]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, AntennaPattern]:
+        with self._lock:
+            if self._patterns is None:
+                patterns: Dict[str, AntennaPattern] = {}
+                if self.directory and os.path.isdir(self.directory):
+                    for entry in sorted(os.listdir(self.directory)):
+                        stem, suffix = os.path.splitext(entry)
+                        if suffix.lower() not in PATTERN_SUFFIXES:
+                            continue
+                        path = os.path.join(self.directory, entry)
+                        try:
+                            with open(path, encoding="latin-1") as f:
+                                patterns[stem] = parse_msi(f.read(), stem)
+                        except (OSError, ValueError) as exc:
+                            self.errors[entry] = str(exc)
+                self._patterns = patterns
+            return self._patterns
+
+    def get(self, name: str) -> AntennaPattern:
+        try:
+            return self._load()[name]
+        except KeyError:
+            raise ValueError(f"Unknown antenna pattern {name!r}") from None
+
+    def names(self) -> List[str]:
+        return sorted(self._load())
+
+    def all(self) -> List[AntennaPattern]:
+        patterns = self._load()
+        return [patterns[name] for name in sorted(patterns)]
+
+
+patterns = PatternLibrary()
+
+
+def _stack(tables: List[np.ndarray]) -> np.ndarray:
+    """Tables repeated over three turns, concatenated (`_ROW_BINS` per row)."""
+    rows = [np.concatenate([t[:-1], t[:-1], t]) for t in tables]
+    return np.concatenate(rows) if rows else np.zeros(0, dtype=np.float64)
+
+
+def _lookup(flat: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Linear interpolation of `flat` at fractional indices `x` (overwritten)."""
+    i = x.astype(np.int64)
+    x -= i
+    lo = flat[i]
+    i += 1
+    hi = flat[i]
+    hi -= lo
+    hi *= x
+    hi += lo
+    return hi
+
+
+class PatternLoss:
+    """Pattern attenuation between a fixed site list and batches of targets.
+
+    Omni sites (no `pattern`) give 0 and cost nothing; directional ones
+    need a bearing and an elevation angle per cell, from the target's
+    east/north components in each site's local frame (two matrix
+    products) and two `arctan2`.
+    """
+
+    def __init__(self,
+                 sites: Sequence["Site"],
+                 rx_height_m: float,
+                 library: PatternLibrary = patterns) -> None:
+        directional = [i for i, s in enumerate(sites) if s.pattern is not None]
+        # Row of each site in the stacked tables, -1 for omni sites.
+        self.row = np.full(len(sites), -1, dtype=np.int64)
+        self.row[directional] = np.arange(len(directional))
+        chosen = [library.get(sites[i].pattern) for i in directional]
+        self.horizontal = _stack([p.horizontal for p in chosen])
+        self.vertical = _stack([p.vertical for p in chosen])
+        self.cap = np.array([p.max_attenuation_db for p in chosen], dtype=np.float64)
+
+        # Index in the stacked tables of a zero relative angle: the
+        # row's start plus two turns, so bearing (+-1/2 turn) minus
+        # azimuth and depression (+-1/4 turn) minus downtilt (each
+        # [0, 1) turn) stay inside the row.
+        per_deg = TABLE_BINS / 360.0
+        base = np.arange(len(directional), dtype=np.float64) * _ROW_BINS
+        azimuth = np.array([sites[i].azimuth_deg for i in directional], dtype=np.float64)
+        downtilt = np.array([sites[i].downtilt_deg for i in directional], dtype=np.float64)
+        self.h_offset = base + 2 * TABLE_BINS - np.mod(azimuth, 360.0) * per_deg
+        self.v_offset = base + 2 * TABLE_BINS - np.mod(downtilt, 360.0) * per_deg
+        self.height_diff = np.array(
+            [sites[i].antenna_height_m - rx_height_m for i in directional], dtype=np.float64
+        )
+
+        phi = np.radians(np.array([sites[i].lat for i in directional], dtype=np.float64))
+        lam = np.radians(np.array([sites[i].lon for i in directional], dtype=np.float64))
+        # East and north unit vectors of each site's local frame.
+        self.east = np.stack([-np.sin(lam), np.cos(lam), np.zeros_like(lam)], axis=1)
+        self.north = np.stack(
+            [-np.sin(phi) * np.cos(lam), -np.sin(phi) * np.sin(lam), np.cos(phi)], axis=1
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.cap.size)
+
+    def __call__(self,
+                 lats: np.ndarray,
+                 lons: np.ndarray,
+                 site_ids: np.ndarray) -> np.ndarray:
+        """Loss (dB) for each target x selected site, shape (n, len(site_ids))."""
+        n, m = lats.shape[0], site_ids.shape[0]
+        cols = np.flatnonzero(self.row[site_ids] >= 0)
+        if n == 0 or cols.size == 0:
+            return np.zeros((n, m), dtype=np.float64)
+        rows = self.row[site_ids[cols]]
+        bins_per_rad = TABLE_BINS / (2.0 * np.pi)
+
+        u = unit_vectors(lats, lons)
+        east = u @ self.east[rows].T
+        north = u @ self.north[rows].T
+
+        # Bearing relative to boresight.
+        x = np.arctan2(east, north)
+        x *= bins_per_rad
+        x += self.h_offset[rows]
+        total = _lookup(self.horizontal, x)
+
+        # Depression angle below the tilted boresight.
+        east *= east
+        north *= north
+        east += north
+        np.sqrt(east, out=east)
+        east *= EARTH_RADIUS_KM * 1000.0
+        np.maximum(east, 1.0, out=east)
+        x = np.arctan2(self.height_diff[rows], east, out=east)
+        x *= bins_per_rad
+        x += self.v_offset[rows]
+        total += _lookup(self.vertical, x)
+
+        np.minimum(total, self.cap[rows], out=total)
+        if cols.size == m:
+            return total
+        loss = np.zeros((n, m), dtype=np.float64)
+        loss[:, cols] = total
+        return loss
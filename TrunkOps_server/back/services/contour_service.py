@@ -0,0 +1,274 @@
+"""Coverage class polygons from a level raster.
+
+The best-server raster is contoured with marching squares at every
+class threshold. Rings are traced with the region at or above the
+threshold on their left, so outer boundaries are counter-clockwise and
+holes clockwise (the GeoJSON convention). A class band [lo, hi) is
+then the rings of `lo` plus the reversed rings of `hi`, with every
+hole assigned to the innermost outer ring around it. Rings are
+simplified with Douglas-Peucker at `tolerance_m` in a local metric
+frame.
+
+Cells outside the calculation circle are treated as far below every
+threshold, so all rings close.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..coverage_schemas import CoverageClassThresholds, CoverageContours
+from .coverage_summary import CoverageSummaryAccumulator
+from .grid_service import KM_PER_DEG_LAT, Grid
+
+
+# Stand-in level for cells outside the grid circle and the padding.
+OUTSIDE_DBM = -1000.0
+
+# Output coordinates are rounded to about 0.1 m.
+COORD_DECIMALS = 6
+
+Ring = np.ndarray  # (n, 2) of raster (x=col, y=row), closed: first == last
+
+# Marching squares segments per case, as (from_edge, to_edge) with edges
+# 0=bottom, 1=right, 2=top, 3=left and corner bits a=1 (bottom-left),
+# b=2 (bottom-right), c=4 (top-right), d=8 (top-left). The region at or
+# above the threshold stays on the left of each segment. Saddles (5, 10)
+# are listed for a centre below the threshold; above it they use
+# `_SADDLE_JOINED`.
+_SEGMENTS: Dict[int, List[Tuple[int, int]]] = {
+    1: [(0, 3)], 2: [(1, 0)], 3: [(1, 3)], 4: [(2, 1)],
+    5: [(0, 3), (2, 1)], 6: [(2, 0)], 7: [(2, 3)], 8: [(3, 2)],
+    9: [(0, 2)], 10: [(1, 0), (3, 2)], 11: [(1, 2)], 12: [(3, 1)],
+    13: [(0, 1)], 14: [(3, 0)],
+}
+_SADDLE_JOINED: Dict[int, List[Tuple[int, int]]] = {
+    5: [(0, 1), (2, 3)],
+    10: [(3, 0), (1, 2)],
+}
+
+
+def _edge_keys(i: np.ndarray, j: np.ndarray, edge: int, width: int) -> np.ndarray:
+    """Unique id of a cell edge: horizontal edges even, vertical odd."""
+    if edge == 0:
+        return (i * width + j) * 2
+    if edge == 2:
+        return ((i + 1) * width + j) * 2
+    if edge == 3:
+        return (i * width + j) * 2 + 1
+    return (i * width + j + 1) * 2 + 1
+
+
+def _edge_points(keys: np.ndarray, padded: np.ndarray, level: float) -> np.ndarray:
+    """Interpolated (x, y) of the threshold crossing on each edge."""
+    width = padded.shape[1]
+    vertical = keys % 2 == 1
+    flat = keys // 2
+    i, j = flat // width, flat % width
+    v0 = padded[i, j]
+    v1 = np.where(vertical, padded[np.minimum(i + 1, padded.shape[0] - 1), j],
+                  padded[i, np.minimum(j + 1, width - 1)])
+    frac = (level - v0) / (v1 - v0)
+    x = j + np.where(vertical, 0.0, frac)
+    y = i + np.where(vertical, frac, 0.0)
+    return np.stack([x, y], axis=1)
+
+
+def trace_rings(raster: np.ndarray, level: float) -> List[Ring]:
+    """Closed rings of `raster >= level` in padded raster coordinates.
+
+    Coordinates are offset by one cell: (x, y) maps to raster
+    (row=y-1, col=x-1).
+    """
+    padded = np.full((raster.shape[0] + 2, raster.shape[1] + 2), OUTSIDE_DBM)
+    padded[1:-1, 1:-1] = np.where(np.isnan(raster), OUTSIDE_DBM, raster)
+    width = padded.shape[1]
+
+    inside = padded >= level
+    a, b = inside[:-1, :-1], inside[:-1, 1:]
+    c, d = inside[1:, 1:], inside[1:, :-1]
+    case = a * 1 + b * 2 + c * 4 + d * 8
+    centre = (
+        padded[:-1, :-1] + padded[:-1, 1:] + padded[1:, 1:] + padded[1:, :-1]
+    ) / 4.0 >= level
+
+    starts, ends = [], []
+    for value, segments in _SEGMENTS.items():
+        mask = case == value
+        if value in _SADDLE_JOINED:
+            joined = mask & centre
+            mask &= ~centre
+            ii, jj = np.nonzero(joined)
+            for e0, e1 in _SADDLE_JOINED[value]:
+                starts.append(_edge_keys(ii, jj, e0, width))
+                ends.append(_edge_keys(ii, jj, e1, width))
+        ii, jj = np.nonzero(mask)
+        for e0, e1 in segments:
+            starts.append(_edge_keys(ii, jj, e0, width))
+            ends.append(_edge_keys(ii, jj, e1, width))
+    start_keys = np.concatenate(starts)
+    end_keys = np.concatenate(ends)
+    if start_keys.size == 0:
+        return []
+
+    following = dict(zip(start_keys.tolist(), end_keys.tolist()))
+    rings: List[Ring] = []
+    while following:
+        first, key = following.popitem()
+        chain = [first, key]
+        while key != first:
+            key = following.pop(key)
+            chain.append(key)
+        rings.append(_edge_points(np.array(chain), padded, level))
+    return rings
+
+
+def signed_area(ring: Ring) -> float:
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+
+def contains(ring: Ring, point: np.ndarray) -> bool:
+    """Even-odd point-in-polygon test."""
+    x, y = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    crosses = (y > point[1]) != (y2 > point[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = x + (point[1] - y) * (x2 - x) / (y2 - y)
+    return bool(np.count_nonzero(crosses & (point[0] < x_at)) % 2)
+
+
+def simplify(ring: Ring, tolerance: float) -> Ring:
+    """Douglas-Peucker of a closed ring (tolerance in ring units)."""
+    if tolerance <= 0 or ring.shape[0] <= 4:
+        return ring
+    pts = ring[:-1]
+    # Anchor on the first point and the point farthest from it.
+    far = int(np.argmax(((pts - pts[0]) ** 2).sum(axis=1)))
+    keep = np.zeros(pts.shape[0], dtype=bool)
+    keep[0] = keep[far] = True
+    stack = [(0, far), (far, pts.shape[0])]
+    while stack:
+        lo, hi = stack.pop()
+        end = pts[hi % pts.shape[0]]
+        if hi - lo < 2:
+            continue
+        seg = end - pts[lo]
+        mid = pts[lo + 1:hi] - pts[lo]
+        norm = float(np.hypot(*seg))
+        if norm == 0.0:
+            dist = np.hypot(mid[:, 0], mid[:, 1])
+        else:
+            dist = np.abs(seg[0] * mid[:, 1] - seg[1] * mid[:, 0]) / norm
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            split = lo + 1 + k
+            keep[split] = True
+            stack.append((lo, split))
+            stack.append((split, hi))
+    out = pts[keep]
+    return np.vstack([out, out[:1]])
+
+
+def _band_polygons(lower: List[Ring], upper: List[Ring]) -> List[List[Ring]]:
+    """Polygons (outer ring first, then holes) of the band between two levels."""
+    rings = lower + [ring[::-1] for ring in upper]
+    areas = [signed_area(ring) for ring in rings]
+    outers = [(ring, area) for ring, area in zip(rings, areas) if area > 0]
+    polygons: List[List[Ring]] = [[ring] for ring, _ in outers]
+    for ring, area in zip(rings, areas):
+        if area >= 0:
+            continue
+        best: Optional[int] = None
+        for n, (outer, outer_area) in enumerate(outers):
+            if (best is None or outer_area < outers[best][1]) and contains(outer, ring[0]):
+                best = n
+        if best is not None:
+            polygons[best].append(ring)
+    return polygons
+
+
+def class_bands(thresholds: CoverageClassThresholds) -> List[Tuple[str, float, Optional[float]]]:
+    """(name, lower bound, upper bound) of each class, strongest first."""
+    return [
+        ("stable", thresholds.stable_dbm, None),
+        ("degraded", thresholds.degraded_dbm, thresholds.stable_dbm),
+        ("critical", thresholds.critical_dbm, thresholds.degraded_dbm),
+    ]
+
+
+def coverage_contours(grid: Grid,
+                      rx_level_dbm: np.ndarray,
+                      thresholds: CoverageClassThresholds,
+                      tolerance_m: float) -> Dict[str, object]:
+    """GeoJSON FeatureCollection with one MultiPolygon per class."""
+    raster = grid.to_raster(rx_level_dbm)
+    # Metric size of one raster step, for the simplification tolerance.
+    cos_lat = float(np.cos(np.radians(grid.lat0 + grid.dlat_deg * grid.n_rows / 2)))
+    scale = np.array([grid.dlon_deg * cos_lat, grid.dlat_deg]) * KM_PER_DEG_LAT * 1000.0
+
+    levels = sorted({t for _, lo, hi in class_bands(thresholds) for t in (lo, hi) if t is not None})
+    rings_at: Dict[float, List[Ring]] = {}
+    for level in levels:
+        rings = []
+        for ring in trace_rings(raster, level):
+            ring = simplify(ring * scale, tolerance_m) / scale
+            if ring.shape[0] >= 4 and signed_area(ring) != 0.0:
+                rings.append(ring)
+        rings_at[level] = rings
+
+    origin = np.array([grid.lon0 - grid.dlon_deg, grid.lat0 - grid.dlat_deg])
+    step = np.array([grid.dlon_deg, grid.dlat_deg])
+
+    def to_lonlat(ring: Ring) -> List[List[float]]:
+        return np.round(origin + ring * step, COORD_DECIMALS).tolist()
+
+    features = []
+    for name, lo, hi in class_bands(thresholds):
+        polygons = _band_polygons(rings_at[lo], rings_at[hi] if hi is not None else [])
+        features.append({
+            "type": "Feature",
+            "properties": {"class": name, "min_dbm": lo, "max_dbm": hi},
+            "geometry": {
+                "type": "MultiPolygon",
+                "coordinates": [[to_lonlat(ring) for ring in polygon] for polygon in polygons],
+            },
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def dumps_geojson(collection: Dict[str, object]) -> str:
+    return json.dumps(collection, separators=(",", ":"))
+
+
+def count_vertices(collection: Dict[str, object]) -> int:
+    return sum(
+        len(ring)
+        for feature in collection["features"]
+        for polygon in feature["geometry"]["coordinates"]
+        for ring in polygon
+    )
+
+
+def class_zone(grid: Grid,
+               rx_level_dbm: np.ndarray,
+               thresholds: CoverageClassThresholds,
+               tolerance_m: float,
+               model: str) -> CoverageContours:
+    """Class polygons plus class shares, i.e. the `CoverageZone` payload."""
+    collection = coverage_contours(grid, rx_level_dbm, thresholds, tolerance_m)
+    acc = CoverageSummaryAccumulator(thresholds)
+    acc.add(grid, rx_level_dbm)
+    summary = acc.summary()
+    return CoverageContours(
+        geometry=dumps_geojson(collection),
+        stable_percent=round(summary.stable_percent, 2),
+        degraded_percent=round(summary.degraded_percent, 2),
+        critical_percent=round(summary.critical_percent, 2),
+        algorithm=f"{model}/marching-squares",
+        thresholds=thresholds,
+        n_vertices=count_vertices(collection),
+    )
@@ -0,0 +1,275 @@
+"""Cost estimation and admission control for coverage requests.
+
+`estimate` derives the cell count, work (cell x site evaluations) and
+peak memory of a request from its `GridConfig` and site count before
+anything is computed. Requests over the per-request limits are
+rejected with a suggested coarser step; admitted ones then take their
+work from a server-wide budget (`admission`) and queue, up to a wait
+limit, while it is exhausted.
+
+Configuration (environment variables):
+
+* `COVERAGE_MAX_CELLS` - grid cells per request.
+* `COVERAGE_MAX_WORK_UNITS` - cell x site evaluations per request.
+* `COVERAGE_MAX_MEMORY_BYTES` - expected peak memory per request.
+* `COVERAGE_GLOBAL_WORK_UNITS` - work admitted concurrently server-wide.
+* `COVERAGE_ADMISSION_WAIT_S` - how long a synchronous request queues.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from ..coverage_schemas import CoverageEstimate, CoverageRequest
+from .coverage_engine import CHUNK_ELEMENTS
+from .grid_service import STREAM_ROWS_PER_BLOCK, estimate_cell_count, grid_shape
+from .propagation_models import get_model
+from .terrain_service import PROFILE_SAMPLES
+
+
+MAX_CELLS: int = int(os.getenv("COVERAGE_MAX_CELLS", "20000000"))
+MAX_WORK_UNITS: int = int(os.getenv("COVERAGE_MAX_WORK_UNITS", "2000000000"))
+MAX_MEMORY_BYTES: int = int(os.getenv("COVERAGE_MAX_MEMORY_BYTES", str(2 * 1024 ** 3)))
+GLOBAL_WORK_UNITS: int = int(os.getenv("COVERAGE_GLOBAL_WORK_UNITS", "4000000000"))
+ADMISSION_WAIT_S: float = float(os.getenv("COVERAGE_ADMISSION_WAIT_S", "30"))
+
+# Measured with `benchmarks.coverage_bench`: grid arrays plus their
+# temporaries, best-server outputs, metric outputs and, per format,
+# the response being built.
+GRID_BYTES_PER_CELL = 48
+RESULT_BYTES_PER_CELL = 12
+METRICS_BYTES_PER_CELL = 24
+RESPONSE_BYTES_PER_CELL = {
+    "cells": 800, "raster": 16, "binary": 9, "stream": 0, "summary": 0, "contours": 16,
+}
+BODY_BYTES_PER_CELL = {
+    "cells": 65, "raster": 6, "binary": 5, "stream": 65, "summary": 0, "contours": 0,
+}
+METRICS_BODY_BYTES_PER_CELL = 90
+
+# Outputs computed band by band rather than as a whole grid.
+STREAMED_OUTPUTS = ("stream", "summary")
+
+# The engine holds a few float64 chunk-sized arrays (per pool worker
+# too, but those are bounded by the pool configuration, not the request).
+WORKING_ARRAYS = 4
+
+# How often a queued job checks whether it was cancelled.
+POLL_S = 1.0
+
+
+class OverBudget(Exception):
+    """The request exceeds a per-request limit; see `estimate`."""
+
+    def __init__(self, estimate: CoverageEstimate) -> None:
+        super().__init__(estimate.reason)
+        self.estimate = estimate
+
+
+class AdmissionTimeout(Exception):
+    """The server-wide budget stayed exhausted for the whole wait."""
+
+
+def _working_set_bytes(n_cells: int, n_sites: int) -> int:
+    return WORKING_ARRAYS * 8 * min(CHUNK_ELEMENTS, max(1, n_cells * n_sites))
+
+
+def work_units(n_cells: int, n_sites: int, model: str) -> int:
+    """Path-loss evaluations; terrain models also walk a profile per pair."""
+    work = n_cells * n_sites
+    if get_model(model).uses_terrain:
+        work *= PROFILE_SAMPLES
+    return work
+
+
+def _cost(req: CoverageRequest, step_m: float, output: str, n_scenarios: int = 1):
+    """Cells, work, memory and response size; scenarios share the grid
+    and the distances but each holds and returns its own result."""
+    n_cells = estimate_cell_count(req.grid.center_lat, req.grid.radius_km, step_m)
+    n_sites = len(req.sites)
+    work = work_units(n_cells, n_sites, req.model) * n_scenarios
+
+    body = BODY_BYTES_PER_CELL[output]
+    if req.metrics is not None and output in ("cells", "stream"):
+        body += METRICS_BODY_BYTES_PER_CELL
+    held = n_cells
+    if output in STREAMED_OUTPUTS:
+        # One band of `STREAM_ROWS_PER_BLOCK` full raster rows at a time.
+        n_cols = grid_shape(req.grid.center_lat, req.grid.radius_km, step_m)[1]
+        held = min(n_cells, STREAM_ROWS_PER_BLOCK * n_cols)
+    per_scenario = RESULT_BYTES_PER_CELL + RESPONSE_BYTES_PER_CELL[output]
+    if req.metrics is not None:
+        per_scenario += METRICS_BYTES_PER_CELL
+    per_cell = GRID_BYTES_PER_CELL + n_scenarios * per_scenario
+    memory = _working_set_bytes(n_cells, n_sites) + held * per_cell
+    return n_cells, work, memory, n_cells * body * n_scenarios
+
+
+def exceeded(n_cells: int, work: int, memory: int = 0) -> Optional[str]:
+    """Description of the first per-request limit exceeded, if any."""
+    if n_cells > MAX_CELLS:
+        return f"{n_cells} cells exceed the limit of {MAX_CELLS}"
+    if work > MAX_WORK_UNITS:
+        return f"{work} work units exceed the limit of {MAX_WORK_UNITS}"
+    if memory > MAX_MEMORY_BYTES:
+        return f"{memory} bytes of memory exceed the limit of {MAX_MEMORY_BYTES}"
+    return None
+
+
+def _suggest_step(req: CoverageRequest,
+                  output: str,
+                  n_cells: int,
+                  work: int,
+                  memory: int,
+                  n_scenarios: int = 1) -> Optional[float]:
+    """Smallest whole-metre step within the limits, if any."""
+    fixed = WORKING_ARRAYS * 8 * CHUNK_ELEMENTS
+    if fixed >= MAX_MEMORY_BYTES:
+        return None
+    # Cells (and so work and per-cell memory) scale with 1 / step^2.
+    ratio = max(
+        n_cells / MAX_CELLS,
+        work / MAX_WORK_UNITS,
+        max(memory - fixed, 0) / (MAX_MEMORY_BYTES - fixed),
+    )
+    step = math.ceil(req.grid.step_m * math.sqrt(ratio))
+    for _ in range(64):
+        if exceeded(*_cost(req, step, output, n_scenarios)[:3]) is None:
+            return float(step)
+        step = math.ceil(step * 1.05)
+    return None
+
+
+class AdmissionTicket:
+    """Work held in the budget until `release` (idempotent) is called."""
+
+    def __init__(self, controller: "AdmissionController", work: int) -> None:
+        self._controller = controller
+        self.work = work
+        self._released = False
+
+    def release(self) -> None:
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """Server-wide budget of concurrently computed work units.
+
+    A request larger than the whole budget is still admitted when
+    nothing else is running, so it cannot starve.
+    """
+
+    def __init__(self, capacity: int = GLOBAL_WORK_UNITS) -> None:
+        self.capacity = capacity
+        self._in_flight = 0
+        self._running = 0
+        self._cond = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        with self._cond:
+            return self._in_flight
+
+    def _fits(self, work: int) -> bool:
+        return self._running == 0 or self._in_flight + work <= self.capacity
+
+    def acquire(self,
+                work: int,
+                wait_s: Optional[float] = ADMISSION_WAIT_S,
+                poll: Optional[Callable[[], None]] = None) -> AdmissionTicket:
+        """Take `work` units of the budget.
+
+        Waits up to `wait_s` (None: indefinitely) for room, raising
+        `AdmissionTimeout` after that. `poll` is called about every
+        `POLL_S` while waiting; an exception from it aborts the wait.
+        """
+        deadline = None if wait_s is None else time.monotonic() + wait_s
+        with self._cond:
+            while not self._fits(work):
+                timeout = POLL_S
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionTimeout()
+                    timeout = min(timeout, remaining)
+                self._cond.wait(timeout)
+                if poll is not None:
+                    poll()
+            self._in_flight += work
+            self._running += 1
+        return AdmissionTicket(self, work)
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        with self._cond:
+            if ticket._released:
+                return
+            ticket._released = True
+            self._in_flight -= ticket.work
+            self._running -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self,
+              work: int,
+              wait_s: Optional[float] = ADMISSION_WAIT_S,
+              poll: Optional[Callable[[], None]] = None) -> Iterator[AdmissionTicket]:
+        """`acquire` for the duration of the block."""
+        ticket = self.acquire(work, wait_s, poll)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "capacity": self.capacity,
+                "in_flight_work_units": self._in_flight,
+                "running": self._running,
+            }
+
+
+admission = AdmissionController()
+
+
+def estimate(req: CoverageRequest,
+             output: str = "cells",
+             n_scenarios: int = 1) -> CoverageEstimate:
+    """Expected cost of `req` delivered as `output`: a `/coverage/calc`
+    format, "stream" (NDJSON), "summary" or "contours"; `n_scenarios`
+    variants of it evaluated together (`/coverage/scenarios`)."""
+    n_cells, work, memory, body = _cost(req, req.grid.step_m, output, n_scenarios)
+    reason = exceeded(n_cells, work, memory)
+    return CoverageEstimate(
+        n_cells=n_cells,
+        n_sites=len(req.sites),
+        work_units=work,
+        memory_bytes=memory,
+        response_bytes=body,
+        admitted=reason is None,
+        reason=reason,
+        suggested_step_m=(
+            None if reason is None
+            else _suggest_step(req, output, n_cells, work, memory, n_scenarios)
+        ),
+        max_cells=MAX_CELLS,
+        max_work_units=MAX_WORK_UNITS,
+        max_memory_bytes=MAX_MEMORY_BYTES,
+        in_flight_work_units=admission.in_flight,
+        global_work_units=admission.capacity,
+    )
+
+
+def check(req: CoverageRequest,
+          output: str = "cells",
+          n_scenarios: int = 1) -> CoverageEstimate:
+    """`estimate`, raising `OverBudget` when a per-request limit is exceeded."""
+    cost = estimate(req, output, n_scenarios)
+    if not cost.admitted:
+        raise OverBudget(cost)
+    return cost
@@ -0,0 +1,177 @@
+"""Cache of computed coverage results.
+
+Results are keyed by a canonical hash of the `CoverageRequest` and
+kept in an in-memory LRU bounded by `COVERAGE_CACHE_BYTES`. When
+`COVERAGE_CACHE_DIR` is set, results are also stored on disk (bounded
+by `COVERAGE_CACHE_DISK_BYTES`), so they survive restarts and are
+shared by all uvicorn workers on the host. Identical concurrent
+requests are coalesced into one computation.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from ..coverage_schemas import CoverageRequest
+from .byte_cache import ByteLRU, DiskLRU, SingleFlight
+from .coverage_engine import ENGINE_VERSION, RADIAL_TOLERANCE_DB, BestServer, ServerMetrics
+from .grid_service import Grid
+
+
+MEMORY_BUDGET_BYTES: int = int(os.getenv("COVERAGE_CACHE_BYTES", str(256 * 1024 * 1024)))
+DISK_DIR: Optional[str] = os.getenv("COVERAGE_CACHE_DIR") or None
+DISK_BUDGET_BYTES: int = int(os.getenv("COVERAGE_CACHE_DISK_BYTES", str(2 * 1024 ** 3)))
+
+# Entries are valid only for the engine output they were computed with,
+# so stale disk entries are ignored after an upgrade. Bump the format
+# part when the serialized layout changes.
+CACHE_VERSION = (2, ENGINE_VERSION, RADIAL_TOLERANCE_DB)
+
+CoverageResult = Tuple[Grid, BestServer]
+
+_GRID_ARRAYS = ("lats", "lons", "rows", "cols")
+_GRID_SCALARS = ("lat0", "lon0", "dlat_deg", "dlon_deg", "n_rows", "n_cols")
+_METRIC_ARRAYS = ("second_rx_level_dbm", "second_site_index", "server_count", "ci_db")
+
+
+def request_key(req: CoverageRequest) -> str:
+    """Canonical SHA-256 of a request (field order and whitespace free)."""
+    payload = json.dumps(
+        {"v": CACHE_VERSION, "req": req.model_dump(mode="json")},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _best_arrays(best: BestServer) -> Dict[str, np.ndarray]:
+    arrays = {"rx_level_dbm": best.rx_level_dbm, "site_index": best.site_index}
+    if best.metrics is not None:
+        arrays.update({name: getattr(best.metrics, name) for name in _METRIC_ARRAYS})
+    return arrays
+
+
+def _freeze(result: CoverageResult) -> CoverageResult:
+    """Make cached arrays read-only; they are shared between requests."""
+    grid, best = result
+    for arr in [getattr(grid, name) for name in _GRID_ARRAYS] + list(
+        _best_arrays(best).values()
+    ):
+        arr.flags.writeable = False
+    return result
+
+
+def result_nbytes(result: CoverageResult) -> int:
+    grid, best = result
+    return (
+        sum(getattr(grid, name).nbytes for name in _GRID_ARRAYS)
+        + sum(arr.nbytes for arr in _best_arrays(best).values())
+    )
+
+
+def dump_result(result: CoverageResult) -> bytes:
+    grid, best = result
+    buf = io.BytesIO()
+    np.savez(
+        buf,
+        geometry=np.array([getattr(grid, name) for name in _GRID_SCALARS], dtype=np.float64),
+        **_best_arrays(best),
+        **{name: getattr(grid, name) for name in _GRID_ARRAYS},
+    )
+    return buf.getvalue()
+
+
+def load_result(data: bytes) -> CoverageResult:
+    with np.load(io.BytesIO(data)) as npz:
+        lat0, lon0, dlat_deg, dlon_deg, n_rows, n_cols = npz["geometry"].tolist()
+        grid = Grid(
+            **{name: npz[name] for name in _GRID_ARRAYS},
+            lat0=lat0,
+            lon0=lon0,
+            dlat_deg=dlat_deg,
+            dlon_deg=dlon_deg,
+            n_rows=int(n_rows),
+            n_cols=int(n_cols),
+        )
+        metrics = None
+        if _METRIC_ARRAYS[0] in npz.files:
+            metrics = ServerMetrics(**{name: npz[name] for name in _METRIC_ARRAYS})
+        best = BestServer(
+            rx_level_dbm=npz["rx_level_dbm"],
+            site_index=npz["site_index"],
+            metrics=metrics,
+        )
+    return grid, best
+
+
+class CoverageCache:
+    """Two-tier (memory, optional disk) coverage result cache."""
+
+    def __init__(self,
+                 memory_budget_bytes: int = MEMORY_BUDGET_BYTES,
+                 disk_dir: Optional[str] = DISK_DIR,
+                 disk_budget_bytes: int = DISK_BUDGET_BYTES) -> None:
+        self.memory: ByteLRU[CoverageResult] = ByteLRU(memory_budget_bytes)
+        self.disk: Optional[DiskLRU] = (
+            DiskLRU(disk_dir, disk_budget_bytes, suffix=".npz") if disk_dir else None
+        )
+        self._flights = SingleFlight()
+        self.computed = 0
+
+    def get_or_compute(self,
+                       req: CoverageRequest,
+                       compute: Callable[[], CoverageResult],
+                       coalesce: bool = True) -> CoverageResult:
+        """Return the cached result or compute and store it.
+
+        With `coalesce=False` the caller never joins or leads a shared
+        computation, e.g. when `compute` may be aborted on its behalf.
+        """
+        key = request_key(req)
+        result = self.memory.get(key)
+        if result is not None:
+            return result
+        if not coalesce:
+            return self._load_or_compute(key, compute)
+        return self._flights.do(key, lambda: self._load_or_compute(key, compute))
+
+    def _load_or_compute(self,
+                         key: str,
+                         compute: Callable[[], CoverageResult]) -> CoverageResult:
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                result = _freeze(load_result(data))
+                self.memory.put(key, result, result_nbytes(result))
+                return result
+
+        result = _freeze(compute())
+        self.computed += 1
+        self.memory.put(key, result, result_nbytes(result))
+        if self.disk is not None:
+            self.disk.put(key, dump_result(result))
+        return result
+
+    def peek(self, req: CoverageRequest) -> Optional[CoverageResult]:
+        """Memory-tier lookup that never computes."""
+        return self.memory.get(request_key(req))
+
+    def clear(self) -> None:
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "coalesced": self._flights.coalesced,
+            "computed": self.computed,
+        }
+
+
+coverage_cache = CoverageCache()
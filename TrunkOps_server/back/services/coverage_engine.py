@@ -0,0 +1,632 @@
+"""Batched (NumPy) coverage engine.
+
+The scalar helpers in `propagation_service` evaluate one site at one
+point per call. This module computes the whole cells x sites
+distance and path-loss matrix in array form and reduces it to the
+best server per cell in one pass. Cells are processed in chunks so
+that the intermediate matrix never exceeds `CHUNK_ELEMENTS` values.
+
+With many sites the cells are grouped into tiles and each tile only
+evaluates the sites whose reach above `FLOOR_DBM` can touch it (see
+`site_index`). Cells where no candidate reaches the floor are
+re-evaluated against every site, so the result is identical to the
+exhaustive reduction.
+
+Path loss comes from the `propagation_models` registry, whose per-site
+terms are computed once per call. Every registered model is
+`k - b * log10(d_km)` per site, i.e. radial: only the distance depends
+on the cell. The per-pair trigonometry of the haversine formula is
+therefore avoided:
+
+* Cells x sites: cells and sites become unit vectors and one matrix
+  product gives the squared chord `q` of every pair; the distance is a
+  1-D function of `q`. Pairs so close that the rounding of `q` could
+  move the level by more than `RADIAL_TOLERANCE_DB` are recomputed
+  with the haversine formula, so every level is within
+  `RADIAL_TOLERANCE_DB` of `calc_rx_level`.
+* One site over a raster grid (`site_levels_on_grid`): the haversine
+  terms split into per-row and per-column factors, so trigonometry is
+  evaluated per row and column only. This path is exact.
+
+Terrain loss is added on top unchanged. With
+`COVERAGE_RADIAL_TOLERANCE_DB=0` every pair uses the same formula as
+`haversine_distance_km`, evaluated in float64, and results agree with
+`calc_rx_level` to within floating point rounding (well below
+`RX_LEVEL_TOLERANCE_DB`).
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..coverage_schemas import Site
+from .antenna_patterns import PATTERN_ARRAYS, PatternLoss
+from .grid_service import EARTH_RADIUS_KM, Grid, haversine_distance_km_np, unit_vectors
+from .propagation_models import get_model
+from .site_index import KM_PER_DEG, SiteIndex, site_reach_km
+from .terrain_service import TerrainLoss
+
+
+# Bump whenever the engine or a registered model gives different levels
+# for the same request; cached and stored results are keyed on it.
+ENGINE_VERSION = 2
+
+# Level reported for a cell when no site is available (matches the
+# historical scalar implementation).
+NO_SIGNAL_DBM = -200.0
+
+# Maximum absolute difference (dB) between the batched engine and the
+# scalar `calc_rx_level` reference with the chord fast path disabled.
+RX_LEVEL_TOLERANCE_DB = 1e-6
+
+# Error bound (dB) of the radial (chord) fast path; 0 disables it.
+RADIAL_TOLERANCE_DB: float = float(os.getenv("COVERAGE_RADIAL_TOLERANCE_DB", "0.0001"))
+
+# Bound on the absolute error of the squared chord from unit-vector dot
+# products (a few float64 ulps of 2, with margin).
+_CHORD_Q_ERROR = 4e-15
+
+# Upper bound on the number of cell x site values held in memory at once
+# (float64, so ~16 MB per intermediate array at the default).
+CHUNK_ELEMENTS: int = int(os.getenv("COVERAGE_CHUNK_ELEMENTS", "2000000"))
+
+# Level below which a site is considered useless when pruning.
+FLOOR_DBM: float = float(os.getenv("COVERAGE_FLOOR_DBM", "-120"))
+
+# Spatial pruning only pays off with enough sites.
+PRUNE_MIN_SITES: int = int(os.getenv("COVERAGE_PRUNE_MIN_SITES", "16"))
+
+# Approximate number of cells per pruning tile, and the edge of the
+# site index buckets.
+PRUNE_TILE_CELLS: int = int(os.getenv("COVERAGE_PRUNE_TILE_CELLS", "4096"))
+SITE_BUCKET_KM: float = float(os.getenv("COVERAGE_SITE_BUCKET_KM", "10"))
+
+# Extra loss (dB, >= 0) for target cells x the given site indices.
+ExtraLossFn = Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+
+
+def _extra_loss(sites: Sequence[Site],
+                rx_height_m: float,
+                uses_terrain: bool) -> Tuple[Optional[ExtraLossFn], int]:
+    """Terrain and antenna pattern losses of a site list (summed), and
+    the number of values they hold per cell x site."""
+    losses = []
+    weight = 1
+    if uses_terrain:
+        terrain = TerrainLoss(sites, rx_height_m)
+        if terrain.enabled:
+            losses.append(terrain)
+            weight = terrain.samples
+    pattern = PatternLoss(sites, rx_height_m)
+    if pattern.enabled:
+        losses.append(pattern)
+        weight = max(weight, PATTERN_ARRAYS)
+    if not losses:
+        return None, 1
+    if len(losses) == 1:
+        return losses[0], weight
+
+    def summed(lats: np.ndarray, lons: np.ndarray, site_ids: np.ndarray) -> np.ndarray:
+        total = losses[0](lats, lons, site_ids)
+        for loss in losses[1:]:
+            total += loss(lats, lons, site_ids)
+        return total
+
+    return summed, weight
+
+
+@dataclass
+class BestServer:
+    """Best-server reduction for a batch of cells.
+
+    `rx_level_dbm[i]` is the strongest level at cell `i` and
+    `site_index[i]` the index into the request's site list that
+    produced it (-1 when there are no sites).
+    """
+    rx_level_dbm: np.ndarray
+    site_index: np.ndarray
+    metrics: Optional["ServerMetrics"] = None
+
+
+@dataclass
+class ServerMetrics:
+    """Per-cell overlap and interference figures of a best-server run.
+
+    `second_*` describe the runner-up (`NO_SIGNAL_DBM` / -1 with a
+    single site), `server_count` is the number of sites at or above the
+    requested threshold and `ci_db` the best level over the summed
+    co-channel sites (same `frequency_mhz`), NaN without interferers.
+    """
+    second_rx_level_dbm: np.ndarray
+    second_site_index: np.ndarray
+    server_count: np.ndarray
+    ci_db: np.ndarray
+
+
+@dataclass
+class _MetricsSpec:
+    threshold_dbm: float
+    floor_dbm: float
+    frequency: np.ndarray
+
+
+def _exact_q(b_max: float, tolerance_db: float) -> float:
+    """Squared chord below which its rounding could cost more than the tolerance.
+
+    `q` carries an absolute error of about `_CHORD_Q_ERROR`, i.e. a
+    relative distance error of `_CHORD_Q_ERROR / (2 q)`, so the level
+    error `b * log10(1 + err)` stays below `tolerance_db` from here up.
+    """
+    return _CHORD_Q_ERROR * b_max / (2.0 * math.log(10.0) * tolerance_db)
+
+
+def _log_distance(lats: np.ndarray,
+                  lons: np.ndarray,
+                  site_lat: np.ndarray,
+                  site_lon: np.ndarray,
+                  b_max: float,
+                  tolerance_db: float) -> np.ndarray:
+    """`log10(max(d_km, 0.001))` for cells x sites.
+
+    With `tolerance_db == 0` every pair goes through the haversine
+    formula. Otherwise distances come from the squared chord `q`
+    between unit vectors (one matrix product, no per-pair trigonometry)
+    and only pairs closer than `_exact_q` are recomputed exactly, so
+    `b * log10(d_km)` is within `tolerance_db` for `b <= b_max`.
+    """
+    if tolerance_db <= 0:
+        d_km = haversine_distance_km_np(
+            site_lat[None, :], site_lon[None, :], lats[:, None], lons[:, None],
+        )
+        np.maximum(d_km, 0.001, out=d_km)
+        return np.log10(d_km, out=d_km)
+
+    # q = |u - v|^2 = 2 - 2 cos(central angle), d = 2 R asin(sqrt(q) / 2).
+    g = unit_vectors(lats, lons) @ unit_vectors(site_lat, site_lon).T
+    g *= -2.0
+    g += 2.0
+    np.maximum(g, 0.0, out=g)
+    near = g < _exact_q(b_max, tolerance_db)
+
+    np.sqrt(g, out=g)
+    g *= 0.5
+    np.minimum(g, 1.0, out=g)
+    np.arcsin(g, out=g)
+    g *= 2.0 * EARTH_RADIUS_KM
+    np.maximum(g, 0.001, out=g)
+    np.log10(g, out=g)
+
+    r, c = np.nonzero(near)
+    if r.size:
+        d_km = haversine_distance_km_np(lats[r], lons[r], site_lat[c], site_lon[c])
+        g[r, c] = np.log10(np.maximum(d_km, 0.001))
+    return g
+
+
+def _reduce(lats: np.ndarray,
+            lons: np.ndarray,
+            site_lat: np.ndarray,
+            site_lon: np.ndarray,
+            k: np.ndarray,
+            b: np.ndarray,
+            chunk_elements: int,
+            site_ids: Optional[np.ndarray] = None,
+            extra_loss: Optional[ExtraLossFn] = None,
+            loss_weight: int = 1,
+            metrics: Optional[_MetricsSpec] = None,
+            radial_tolerance_db: float = 0.0):
+    """Exhaustive best-server over the given sites, chunked by cells.
+
+    `extra_loss` is called with `site_ids` (the sites' indices in the
+    full request) and is subtracted from the Hata level. `loss_weight`
+    is the number of values it holds per cell x site and shrinks the
+    chunk accordingly.
+
+    With `metrics` the same pass also returns the runner-up (local
+    index, -1 if none), the number of sites at or above the threshold
+    and the summed power (mW) of the sites sharing the best server's
+    frequency that are at or above the floor.
+
+    `radial_tolerance_db` > 0 takes distances from unit-vector chords
+    (see `_log_distance`).
+    """
+    n_cells = lats.shape[0]
+    best_rx = np.empty(n_cells, dtype=np.float64)
+    best_idx = np.empty(n_cells, dtype=np.int32)
+    if site_ids is None:
+        site_ids = np.arange(len(k))
+    extras = None
+    if metrics is not None:
+        extras = (
+            np.empty(n_cells, dtype=np.float64),
+            np.empty(n_cells, dtype=np.int32),
+            np.empty(n_cells, dtype=np.int32),
+            np.empty(n_cells, dtype=np.float64),
+        )
+
+    b_max = max(float(np.abs(b).max()), 1e-6)
+    step = max(1, chunk_elements // (len(k) * max(loss_weight, 1)))
+    for start in range(0, n_cells, step):
+        stop = min(start + step, n_cells)
+        rx = _log_distance(
+            lats[start:stop], lons[start:stop], site_lat, site_lon,
+            b_max, radial_tolerance_db,
+        )
+        rx *= -b
+        rx += k
+        if extra_loss is not None:
+            rx -= extra_loss(lats[start:stop], lons[start:stop], site_ids)
+
+        idx = np.argmax(rx, axis=1)
+        best_idx[start:stop] = idx
+        best_rx[start:stop] = np.take_along_axis(rx, idx[:, None], axis=1)[:, 0]
+
+        if metrics is not None:
+            second_rx, second_idx, count, interference = extras
+            count[start:stop] = (rx >= metrics.threshold_dbm).sum(axis=1)
+            # Top-2: knock out the winner and take the next maximum.
+            co_channel = metrics.frequency[site_ids][None, :] == (
+                metrics.frequency[site_ids][idx][:, None]
+            )
+            np.put_along_axis(rx, idx[:, None], -np.inf, axis=1)
+            idx2 = np.argmax(rx, axis=1)
+            rx2 = np.take_along_axis(rx, idx2[:, None], axis=1)[:, 0]
+            found = np.isfinite(rx2)
+            second_rx[start:stop] = np.where(found, rx2, NO_SIGNAL_DBM)
+            second_idx[start:stop] = np.where(found, idx2, -1)
+            co_channel &= rx >= metrics.floor_dbm
+            interference[start:stop] = np.where(
+                co_channel, np.power(10.0, rx / 10.0), 0.0
+            ).sum(axis=1)
+
+    return best_rx, best_idx, extras
+
+
+def _reduce_pruned(lats: np.ndarray,
+                   lons: np.ndarray,
+                   site_lat: np.ndarray,
+                   site_lon: np.ndarray,
+                   k: np.ndarray,
+                   b: np.ndarray,
+                   chunk_elements: int,
+                   floor_dbm: float,
+                   tile_cells: int,
+                   extra_loss: Optional[ExtraLossFn] = None,
+                   loss_weight: int = 1,
+                   metrics: Optional[_MetricsSpec] = None,
+                   radial_tolerance_db: float = 0.0):
+    """Best-server with per-tile candidate sites from a `SiteIndex`.
+
+    Any site not returned for a tile is below `floor_dbm` at every
+    cell of that tile, so wherever the best candidate is at or above
+    the floor it is also the exhaustive winner. The remaining cells
+    fall back to the exhaustive reduction. Reach is derived from Hata
+    alone, which stays exact because `extra_loss` is never negative.
+    With `metrics` the runner-up must reach the floor as well.
+    """
+    n_cells = lats.shape[0]
+    best_rx = np.full(n_cells, -np.inf, dtype=np.float64)
+    best_idx = np.full(n_cells, -1, dtype=np.int32)
+    extras = None
+    if metrics is not None:
+        extras = (
+            np.full(n_cells, -np.inf, dtype=np.float64),
+            np.full(n_cells, -1, dtype=np.int32),
+            np.zeros(n_cells, dtype=np.int32),
+            np.zeros(n_cells, dtype=np.float64),
+        )
+
+    index = SiteIndex(
+        site_lat, site_lon, site_reach_km(k, b, floor_dbm), SITE_BUCKET_KM
+    )
+
+    lat_ref = float(lats.min())
+    lon_ref = float(lons.min())
+    cos_ref = max(np.cos(np.radians(np.abs(lats).max())), 0.01)
+
+    # Pick the tile edge from the mean cell spacing of the batch.
+    span_lat_km = (float(lats.max()) - lat_ref) * KM_PER_DEG
+    span_lon_km = (float(lons.max()) - lon_ref) * KM_PER_DEG * cos_ref
+    spacing_km = np.sqrt(max(span_lat_km * span_lon_km, 1e-6) / n_cells)
+    tile_km = max(np.sqrt(tile_cells) * spacing_km, 1e-3)
+    tile_dlat = tile_km / KM_PER_DEG
+    tile_dlon = tile_km / (KM_PER_DEG * cos_ref)
+
+    ti = np.floor((lats - lat_ref) / tile_dlat).astype(np.int64)
+    tj = np.floor((lons - lon_ref) / tile_dlon).astype(np.int64)
+    key = ti * (int(tj.max()) + 1) + tj
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    bounds = np.flatnonzero(np.diff(sorted_key)) + 1
+    starts = np.concatenate(([0], bounds))
+    stops = np.concatenate((bounds, [n_cells]))
+
+    def store(cells, sites, part):
+        rx, idx, part_extras = part
+        best_rx[cells] = rx
+        best_idx[cells] = sites[idx]
+        if part_extras is not None:
+            second_rx, second_idx, count, interference = part_extras
+            extras[0][cells] = second_rx
+            extras[1][cells] = np.where(second_idx >= 0, sites[second_idx], -1)
+            extras[2][cells] = count
+            extras[3][cells] = interference
+
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        cells = order[start:stop]
+        t_lat = lat_ref + (ti[cells[0]] + 0.5) * tile_dlat
+        t_lon = lon_ref + (tj[cells[0]] + 0.5) * tile_dlon
+        half_diag = float(
+            haversine_distance_km_np(t_lat, t_lon, lats[cells], lons[cells]).max()
+        )
+        cand = index.query(t_lat, t_lon, half_diag)
+        if cand.size == 0:
+            continue
+        store(cells, cand, _reduce(
+            lats[cells], lons[cells],
+            site_lat[cand], site_lon[cand], k[cand], b[cand],
+            chunk_elements, cand, extra_loss, loss_weight, metrics,
+            radial_tolerance_db,
+        ))
+
+    weak = best_rx < floor_dbm
+    if metrics is not None:
+        weak |= extras[0] < floor_dbm
+    weak = np.flatnonzero(weak)
+    if weak.size:
+        store(weak, np.arange(len(k)), _reduce(
+            lats[weak], lons[weak], site_lat, site_lon, k, b, chunk_elements,
+            None, extra_loss, loss_weight, metrics, radial_tolerance_db,
+        ))
+
+    return best_rx, best_idx, extras
+
+
+def best_server(lats: np.ndarray,
+                lons: np.ndarray,
+                sites: Sequence[Site],
+                rx_height_m: float,
+                model: str = "hata",
+                chunk_elements: int = CHUNK_ELEMENTS,
+                floor_dbm: float = FLOOR_DBM,
+                prune: bool | None = None,
+                server_threshold_dbm: Optional[float] = None,
+                radial_tolerance_db: float = RADIAL_TOLERANCE_DB) -> BestServer:
+    """Compute the best-server level for every (lat, lon) cell.
+
+    `model` is a name from `propagation_models.MODELS`; models with
+    `uses_terrain` also subtract the obstruction loss of `terrain_service`.
+    `prune` forces spatial pruning on or off; by default it is used
+    from `PRUNE_MIN_SITES` sites upwards. `radial_tolerance_db` bounds
+    the error of the chord distances; 0 uses haversine for every pair.
+
+    With `server_threshold_dbm` the result also carries `ServerMetrics`
+    from the same pass. Co-channel interferers below the floor (the
+    lower of `floor_dbm` and the threshold) are ignored, with or
+    without pruning.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n_cells = lats.shape[0]
+
+    if n_cells == 0 or not sites:
+        metrics = None
+        if server_threshold_dbm is not None:
+            metrics = ServerMetrics(
+                second_rx_level_dbm=np.full(n_cells, NO_SIGNAL_DBM, dtype=np.float64),
+                second_site_index=np.full(n_cells, -1, dtype=np.int32),
+                server_count=np.zeros(n_cells, dtype=np.int32),
+                ci_db=np.full(n_cells, np.nan, dtype=np.float64),
+            )
+        return BestServer(
+            rx_level_dbm=np.full(n_cells, NO_SIGNAL_DBM, dtype=np.float64),
+            site_index=np.full(n_cells, -1, dtype=np.int32),
+            metrics=metrics,
+        )
+
+    site_lat = np.array([s.lat for s in sites], dtype=np.float64)
+    site_lon = np.array([s.lon for s in sites], dtype=np.float64)
+    propagation = get_model(model)
+    terms = propagation.site_terms(sites, rx_height_m)
+    k, b = terms.k, terms.b
+
+    extra_loss, loss_weight = _extra_loss(sites, rx_height_m, propagation.uses_terrain)
+
+    spec: Optional[_MetricsSpec] = None
+    if server_threshold_dbm is not None:
+        floor_dbm = min(floor_dbm, server_threshold_dbm)
+        spec = _MetricsSpec(
+            threshold_dbm=server_threshold_dbm,
+            floor_dbm=floor_dbm,
+            frequency=np.array([s.frequency_mhz for s in sites], dtype=np.float64),
+        )
+
+    if prune is None:
+        prune = len(sites) >= PRUNE_MIN_SITES
+    if prune:
+        best_rx, best_idx, extras = _reduce_pruned(
+            lats, lons, site_lat, site_lon, k, b,
+            chunk_elements, floor_dbm, PRUNE_TILE_CELLS,
+            extra_loss, loss_weight, spec, radial_tolerance_db,
+        )
+    else:
+        best_rx, best_idx, extras = _reduce(
+            lats, lons, site_lat, site_lon, k, b, chunk_elements,
+            None, extra_loss, loss_weight, spec, radial_tolerance_db,
+        )
+
+    metrics = None
+    if extras is not None:
+        second_rx, second_idx, count, interference = extras
+        with np.errstate(divide="ignore"):
+            ci_db = np.where(
+                interference > 0, best_rx - 10.0 * np.log10(interference), np.nan
+            )
+        metrics = ServerMetrics(
+            second_rx_level_dbm=second_rx,
+            second_site_index=second_idx,
+            server_count=count,
+            ci_db=ci_db,
+        )
+
+    return BestServer(rx_level_dbm=best_rx, site_index=best_idx, metrics=metrics)
+
+
+@dataclass
+class Scenario:
+    """Variant of a shared site list for `best_server_scenarios`.
+
+    `sites` has the shared list's length and order; its sites may
+    differ in radio fields (power, gain, height, frequency, antenna)
+    but not in position. `enabled` masks sites switched off.
+    """
+    sites: Sequence[Site]
+    rx_height_m: float
+    enabled: Optional[np.ndarray] = None
+
+
+def best_server_scenarios(lats: np.ndarray,
+                          lons: np.ndarray,
+                          scenarios: Sequence[Scenario],
+                          model: str = "hata",
+                          chunk_elements: int = CHUNK_ELEMENTS,
+                          radial_tolerance_db: float = RADIAL_TOLERANCE_DB) -> List[BestServer]:
+    """Best server of several scenarios over the same cells.
+
+    The cells x sites distances are computed once per chunk and shared;
+    each scenario then only applies its per-site terms (computed once
+    per distinct set of terms), its enabled mask and, with terrain
+    models, its own obstruction loss. Each result equals `best_server`
+    with `prune=False` on the scenario's enabled sites, with
+    `site_index` into the full site list.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n_cells = lats.shape[0]
+    n_sites = len(scenarios[0].sites) if scenarios else 0
+    results = [
+        BestServer(
+            rx_level_dbm=np.full(n_cells, NO_SIGNAL_DBM, dtype=np.float64),
+            site_index=np.full(n_cells, -1, dtype=np.int32),
+        )
+        for _ in scenarios
+    ]
+    if n_cells == 0 or n_sites == 0:
+        return results
+
+    shared = scenarios[0].sites
+    site_lat = np.array([s.lat for s in shared], dtype=np.float64)
+    site_lon = np.array([s.lon for s in shared], dtype=np.float64)
+    propagation = get_model(model)
+
+    terms_by_key = {}
+    plans = []
+    loss_weight = 1
+    for scenario, result in zip(scenarios, results):
+        active = np.arange(n_sites)
+        if scenario.enabled is not None:
+            active = np.flatnonzero(scenario.enabled)
+        if active.size == 0:
+            continue
+        key = (scenario.rx_height_m, tuple(
+            (s.tx_power_dbm, s.antenna_gain_dbi, s.antenna_height_m, s.frequency_mhz)
+            for s in scenario.sites
+        ))
+        terms = terms_by_key.get(key)
+        if terms is None:
+            terms = terms_by_key[key] = propagation.site_terms(
+                scenario.sites, scenario.rx_height_m
+            )
+        extra_loss, weight = _extra_loss(
+            scenario.sites, scenario.rx_height_m, propagation.uses_terrain
+        )
+        loss_weight = max(loss_weight, weight)
+        plans.append((active, terms.k[active], terms.b[active], extra_loss, result))
+
+    if not plans:
+        return results
+    b_max = max(max(float(np.abs(b).max()) for _, _, b, _, _ in plans), 1e-6)
+    step = max(1, chunk_elements // (n_sites * loss_weight))
+    level = np.empty(min(step, n_cells), dtype=np.float64)
+    better = np.empty(min(step, n_cells), dtype=bool)
+    for start in range(0, n_cells, step):
+        stop = min(start + step, n_cells)
+        n = stop - start
+        # Sites x cells (distance is symmetric), so each site's row is
+        # contiguous for the running maximum below.
+        log_d = _log_distance(
+            site_lat, site_lon, lats[start:stop], lons[start:stop],
+            b_max, radial_tolerance_db,
+        )
+        for active, k, b, extra_loss, result in plans:
+            loss = None
+            if extra_loss is not None:
+                loss = extra_loss(lats[start:stop], lons[start:stop], active)
+            best_rx = result.rx_level_dbm[start:stop]
+            best_idx = result.site_index[start:stop]
+            # Strict `>` keeps the first maximum, like `argmax`.
+            for j, site in enumerate(active.tolist()):
+                np.multiply(log_d[site], -b[j], out=level[:n])
+                level[:n] += k[j]
+                if loss is not None:
+                    level[:n] -= loss[:, j]
+                if j == 0:
+                    best_rx[:] = level[:n]
+                    best_idx[:] = site
+                    continue
+                np.greater(level[:n], best_rx, out=better[:n])
+                np.copyto(best_idx, site, where=better[:n])
+                np.maximum(best_rx, level[:n], out=best_rx)
+
+    return results
+
+
+def site_levels_on_grid(grid: Grid,
+                        site: Site,
+                        rx_height_m: float,
+                        model: str = "hata") -> np.ndarray:
+    """Level of a single site at every point of `grid`.
+
+    On the lat/lon raster `sin^2(dlat/2)` and `cos(lat)` only vary per
+    row and `sin^2(dlon/2)` per column, so each cell costs three
+    lookups plus the radial part (`asin`, `log10`). A directional
+    site's pattern loss is subtracted chunk by chunk. Terrain-aware
+    models go through `best_server`.
+    """
+    propagation = get_model(model)
+    if propagation.uses_terrain:
+        return best_server(grid.lats, grid.lons, [site], rx_height_m, model).rx_level_dbm
+    terms = propagation.site_terms([site], rx_height_m)
+
+    phi = np.radians(grid.lat0 + np.arange(grid.n_rows, dtype=np.float64) * grid.dlat_deg)
+    lam = np.radians(grid.lon0 + np.arange(grid.n_cols, dtype=np.float64) * grid.dlon_deg)
+    phi_s = math.radians(site.lat)
+    row_term = np.sin((phi - phi_s) / 2.0) ** 2
+    row_factor = np.cos(phi) * math.cos(phi_s)
+    col_term = np.sin((lam - math.radians(site.lon)) / 2.0) ** 2
+
+    # Haversine: d = 2 R asin(sqrt(a)).
+    a = row_factor[grid.rows] * col_term[grid.cols]
+    a += row_term[grid.rows]
+    np.clip(a, 0.0, 1.0, out=a)
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2.0 * EARTH_RADIUS_KM
+    np.maximum(a, 0.001, out=a)
+    np.log10(a, out=a)
+    a *= -terms.b[0]
+    a += terms.k[0]
+
+    pattern = PatternLoss([site], rx_height_m)
+    if pattern.enabled:
+        only = np.zeros(1, dtype=np.int64)
+        step = max(1, CHUNK_ELEMENTS // PATTERN_ARRAYS)
+        for start in range(0, len(grid), step):
+            stop = min(start + step, len(grid))
+            a[start:stop] -= pattern(grid.lats[start:stop], grid.lons[start:stop], only)[:, 0]
+    return a
@@ -0,0 +1,185 @@
+"""Background coverage jobs.
+
+Long coverage runs are submitted as jobs and computed by a bounded
+thread pool (the heavy lifting still happens in the coverage process
+pool), so they neither hold an HTTP request open nor occupy a web
+threadpool slot. Jobs report progress, can be cancelled
+cooperatively and are bounded in number (`COVERAGE_MAX_JOBS`) and age
+(`COVERAGE_JOB_TTL_S`, counted from completion).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from ..coverage_schemas import CoverageJobStatus, CoverageRequest
+from .coverage_cache import CoverageResult
+
+
+JOB_WORKERS: int = int(os.getenv("COVERAGE_JOB_WORKERS", "2"))
+MAX_JOBS: int = int(os.getenv("COVERAGE_MAX_JOBS", "100"))
+JOB_TTL_S: int = int(os.getenv("COVERAGE_JOB_TTL_S", "3600"))
+
+ProgressFn = Callable[[int, int], None]
+ComputeFn = Callable[[CoverageRequest, ProgressFn], CoverageResult]
+
+_FINISHED = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback to abort a cancelled job."""
+
+
+class TooManyJobs(Exception):
+    """No free job slot; every stored job is still queued or running."""
+
+
+class CoverageJob:
+    def __init__(self, req: CoverageRequest) -> None:
+        self.id = uuid.uuid4().hex
+        self.req = req
+        self.status = "queued"
+        self.done_cells = 0
+        self.n_cells: Optional[int] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.result: Optional[CoverageResult] = None
+        self.cancel_requested = threading.Event()
+        self.future: Optional[Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED
+
+    def to_status(self) -> CoverageJobStatus:
+        if self.status == "done":
+            progress = 100.0
+        elif self.n_cells:
+            progress = 100.0 * self.done_cells / self.n_cells
+        else:
+            progress = 0.0
+        return CoverageJobStatus(
+            id=self.id,
+            status=self.status,
+            progress_percent=round(progress, 2),
+            n_cells=self.n_cells,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            error=self.error,
+        )
+
+
+class CoverageJobManager:
+    """Registry and executor of coverage jobs."""
+
+    def __init__(self,
+                 workers: int = JOB_WORKERS,
+                 max_jobs: int = MAX_JOBS,
+                 ttl_s: int = JOB_TTL_S) -> None:
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.ttl = timedelta(seconds=ttl_s)
+        self._jobs: Dict[str, CoverageJob] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="coverage-job"
+            )
+        return self._executor
+
+    def _purge(self) -> None:
+        """Drop expired jobs, then the oldest finished ones over the cap."""
+        now = datetime.utcnow()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at and now - job.finished_at > self.ttl:
+                del self._jobs[job_id]
+        if len(self._jobs) < self.max_jobs:
+            return
+        finished: List[CoverageJob] = sorted(
+            (job for job in self._jobs.values() if job.finished),
+            key=lambda job: job.finished_at or job.created_at,
+        )
+        for job in finished[: len(self._jobs) - self.max_jobs + 1]:
+            del self._jobs[job.id]
+
+    def submit(self, req: CoverageRequest, compute: ComputeFn) -> CoverageJob:
+        with self._lock:
+            self._purge()
+            if len(self._jobs) >= self.max_jobs:
+                raise TooManyJobs()
+            job = CoverageJob(req)
+            self._jobs[job.id] = job
+            job.future = self._get_executor().submit(self._run, job, compute)
+        return job
+
+    def get(self, job_id: str) -> Optional[CoverageJob]:
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[CoverageJob]:
+        """Cancel a pending or running job; forget a finished one."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.finished:
+                del self._jobs[job_id]
+                return job
+            job.cancel_requested.set()
+            if job.future is not None and job.future.cancel():
+                self._finish(job, "cancelled")
+            return job
+
+    def _finish(self, job: CoverageJob, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.utcnow()
+
+    def _run(self, job: CoverageJob, compute: ComputeFn) -> None:
+        if job.cancel_requested.is_set():
+            self._finish(job, "cancelled")
+            return
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+
+        def progress(done: int, total: int) -> None:
+            job.done_cells = done
+            job.n_cells = total
+            if job.cancel_requested.is_set():
+                raise JobCancelled()
+
+        try:
+            result = compute(job.req, progress)
+        except JobCancelled:
+            self._finish(job, "cancelled")
+            return
+        except Exception as exc:
+            self._finish(job, "failed", error=str(exc) or type(exc).__name__)
+            return
+        job.result = result
+        job.n_cells = len(result[0])
+        job.done_cells = job.n_cells
+        self._finish(job, "done")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel_requested.set()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+job_manager = CoverageJobManager()
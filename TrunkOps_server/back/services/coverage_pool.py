@@ -0,0 +1,224 @@
+"""Multi-core tiled coverage computation.
+
+Large grids are split into contiguous tiles of cells (row bands of
+the raster, so pruning stays local) and computed in a persistent
+process pool. Cell coordinates and results live in shared-memory
+arrays: workers read their slice of the inputs and write their slice
+of the outputs in place, so only tile bounds and the site list are
+pickled.
+
+Configuration (environment variables):
+
+* `COVERAGE_WORKERS` - worker processes; 0 or 1 disables the pool.
+* `COVERAGE_POOL_TILE_CELLS` - cells per task.
+* `COVERAGE_POOL_MIN_CELLS` - smaller grids are computed in-process.
+* `COVERAGE_POOL_START_METHOD` - multiprocessing start method.
+"""
+
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..coverage_schemas import Site
+from .coverage_engine import BestServer, ServerMetrics, best_server
+
+
+WORKERS: int = int(os.getenv("COVERAGE_WORKERS", str(os.cpu_count() or 1)))
+TILE_CELLS: int = int(os.getenv("COVERAGE_POOL_TILE_CELLS", "65536"))
+MIN_CELLS: int = int(os.getenv("COVERAGE_POOL_MIN_CELLS", "200000"))
+START_METHOD: str = os.getenv("COVERAGE_POOL_START_METHOD", "spawn")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Shared-memory result arrays: best server, then `ServerMetrics` fields.
+_OUTPUTS = (("rx_level_dbm", np.float64), ("site_index", np.int32))
+_METRIC_OUTPUTS = (
+    ("second_rx_level_dbm", np.float64),
+    ("second_site_index", np.int32),
+    ("server_count", np.int32),
+    ("ci_db", np.float64),
+)
+
+
+def _outputs(with_metrics: bool):
+    return _OUTPUTS + _METRIC_OUTPUTS if with_metrics else _OUTPUTS
+
+
+def _result_arrays(result: BestServer):
+    arrays = [result.rx_level_dbm, result.site_index]
+    if result.metrics is not None:
+        arrays += [getattr(result.metrics, name) for name, _ in _METRIC_OUTPUTS]
+    return arrays
+
+
+def _assemble(arrays: List[np.ndarray]) -> BestServer:
+    metrics = None
+    if len(arrays) > len(_OUTPUTS):
+        metrics = ServerMetrics(*arrays[len(_OUTPUTS):])
+    return BestServer(arrays[0], arrays[1], metrics)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the shared worker pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context(START_METHOD),
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the worker pool (called on application shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _discard_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _compute_tile(names: Tuple[str, ...],
+                  n_cells: int,
+                  start: int,
+                  stop: int,
+                  sites: List[Site],
+                  rx_height_m: float,
+                  model: str,
+                  server_threshold_dbm: Optional[float] = None) -> int:
+    """Worker entry point: compute cells [start, stop) in place."""
+    # Workers share the parent's resource tracker, so attaching here does
+    # not transfer ownership; the parent unlinks the blocks.
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    try:
+        lats = np.ndarray((n_cells,), dtype=np.float64, buffer=blocks[0].buf)
+        lons = np.ndarray((n_cells,), dtype=np.float64, buffer=blocks[1].buf)
+        outputs = _outputs(server_threshold_dbm is not None)
+
+        result = best_server(
+            lats[start:stop], lons[start:stop], sites, rx_height_m, model,
+            server_threshold_dbm=server_threshold_dbm,
+        )
+        for shm, (_, dtype), values in zip(blocks[2:], outputs, _result_arrays(result)):
+            np.ndarray((n_cells,), dtype=dtype, buffer=shm.buf)[start:stop] = values
+        del lats, lons
+    finally:
+        for shm in blocks:
+            shm.close()
+    return stop - start
+
+
+def tile_bounds(n_cells: int, tile_cells: int = TILE_CELLS) -> List[Tuple[int, int]]:
+    """Split `n_cells` into contiguous `[start, stop)` tiles."""
+    tile_cells = max(1, tile_cells)
+    return [
+        (start, min(start + tile_cells, n_cells))
+        for start in range(0, n_cells, tile_cells)
+    ]
+
+
+def best_server_tiled(lats: np.ndarray,
+                      lons: np.ndarray,
+                      sites: Sequence[Site],
+                      rx_height_m: float,
+                      model: str = "hata",
+                      workers: int = WORKERS,
+                      tile_cells: int = TILE_CELLS,
+                      min_cells: int = MIN_CELLS,
+                      on_tile: Optional[Callable[[int, int], None]] = None,
+                      server_threshold_dbm: Optional[float] = None) -> BestServer:
+    """`best_server` spread over the process pool for large grids.
+
+    Small grids, an empty site list or `workers <= 1` run in-process.
+    `on_tile(done_cells, total_cells)` is called as tiles complete; an
+    exception raised from it aborts the computation.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n_cells = lats.shape[0]
+    outputs = _outputs(server_threshold_dbm is not None)
+
+    if workers <= 1 or n_cells < max(min_cells, 1) or not sites:
+        if on_tile is None:
+            return best_server(
+                lats, lons, sites, rx_height_m, model,
+                server_threshold_dbm=server_threshold_dbm,
+            )
+        # Still go tile by tile so callers get progress (and can abort
+        # from the callback) without a pool.
+        arrays = [np.empty(n_cells, dtype=dtype) for _, dtype in outputs]
+        for start, stop in tile_bounds(n_cells, tile_cells):
+            part = best_server(
+                lats[start:stop], lons[start:stop], sites, rx_height_m, model,
+                server_threshold_dbm=server_threshold_dbm,
+            )
+            for out, values in zip(arrays, _result_arrays(part)):
+                out[start:stop] = values
+            on_tile(stop, n_cells)
+        if n_cells == 0:
+            on_tile(0, 0)
+        return _assemble(arrays)
+
+    sizes = [8 * n_cells, 8 * n_cells] + [
+        np.dtype(dtype).itemsize * n_cells for _, dtype in outputs
+    ]
+    blocks = [shared_memory.SharedMemory(create=True, size=size) for size in sizes]
+    try:
+        np.ndarray((n_cells,), dtype=np.float64, buffer=blocks[0].buf)[:] = lats
+        np.ndarray((n_cells,), dtype=np.float64, buffer=blocks[1].buf)[:] = lons
+        names = tuple(shm.name for shm in blocks)
+
+        pool = get_pool()
+        site_list = list(sites)
+        # Cap the number of tasks so scheduling overhead stays small.
+        tile_cells = max(tile_cells, math.ceil(n_cells / (workers * 64)))
+        futures = [
+            pool.submit(
+                _compute_tile, names, n_cells, start, stop,
+                site_list, rx_height_m, model, server_threshold_dbm,
+            )
+            for start, stop in tile_bounds(n_cells, tile_cells)
+        ]
+        done = 0
+        try:
+            for future in as_completed(futures):
+                done += future.result()
+                if on_tile is not None:
+                    on_tile(done, n_cells)
+        except BrokenProcessPool:
+            _discard_pool()
+            raise
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+        arrays = [
+            np.ndarray((n_cells,), dtype=dtype, buffer=shm.buf).copy()
+            for shm, (_, dtype) in zip(blocks[2:], outputs)
+        ]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return _assemble(arrays)
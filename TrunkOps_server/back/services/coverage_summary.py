@@ -0,0 +1,165 @@
+"""Streaming area statistics of coverage results.
+
+`CoverageSummaryAccumulator` folds best-server results band by band
+into class areas, a fine level histogram and running min/max/mean,
+so a summary never needs the per-cell list (or even the whole grid)
+in memory. Cells are weighted by their area, which shrinks with
+latitude on the lat/lon grid. Percentiles are read from the fine
+histogram (`HIST_RESOLUTION_DB`) with linear interpolation inside a
+bin.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+
+from ..coverage_schemas import (
+    CoverageClassThresholds,
+    CoverageHistogram,
+    CoveragePercentile,
+    CoverageSummary,
+)
+from .byte_cache import ByteLRU
+from .coverage_engine import NO_SIGNAL_DBM
+from .grid_service import KM_PER_DEG_LAT, Grid
+
+
+CACHE_BYTES: int = int(os.getenv("COVERAGE_SUMMARY_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+HIST_MIN_DBM = NO_SIGNAL_DBM
+HIST_MAX_DBM = 50.0
+HIST_RESOLUTION_DB = 0.1
+
+# Class bounds derived from a device sensitivity: the critical class
+# starts at the sensitivity, degraded and stable this much above it.
+DEGRADED_MARGIN_DB = 15.0
+STABLE_MARGIN_DB = 30.0
+
+
+def thresholds_from_sensitivity(sensitivity_dbm: float) -> CoverageClassThresholds:
+    return CoverageClassThresholds(
+        stable_dbm=sensitivity_dbm + STABLE_MARGIN_DB,
+        degraded_dbm=sensitivity_dbm + DEGRADED_MARGIN_DB,
+        critical_dbm=sensitivity_dbm,
+    )
+
+
+def cell_area_km2(grid: Grid) -> np.ndarray:
+    """Surface area represented by each grid point."""
+    return (
+        (grid.dlat_deg * KM_PER_DEG_LAT)
+        * (grid.dlon_deg * KM_PER_DEG_LAT)
+        * np.cos(np.radians(grid.lats))
+    )
+
+
+class CoverageSummaryAccumulator:
+    """Running area statistics over batches of (grid, levels)."""
+
+    def __init__(self, thresholds: CoverageClassThresholds) -> None:
+        self.thresholds = thresholds
+        self.n_bins = int(round((HIST_MAX_DBM - HIST_MIN_DBM) / HIST_RESOLUTION_DB))
+        self.hist = np.zeros(self.n_bins, dtype=np.float64)
+        # Area of [uncovered, critical, degraded, stable].
+        self.class_area = np.zeros(4, dtype=np.float64)
+        self.bounds = np.array(
+            [thresholds.critical_dbm, thresholds.degraded_dbm, thresholds.stable_dbm]
+        )
+        self.n_cells = 0
+        self.area = 0.0
+        self.level_area = 0.0
+        self.min_dbm = math.inf
+        self.max_dbm = -math.inf
+
+    def add(self, grid: Grid, rx_level_dbm: np.ndarray) -> None:
+        if len(grid) == 0:
+            return
+        area = cell_area_km2(grid)
+        self.n_cells += len(grid)
+        self.area += float(area.sum())
+        self.level_area += float((area * rx_level_dbm).sum())
+        self.min_dbm = min(self.min_dbm, float(rx_level_dbm.min()))
+        self.max_dbm = max(self.max_dbm, float(rx_level_dbm.max()))
+
+        classes = np.searchsorted(self.bounds, rx_level_dbm, side="right")
+        self.class_area += np.bincount(classes, weights=area, minlength=4)
+        bins = np.clip(
+            ((rx_level_dbm - HIST_MIN_DBM) / HIST_RESOLUTION_DB).astype(np.int64),
+            0, self.n_bins - 1,
+        )
+        self.hist += np.bincount(bins, weights=area, minlength=self.n_bins)
+
+    def _percentile(self, percent: float) -> float:
+        target = self.area * min(max(percent, 0.0), 100.0) / 100.0
+        cum = np.cumsum(self.hist)
+        i = int(np.searchsorted(cum, target, side="left"))
+        i = min(i, self.n_bins - 1)
+        before = cum[i - 1] if i > 0 else 0.0
+        frac = (target - before) / self.hist[i] if self.hist[i] > 0 else 0.0
+        level = HIST_MIN_DBM + (i + frac) * HIST_RESOLUTION_DB
+        return min(max(level, self.min_dbm), self.max_dbm)
+
+    def _histogram(self, step_db: float) -> CoverageHistogram:
+        factor = max(1, int(round(step_db / HIST_RESOLUTION_DB)))
+        if self.n_cells == 0:
+            return CoverageHistogram(
+                start_dbm=HIST_MIN_DBM,
+                step_db=round(factor * HIST_RESOLUTION_DB, 6),
+                area_km2=[],
+            )
+        nz = np.flatnonzero(self.hist)
+        first = (int(nz[0]) // factor) * factor
+        last = int(nz[-1]) + 1
+        trimmed = self.hist[first:last]
+        pad = (-trimmed.size) % factor
+        binned = np.pad(trimmed, (0, pad)).reshape(-1, factor).sum(axis=1)
+        return CoverageHistogram(
+            start_dbm=round(HIST_MIN_DBM + first * HIST_RESOLUTION_DB, 6),
+            step_db=round(factor * HIST_RESOLUTION_DB, 6),
+            area_km2=binned.tolist(),
+        )
+
+    def summary(self,
+                histogram_step_db: float = 1.0,
+                percentiles: Sequence[float] = ()) -> CoverageSummary:
+        shares = (
+            100.0 * self.class_area / self.area if self.area > 0
+            else np.zeros(4)
+        )
+        empty = self.n_cells == 0
+        return CoverageSummary(
+            n_cells=self.n_cells,
+            area_km2=self.area,
+            thresholds=self.thresholds,
+            uncovered_percent=float(shares[0]),
+            critical_percent=float(shares[1]),
+            degraded_percent=float(shares[2]),
+            stable_percent=float(shares[3]),
+            min_rx_level_dbm=None if empty else self.min_dbm,
+            max_rx_level_dbm=None if empty else self.max_dbm,
+            mean_rx_level_dbm=None if empty else self.level_area / self.area,
+            percentiles=[] if empty else [
+                CoveragePercentile(percent=p, rx_level_dbm=self._percentile(p))
+                for p in percentiles
+            ],
+            histogram=self._histogram(histogram_step_db),
+        )
+
+
+def resolve_thresholds(thresholds: Optional[CoverageClassThresholds],
+                       sensitivity_dbm: Optional[float]) -> CoverageClassThresholds:
+    """Explicit thresholds, else sensitivity-based ones, else the defaults."""
+    if thresholds is not None:
+        return thresholds
+    if sensitivity_dbm is not None:
+        return thresholds_from_sensitivity(sensitivity_dbm)
+    return CoverageClassThresholds()
+
+
+# Finished summaries by request key; they are small, so repeated
+# dashboard queries are answered without touching the engine.
+summary_cache: ByteLRU[CoverageSummary] = ByteLRU(CACHE_BYTES)
@@ -1,13 +1,26 @@
 from __future__ import annotations
 
 import math
-from typing import List, Tuple
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.0
+
+# Number of grid rows whose distance mask is evaluated at once.
+MASK_ROWS_PER_BLOCK = 256
+
+# Raster rows per band when a grid is computed and streamed band by band.
+STREAM_ROWS_PER_BLOCK = 64
 
 
 def haversine_distance_km(lat1: float, lon1: float,
                           lat2: float, lon2: float) -> float:
     """Great-circle distance between two points (in kilometers)."""
-    R = 6371.0
+    R = EARTH_RADIUS_KM
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
     a = (
@@ -20,6 +33,178 @@ def haversine_distance_km(lat1: float, lon1: float,
     return R * c
 
 
+def haversine_distance_km_np(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized `haversine_distance_km`; arguments broadcast."""
+    dlat = np.radians(np.asarray(lat2) - np.asarray(lat1))
+    dlon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(np.radians(lat1))
+        * np.cos(np.radians(lat2))
+        * np.sin(dlon / 2) ** 2
+    )
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def unit_vectors(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Points on the unit sphere, shape (n, 3) (x towards lon 0, z north)."""
+    phi = np.radians(lats)
+    lam = np.radians(lons)
+    out = np.empty((phi.shape[0], 3), dtype=np.float64)
+    cos_phi = np.cos(phi)
+    np.multiply(cos_phi, np.cos(lam), out=out[:, 0])
+    np.multiply(cos_phi, np.sin(lam), out=out[:, 1])
+    np.sin(phi, out=out[:, 2])
+    return out
+
+
+@dataclass
+class Grid:
+    """In-circle grid points stored as compact arrays.
+
+    The points are a subset of a regular lat/lon raster with origin
+    (`lat0`, `lon0`), spacing (`dlat_deg`, `dlon_deg`) and shape
+    (`n_rows`, `n_cols`). `rows`/`cols` give the raster index of each
+    point, so `lat0 + rows * dlat_deg == lats`.
+    """
+    lats: np.ndarray
+    lons: np.ndarray
+    rows: np.ndarray
+    cols: np.ndarray
+    lat0: float
+    lon0: float
+    dlat_deg: float
+    dlon_deg: float
+    n_rows: int
+    n_cols: int
+
+    def __len__(self) -> int:
+        return int(self.lats.shape[0])
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.n_rows, self.n_cols
+
+    def to_raster(self, values: np.ndarray, fill: float = np.nan) -> np.ndarray:
+        """Scatter per-point `values` into a (n_rows, n_cols) raster."""
+        raster = np.full(self.shape, fill, dtype=np.asarray(values).dtype)
+        raster[self.rows, self.cols] = values
+        return raster
+
+
+def _grid_geometry(center_lat: float,
+                   center_lon: float,
+                   radius_km: float,
+                   step_m: float) -> Tuple[float, float, float, float, int, int]:
+    """Raster origin, spacing and shape of the bounding box of the circle."""
+    km_per_deg_lon = KM_PER_DEG_LAT * math.cos(math.radians(center_lat))
+
+    step_km = step_m / 1000.0
+
+    dlat_deg = step_km / KM_PER_DEG_LAT
+    dlon_deg = step_km / km_per_deg_lon
+
+    max_dlat_deg = radius_km / KM_PER_DEG_LAT
+    max_dlon_deg = radius_km / km_per_deg_lon
+
+    lat0 = center_lat - max_dlat_deg
+    lon0 = center_lon - max_dlon_deg
+
+    # A small epsilon keeps the far edge that the old `<=` loop included.
+    n_rows = int(math.floor(2 * max_dlat_deg / dlat_deg + 1e-9)) + 1
+    n_cols = int(math.floor(2 * max_dlon_deg / dlon_deg + 1e-9)) + 1
+
+    return lat0, lon0, dlat_deg, dlon_deg, n_rows, n_cols
+
+
+def grid_shape(center_lat: float, radius_km: float, step_m: float) -> Tuple[int, int]:
+    """`(n_rows, n_cols)` of the raster `build_grid(...)` would use."""
+    *_, n_rows, n_cols = _grid_geometry(center_lat, 0.0, radius_km, step_m)
+    return n_rows, n_cols
+
+
+def estimate_cell_count(center_lat: float, radius_km: float, step_m: float) -> int:
+    """Approximate `len(build_grid(...))` without building the grid."""
+    n_rows, n_cols = grid_shape(center_lat, radius_km, step_m)
+    return int(math.ceil(n_rows * n_cols * math.pi / 4.0))
+
+
+def iter_grid_blocks(center_lat: float,
+                     center_lon: float,
+                     radius_km: float,
+                     step_m: float,
+                     rows_per_block: int = MASK_ROWS_PER_BLOCK) -> Iterator[Grid]:
+    """
+    Yield the in-circle grid as consecutive bands of raster rows.
+
+    Every block shares the geometry of the full raster (`rows` are
+    absolute indices), so memory stays bounded by `rows_per_block`
+    regardless of the grid size. Empty bands are skipped.
+    """
+    lat0, lon0, dlat_deg, dlon_deg, n_rows, n_cols = _grid_geometry(
+        center_lat, center_lon, radius_km, step_m
+    )
+    col_lons = lon0 + np.arange(n_cols, dtype=np.float64) * dlon_deg
+
+    for start in range(0, n_rows, max(1, rows_per_block)):
+        stop = min(start + max(1, rows_per_block), n_rows)
+        block = lat0 + np.arange(start, stop, dtype=np.float64) * dlat_deg
+        d_km = haversine_distance_km_np(
+            center_lat, center_lon, block[:, None], col_lons[None, :]
+        )
+        r, c = np.nonzero(d_km <= radius_km)
+        if r.size == 0:
+            continue
+        yield Grid(
+            lats=block[r],
+            lons=col_lons[c],
+            rows=(r + start).astype(np.int32),
+            cols=c.astype(np.int32),
+            lat0=lat0,
+            lon0=lon0,
+            dlat_deg=dlat_deg,
+            dlon_deg=dlon_deg,
+            n_rows=n_rows,
+            n_cols=n_cols,
+        )
+
+
+def build_grid(center_lat: float,
+               center_lon: float,
+               radius_km: float,
+               step_m: float) -> Grid:
+    """
+    Build the grid of points inside a circle of radius_km around
+    center_lat/center_lon, spaced approximately by step_m.
+
+    Coordinates are computed as `origin + index * step` rather than
+    by repeated addition, so there is no accumulated float drift.
+    """
+    lat0, lon0, dlat_deg, dlon_deg, n_rows, n_cols = _grid_geometry(
+        center_lat, center_lon, radius_km, step_m
+    )
+    blocks = list(iter_grid_blocks(center_lat, center_lon, radius_km, step_m))
+
+    def _cat(name: str, dtype) -> np.ndarray:
+        if not blocks:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate([getattr(b, name) for b in blocks])
+
+    return Grid(
+        lats=_cat("lats", np.float64),
+        lons=_cat("lons", np.float64),
+        rows=_cat("rows", np.int32),
+        cols=_cat("cols", np.int32),
+        lat0=lat0,
+        lon0=lon0,
+        dlat_deg=dlat_deg,
+        dlon_deg=dlon_deg,
+        n_rows=n_rows,
+        n_cols=n_cols,
+    )
+
+
 def generate_grid(center_lat: float,
                   center_lon: float,
                   radius_km: float,
@@ -27,33 +212,48 @@ def generate_grid(center_lat: float,
     """
     Generate list of (lat, lon) points inside a circle of radius_km
     around center_lat/center_lon, spaced approximately by step_m.
+
+    Thin wrapper over `build_grid` kept for callers that want tuples.
     """
-    km_per_deg_lat = 111.0
-    km_per_deg_lon = 111.0 * math.cos(math.radians(center_lat))
+    grid = build_grid(center_lat, center_lon, radius_km, step_m)
+    return list(zip(grid.lats.tolist(), grid.lons.tolist()))
 
-    step_km = step_m / 1000.0
 
-    dlat_deg_step = step_km / km_per_deg_lat
-    dlon_deg_step = step_km / km_per_deg_lon
+def polyline_sample_count(lats: np.ndarray, lons: np.ndarray, step_m: float) -> int:
+    """`len(sample_polyline(lats, lons, step_m)[0])` without sampling."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if lats.size < 2:
+        return int(lats.size)
+    total = float(np.sum(haversine_distance_km_np(lats[:-1], lons[:-1], lats[1:], lons[1:])) * 1000.0)
+    return math.ceil(total / step_m) + 1
 
-    max_dlat_deg = radius_km / km_per_deg_lat
-    max_dlon_deg = radius_km / km_per_deg_lon
 
-    lat_min = center_lat - max_dlat_deg
-    lat_max = center_lat + max_dlat_deg
-    lon_min = center_lon - max_dlon_deg
-    lon_max = center_lon + max_dlon_deg
+def sample_polyline(lats: np.ndarray,
+                    lons: np.ndarray,
+                    step_m: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Points every step_m metres along a polyline, plus its last vertex.
 
-    points: List[Tuple[float, float]] = []
+    Returns `(lats, lons, distance_m)` with the distance along the line.
+    Positions are interpolated linearly in lat/lon within a segment,
+    which is accurate for the segment lengths of a route.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if lats.size < 2:
+        return lats.copy(), lons.copy(), np.zeros(lats.size)
 
-    lat = lat_min
-    while lat <= lat_max:
-        lon = lon_min
-        while lon <= lon_max:
-            d_km = haversine_distance_km(center_lat, center_lon, lat, lon)
-            if d_km <= radius_km:
-                points.append((lat, lon))
-            lon += dlon_deg_step
-        lat += dlat_deg_step
+    seg_m = haversine_distance_km_np(lats[:-1], lons[:-1], lats[1:], lons[1:]) * 1000.0
+    cum = np.concatenate([[0.0], np.cumsum(seg_m)])
+    total = float(cum[-1])
+    dist = np.append(np.arange(0.0, total, step_m), total)
 
-    return points
+    seg = np.clip(np.searchsorted(cum, dist, side="right") - 1, 0, lats.size - 2)
+    length = seg_m[seg]
+    frac = np.divide(dist - cum[seg], length, out=np.zeros_like(dist), where=length > 0)
+    return (
+        lats[seg] + frac * (lats[seg + 1] - lats[seg]),
+        lons[seg] + frac * (lons[seg + 1] - lons[seg]),
+        dist,
+    )
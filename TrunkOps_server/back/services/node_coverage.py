@@ -0,0 +1,399 @@
+"""Coverage of stored network nodes, persisted as `CoverageZone` rows.
+
+Nodes are loaded together with their device models, mapped to `Site`
+and computed one site per node. The resulting class polygons replace
+the node's previously generated zone, and `NodeCoverageState` records
+a fingerprint of the radio parameters and settings used.
+
+Any flush that changes a node's (or its device model's) radio fields
+marks the state stale; after the commit the affected nodes are
+recomputed in the background. `schedule_if_changed` catches changes
+made behind the ORM's back (e.g. direct SQL) when a zone is read,
+without writing: the refresher marks the state stale in its own
+session before recomputing.
+
+Each computation is costed with `coverage_budget` first: a node whose
+grid exceeds the per-request limits is not computed, and the others
+take their work from the server-wide budget while they run.
+
+The levels raster behind each generated zone is kept in `raster_store`.
+New rasters are written, and rasters of zones deleted through the ORM
+dropped, only once the transaction commits; `collect_raster_garbage`
+catches the rest (e.g. database cascades).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload
+
+from .. import database, models
+from ..coverage_schemas import CoverageRequest, GridConfig, NodeCoverageConfig, Site
+from .contour_service import class_zone
+from .coverage_budget import ADMISSION_WAIT_S, admission, check, estimate
+from .coverage_cache import CoverageResult, coverage_cache
+from .coverage_engine import ENGINE_VERSION
+from .coverage_pool import best_server_tiled
+from .coverage_summary import resolve_thresholds
+from .grid_service import build_grid
+from .raster_store import raster_store
+
+
+REFRESH_WORKERS: int = int(os.getenv("NODE_COVERAGE_WORKERS", "1"))
+
+# ERP is referenced to a half-wave dipole; Site levels are EIRP.
+ERP_TO_EIRP_DB = 2.15
+
+NODE_RADIO_FIELDS = (
+    "latitude", "longitude", "frequency_mhz", "erp_w", "antenna_height_m", "device_model_id",
+)
+DEVICE_RADIO_FIELDS = (
+    "freq_min_mhz", "freq_max_mhz", "output_power_w", "antenna_gain_db", "sensitivity_dbm",
+)
+
+_CHANGED_KEY = "node_coverage_changed"
+_DELETED_ZONES_KEY = "node_coverage_deleted_zones"
+_RASTERS_KEY = "node_coverage_rasters"
+
+
+class NodeRadioError(ValueError):
+    """The stored node lacks a parameter needed to compute coverage."""
+
+
+def _num(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def watts_to_dbm(watts: float) -> float:
+    return 10.0 * math.log10(watts * 1000.0)
+
+
+def node_site(node: models.NetworkNode) -> Site:
+    """Map a stored node (and its device model) to a coverage `Site`.
+
+    `erp_w` already includes the antenna gain; without it the device
+    model's output power and antenna gain are used.
+    """
+    device = node.device_model
+    frequency = _num(node.frequency_mhz)
+    if frequency is None and device is not None:
+        band = [f for f in (_num(device.freq_min_mhz), _num(device.freq_max_mhz)) if f is not None]
+        frequency = sum(band) / len(band) if band else None
+    if frequency is None:
+        raise NodeRadioError("Node has no frequency")
+    if node.antenna_height_m is None:
+        raise NodeRadioError("Node has no antenna height")
+
+    if node.erp_w is not None and node.erp_w > 0:
+        tx_power_dbm = watts_to_dbm(float(node.erp_w)) + ERP_TO_EIRP_DB
+        gain_dbi = 0.0
+    elif device is not None and device.output_power_w is not None and device.output_power_w > 0:
+        tx_power_dbm = watts_to_dbm(float(device.output_power_w))
+        gain_dbi = _num(device.antenna_gain_db) or 0.0
+    else:
+        raise NodeRadioError("Node has neither ERP nor device output power")
+
+    return Site(
+        id=str(node.id),
+        lat=float(node.latitude),
+        lon=float(node.longitude),
+        tx_power_dbm=tx_power_dbm,
+        antenna_gain_dbi=gain_dbi,
+        antenna_height_m=float(node.antenna_height_m),
+        frequency_mhz=frequency,
+    )
+
+
+def params_hash(node: models.NetworkNode, config: NodeCoverageConfig) -> str:
+    """Fingerprint of everything the node's zone depends on."""
+    device = node.device_model
+    payload = json.dumps(
+        {
+            "node": {f: _num(getattr(node, f)) for f in NODE_RADIO_FIELDS},
+            "device": {f: _num(getattr(device, f, None)) for f in DEVICE_RADIO_FIELDS},
+            "config": config.model_dump(mode="json"),
+            "engine": ENGINE_VERSION,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def load_nodes(db: Session, node_ids: Iterable[int]) -> List[models.NetworkNode]:
+    """Nodes with device model and coverage state, in one query."""
+    return (
+        db.query(models.NetworkNode)
+        .options(
+            joinedload(models.NetworkNode.device_model),
+            joinedload(models.NetworkNode.coverage_state),
+        )
+        .filter(models.NetworkNode.id.in_(list(node_ids)))
+        .all()
+    )
+
+
+def node_request(node: models.NetworkNode, config: NodeCoverageConfig) -> CoverageRequest:
+    """The single-site coverage request behind the node's zone."""
+    site = node_site(node)
+    return CoverageRequest(
+        sites=[site],
+        rx_height_m=config.rx_height_m,
+        grid=GridConfig(
+            center_lat=site.lat,
+            center_lon=site.lon,
+            radius_km=config.radius_km,
+            step_m=config.step_m,
+        ),
+        model=config.model,
+    )
+
+
+def _compute(req: CoverageRequest, work: int, wait_s: Optional[float]) -> CoverageResult:
+    with admission.admit(work, wait_s):
+        grid = build_grid(
+            center_lat=req.grid.center_lat,
+            center_lon=req.grid.center_lon,
+            radius_km=req.grid.radius_km,
+            step_m=req.grid.step_m,
+        )
+        return grid, best_server_tiled(
+            grid.lats, grid.lons, req.sites, rx_height_m=req.rx_height_m, model=req.model
+        )
+
+
+def compute_node_zone(db: Session,
+                      node: models.NetworkNode,
+                      config: NodeCoverageConfig,
+                      wait_s: Optional[float] = ADMISSION_WAIT_S) -> Optional[models.CoverageZone]:
+    """Compute and store the node's generated zone; None if it cannot be computed.
+
+    Waits up to `wait_s` (None: indefinitely) for the server-wide budget,
+    raising `AdmissionTimeout` after that.
+    """
+    state = node.coverage_state
+    if state is None:
+        state = models.NodeCoverageState(node_id=node.id)
+        node.coverage_state = state
+    state.config = config.model_dump_json()
+    state.params_hash = params_hash(node, config)
+
+    try:
+        req = node_request(node, config)
+    except NodeRadioError as exc:
+        state.status = "failed"
+        state.error = str(exc)
+        return None
+    cost = estimate(req, "contours")
+    if not cost.admitted:
+        state.status = "failed"
+        state.error = f"Coverage request too large: {cost.reason}"
+        return None
+
+    grid, result = coverage_cache.get_or_compute(
+        req, lambda: _compute(req, cost.work_units, wait_s)
+    )
+    device = node.device_model
+    thresholds = resolve_thresholds(None, _num(device.sensitivity_dbm) if device else None)
+    tolerance_m = config.tolerance_m if config.tolerance_m is not None else config.step_m
+    payload = class_zone(grid, result.rx_level_dbm, thresholds, tolerance_m, config.model)
+
+    # The generated zone is updated in place; zones posted by users stay.
+    zone = state.zone or models.CoverageZone(node_id=node.id)
+    zone.geometry = payload.geometry
+    zone.stable_percent = payload.stable_percent
+    zone.degraded_percent = payload.degraded_percent
+    zone.critical_percent = payload.critical_percent
+    zone.algorithm = payload.algorithm
+    zone.generated_at = datetime.utcnow()
+    db.add(zone)
+    db.flush()
+    # Stored on commit, replacing the rasters of earlier runs.
+    db.info.setdefault(_RASTERS_KEY, {})[zone.id] = (
+        zone.algorithm, grid, result.rx_level_dbm, config.step_m,
+    )
+
+    state.zone_id = zone.id
+    state.status = "fresh"
+    state.error = None
+    return zone
+
+
+def compute_nodes(db: Session,
+                  node_ids: Sequence[int],
+                  config: NodeCoverageConfig) -> Tuple[List[models.CoverageZone], List[int]]:
+    """Compute zones for `node_ids`; returns (zones, ids of unknown nodes).
+
+    Nothing is computed when any node is unknown, or when the grid of
+    any node exceeds the per-request limits (`OverBudget` is raised).
+    """
+    nodes = load_nodes(db, node_ids)
+    found = {node.id for node in nodes}
+    missing = [i for i in node_ids if i not in found]
+    if missing:
+        return [], missing
+    for node in nodes:
+        try:
+            check(node_request(node, config), "contours")
+        except NodeRadioError:
+            pass
+    zones = []
+    for node in nodes:
+        zone = compute_node_zone(db, node, config)
+        if zone is not None:
+            zones.append(zone)
+    return zones, []
+
+
+class NodeCoverageRefresher:
+    """Background recomputation of stale node zones."""
+
+    def __init__(self, workers: int = REFRESH_WORKERS) -> None:
+        self.workers = workers
+        self._pending: Set[int] = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def schedule(self, node_ids: Iterable[int]) -> None:
+        with self._lock:
+            new = set(node_ids) - self._pending
+            if not new:
+                return
+            self._pending |= new
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="node-coverage"
+                )
+            self._executor.submit(self._run, sorted(new))
+
+    def _run(self, node_ids: List[int]) -> None:
+        # Changes arriving while this runs schedule a new pass.
+        with self._lock:
+            self._pending -= set(node_ids)
+        for node_id in node_ids:
+            try:
+                with database.get_db() as db:
+                    for node in load_nodes(db, [node_id]):
+                        state = node.coverage_state
+                        if state is None:
+                            continue
+                        config = NodeCoverageConfig.model_validate_json(state.config)
+                        if not needs_refresh(node, config):
+                            continue
+                        if state.status != "stale":
+                            # Changed behind the ORM's back; shown while recomputing.
+                            state.status = "stale"
+                            db.commit()
+                        # Queues for the budget like a coverage job;
+                        # an over-budget node is marked failed.
+                        compute_node_zone(db, node, config, wait_s=None)
+            except Exception as exc:
+                self._record_failure(node_id, exc)
+
+    def _record_failure(self, node_id: int, exc: Exception) -> None:
+        try:
+            with database.get_db() as db:
+                state = db.get(models.NodeCoverageState, node_id)
+                if state is not None:
+                    state.status = "failed"
+                    state.error = str(exc) or type(exc).__name__
+        except Exception:
+            pass
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+refresher = NodeCoverageRefresher()
+
+
+def needs_refresh(node: models.NetworkNode, config: NodeCoverageConfig) -> bool:
+    """Stale, or computed from other inputs; failures are retried only on change."""
+    state = node.coverage_state
+    return state.status == "stale" or state.params_hash != params_hash(node, config)
+
+
+def is_stale(node: models.NetworkNode) -> bool:
+    """Whether the node's generated zone needs recomputing; reads only."""
+    state = node.coverage_state
+    if state is None:
+        return False
+    return needs_refresh(node, NodeCoverageConfig.model_validate_json(state.config))
+
+
+def schedule_if_changed(node: models.NetworkNode) -> bool:
+    """Schedule the node's zone if it is stale; returns whether it is.
+
+    Nothing is written here, the refresher updates the state itself.
+    """
+    stale = is_stale(node)
+    if stale:
+        refresher.schedule([node.id])
+    return stale
+
+
+def collect_raster_garbage(db: Session) -> int:
+    """Drop stored rasters whose zone is gone or was recomputed differently."""
+    live = db.query(models.CoverageZone.id, models.CoverageZone.algorithm).all()
+    return raster_store.collect_garbage(live)
+
+
+def _radio_changed(obj, fields: Sequence[str]) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[f].history.has_changes() for f in fields)
+
+
+@event.listens_for(Session, "before_flush")
+def _mark_stale(session: Session, flush_context, instances) -> None:
+    changed = session.info.setdefault(_CHANGED_KEY, set())
+    deleted = session.info.setdefault(_DELETED_ZONES_KEY, set())
+    for obj in session.deleted:
+        if isinstance(obj, models.CoverageZone) and obj.id is not None:
+            deleted.add(obj.id)
+    with session.no_autoflush:
+        for obj in list(session.dirty):
+            if isinstance(obj, models.NetworkNode) and _radio_changed(obj, NODE_RADIO_FIELDS):
+                nodes = [obj]
+            elif isinstance(obj, models.DeviceModel) and _radio_changed(obj, DEVICE_RADIO_FIELDS):
+                nodes = list(obj.nodes)
+            else:
+                continue
+            for node in nodes:
+                if node.coverage_state is not None:
+                    node.coverage_state.status = "stale"
+                    changed.add(node.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _schedule_stale(session: Session) -> None:
+    deleted = session.info.pop(_DELETED_ZONES_KEY, set())
+    for zone_id in deleted:
+        raster_store.delete(zone_id)
+    for zone_id, (algorithm, grid, levels, step_m) in session.info.pop(_RASTERS_KEY, {}).items():
+        if zone_id in deleted:
+            continue
+        # Replaces the rasters of earlier runs, whatever their algorithm.
+        raster_store.delete(zone_id)
+        raster_store.put(zone_id, algorithm, grid, levels, step_m)
+    changed = session.info.pop(_CHANGED_KEY, None)
+    if changed:
+        refresher.schedule(changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale(session: Session) -> None:
+    session.info.pop(_CHANGED_KEY, None)
+    session.info.pop(_DELETED_ZONES_KEY, None)
+    session.info.pop(_RASTERS_KEY, None)
@@ -0,0 +1,431 @@
+"""Link budgets between stored network nodes and the graph they form.
+
+Every node is a transmitter (`node_site`) and a receiver at its own
+antenna height with its device model's sensitivity. The margin of the
+link a -> b is the level at b minus b's sensitivity; a and b are linked
+when both directions have at least `min_margin_db`.
+
+Pairs are evaluated as matrices, one per bucket of nodes, against the
+nodes its transmitters can reach (`site_reach_km` to the lowest useful
+level, looked up in a `SiteIndex`). Pairs beyond the reach are never
+evaluated: their margin is below the floor anyway. Buckets are the
+median reach on a side (at least `BLOCK_KM`), so a query visits a few
+buckets whatever the density of the network.
+
+The graph gives connected components, articulation points (nodes whose
+loss splits their component) and relay paths that maximise the margin
+of the weakest link, then minimise hops.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session, joinedload
+
+from .. import models, schemas
+from ..coverage_schemas import CoverageClassThresholds, Site
+from .coverage_engine import CHUNK_ELEMENTS
+from .grid_service import EARTH_RADIUS_KM, haversine_distance_km_np, unit_vectors
+from .node_coverage import NodeRadioError, _num, node_site
+from .propagation_models import PropagationModel, SiteTerms, get_model
+from .site_index import KM_PER_DEG, SiteIndex, site_reach_km
+from .terrain_service import PROFILE_SAMPLES, TerrainLoss
+
+
+BLOCK_KM: float = float(os.getenv("NODE_LINK_BLOCK_KM", "10"))
+MATRIX_MAX_NODES: int = int(os.getenv("NODE_LINK_MATRIX_MAX_NODES", "2000"))
+
+# Receivers without a device sensitivity use the default critical bound.
+DEFAULT_SENSITIVITY_DBM = CoverageClassThresholds().critical_dbm
+
+
+class LinkMatrixTooLarge(ValueError):
+    """The dense margin matrix was requested for too many nodes."""
+
+
+@dataclass
+class LinkNodes:
+    """Nodes usable for link budgets, in matrix order (by id)."""
+    ids: np.ndarray
+    sites: List[Site]
+    lats: np.ndarray
+    lons: np.ndarray
+    heights_m: np.ndarray
+    sensitivity_dbm: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+
+def link_nodes(nodes: Sequence[models.NetworkNode]) -> Tuple[LinkNodes, List[Tuple[int, str]]]:
+    """Map nodes to `LinkNodes`; also returns (id, error) of the unusable ones."""
+    ids, sites, sensitivity, excluded = [], [], [], []
+    for node in sorted(nodes, key=lambda n: n.id):
+        try:
+            site = node_site(node)
+        except NodeRadioError as exc:
+            excluded.append((node.id, str(exc)))
+            continue
+        device = node.device_model
+        sens = _num(device.sensitivity_dbm) if device is not None else None
+        ids.append(node.id)
+        sites.append(site)
+        sensitivity.append(DEFAULT_SENSITIVITY_DBM if sens is None else sens)
+    return LinkNodes(
+        ids=np.array(ids, dtype=np.int64),
+        sites=sites,
+        lats=np.array([s.lat for s in sites], dtype=np.float64),
+        lons=np.array([s.lon for s in sites], dtype=np.float64),
+        heights_m=np.array([s.antenna_height_m for s in sites], dtype=np.float64),
+        sensitivity_dbm=np.array(sensitivity, dtype=np.float64),
+    ), excluded
+
+
+@dataclass
+class LinkMatrix:
+    """Margins of the evaluated directed pairs `src -> dst` (sparse)."""
+    n: int
+    src: np.ndarray
+    dst: np.ndarray
+    distance_km: np.ndarray
+    margin_db: np.ndarray
+
+    def dense(self) -> np.ndarray:
+        """(n, n) margins, NaN where a pair was not evaluated."""
+        out = np.full((self.n, self.n), np.nan)
+        out[self.src, self.dst] = self.margin_db
+        return out
+
+    def links(self, min_margin_db: float) -> Tuple[np.ndarray, ...]:
+        """Undirected links `(a, b, distance_km, margin_ab, margin_ba)`, a < b,
+        with both directions at least `min_margin_db`."""
+        key = self.src * self.n + self.dst
+        order = np.argsort(key)
+        sorted_key = key[order]
+
+        fwd = np.flatnonzero(self.src < self.dst)
+        rev_key = self.dst[fwd] * self.n + self.src[fwd]
+        pos = np.minimum(np.searchsorted(sorted_key, rev_key), max(len(key) - 1, 0))
+        found = sorted_key[pos] == rev_key if len(key) else np.zeros(0, dtype=bool)
+        fwd, rev = fwd[found], order[pos[found]]
+
+        ok = np.minimum(self.margin_db[fwd], self.margin_db[rev]) >= min_margin_db
+        fwd, rev = fwd[ok], rev[ok]
+        return (
+            self.src[fwd], self.dst[fwd], self.distance_km[fwd],
+            self.margin_db[fwd], self.margin_db[rev],
+        )
+
+
+def _blocks(lats: np.ndarray, lons: np.ndarray, block_km: float) -> List[np.ndarray]:
+    """Node indices grouped by lat/lon bucket."""
+    size = block_km / KM_PER_DEG
+    keys = np.stack([np.floor(lats / size), np.floor(lons / size)], axis=1)
+    _, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    return np.split(order, np.flatnonzero(np.diff(inverse[order])) + 1)
+
+
+def _reach_km(model: PropagationModel, nodes: LinkNodes, floor_dbm: float) -> np.ndarray:
+    """Upper bound of each transmitter's reach over all receiver heights.
+
+    Terms are taken at the lowest and highest receiver height: every
+    registered model is affine in it, so those bound the rest.
+    """
+    lo = model.site_terms(nodes.sites, float(nodes.heights_m.min()))
+    hi = model.site_terms(nodes.sites, float(nodes.heights_m.max()))
+    return site_reach_km(np.maximum(lo.k, hi.k), np.minimum(lo.b, hi.b), floor_dbm)
+
+
+def _levels(model: PropagationModel,
+            nodes: LinkNodes,
+            tx: np.ndarray,
+            rx: np.ndarray,
+            r: np.ndarray,
+            c: np.ndarray,
+            d_km: np.ndarray) -> np.ndarray:
+    """Levels of the pairs `tx[r] -> rx[c]`, grouped by receiver height
+    since the site terms depend on it."""
+    tx_sites = [nodes.sites[i] for i in tx]
+    heights, col_height = np.unique(nodes.heights_m[rx], return_inverse=True)
+    pair_height = col_height.ravel()[c]
+    order = np.argsort(pair_height, kind="stable")
+    bounds = np.flatnonzero(np.diff(pair_height[order])) + 1
+
+    levels = np.empty(d_km.shape[0], dtype=np.float64)
+    for sel in np.split(order, bounds):
+        if sel.size == 0:
+            continue
+        h = float(heights[pair_height[sel[0]]])
+        terms = model.site_terms(tx_sites, h)
+        rs = r[sel]
+        levels[sel] = model.rx_level_dbm(SiteTerms(k=terms.k[rs], b=terms.b[rs]), d_km[sel])
+        if model.uses_terrain:
+            terrain = TerrainLoss(tx_sites, h)
+            if terrain.enabled:
+                # Evaluated for the receivers of this height x the chunk.
+                cols, col_pos = np.unique(c[sel], return_inverse=True)
+                loss = terrain(nodes.lats[rx[cols]], nodes.lons[rx[cols]], np.arange(len(tx)))
+                levels[sel] -= loss[col_pos.ravel(), rs]
+    return levels
+
+
+def link_matrix(nodes: LinkNodes,
+                model_name: str,
+                min_margin_db: float = 0.0,
+                block_km: float = BLOCK_KM,
+                chunk_elements: int = CHUNK_ELEMENTS) -> LinkMatrix:
+    """Margins of every directed pair within reach of its transmitter."""
+    n = len(nodes)
+    empty = np.empty(0, dtype=np.int64)
+    if n < 2:
+        return LinkMatrix(n, empty, empty, np.empty(0), np.empty(0))
+
+    model = get_model(model_name)
+    floor_dbm = float(nodes.sensitivity_dbm.min()) + min_margin_db
+    reach = _reach_km(model, nodes, floor_dbm)
+    block_km = max(block_km, float(np.median(reach)))
+    # Receivers as points: a query returns the nodes within its radius.
+    index = SiteIndex(nodes.lats, nodes.lons, np.zeros(n), bucket_km=block_km)
+    weight = PROFILE_SAMPLES if model.uses_terrain else 1
+    # Within reach <=> the dot product of the unit vectors is at least
+    # cos(reach / R): the mask of a chunk is a single matrix product.
+    unit = unit_vectors(nodes.lats, nodes.lons)
+    cos_reach = np.cos(np.minimum(reach / EARTH_RADIUS_KM, np.pi))
+
+    parts = []
+    for block in _blocks(nodes.lats, nodes.lons, block_km):
+        c_lat = float(nodes.lats[block].mean())
+        c_lon = float(nodes.lons[block].mean())
+        radius = float(haversine_distance_km_np(
+            c_lat, c_lon, nodes.lats[block], nodes.lons[block]
+        ).max())
+        rx = index.query(c_lat, c_lon, radius + float(reach[block].max()))
+        if rx.size == 0:
+            continue
+        rows = max(1, chunk_elements // (rx.size * weight))
+        for start in range(0, block.size, rows):
+            tx = block[start:start + rows]
+            dot = unit[tx] @ unit[rx].T
+            r, c = np.nonzero((dot >= cos_reach[tx][:, None]) & (tx[:, None] != rx[None, :]))
+            if r.size == 0:
+                continue
+            # Great-circle distance from the chord, for the kept pairs only.
+            chord = unit[tx[r]] - unit[rx[c]]
+            half = np.sqrt(np.einsum("ij,ij->i", chord, chord)) / 2.0
+            d_km = 2.0 * EARTH_RADIUS_KM * np.arcsin(np.minimum(half, 1.0))
+            levels = _levels(model, nodes, tx, rx, r, c, d_km)
+            parts.append((tx[r], rx[c], d_km, levels - nodes.sensitivity_dbm[rx[c]]))
+
+    if not parts:
+        return LinkMatrix(n, empty, empty, np.empty(0), np.empty(0))
+    src, dst, d_km, margin = (np.concatenate(p) for p in zip(*parts))
+    return LinkMatrix(n, src, dst, d_km, margin)
+
+
+@dataclass
+class LinkGraph:
+    """Undirected graph of links in CSR form; `margin_db` is the weaker
+    direction of each link."""
+    n: int
+    indptr: np.ndarray
+    neighbors: np.ndarray
+    margin_db: np.ndarray
+
+    @classmethod
+    def from_links(cls, n: int, a: np.ndarray, b: np.ndarray, margin_db: np.ndarray) -> "LinkGraph":
+        src = np.concatenate([a, b])
+        dst = np.concatenate([b, a])
+        margin = np.concatenate([margin_db, margin_db])
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        return cls(n, indptr, dst[order], margin[order])
+
+    def structure(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Component label of each node and the articulation point mask.
+
+        Iterative Tarjan: a non-root node is a cut vertex when some DFS
+        child cannot reach above it; the root when it has two children.
+        """
+        indptr = self.indptr.tolist()
+        nbr = self.neighbors.tolist()
+        n = self.n
+        disc = [-1] * n
+        low = [0] * n
+        parent = [-1] * n
+        label = [-1] * n
+        cut = [False] * n
+        timer = 0
+        for root in range(n):
+            if disc[root] != -1:
+                continue
+            disc[root] = low[root] = timer
+            timer += 1
+            label[root] = root
+            children = 0
+            stack = [[root, indptr[root]]]
+            while stack:
+                frame = stack[-1]
+                v, i = frame
+                if i < indptr[v + 1]:
+                    frame[1] = i + 1
+                    w = nbr[i]
+                    if disc[w] == -1:
+                        parent[w] = v
+                        disc[w] = low[w] = timer
+                        timer += 1
+                        label[w] = root
+                        if v == root:
+                            children += 1
+                        stack.append([w, indptr[w]])
+                    elif w != parent[v] and disc[w] < low[v]:
+                        low[v] = disc[w]
+                else:
+                    stack.pop()
+                    if stack:
+                        p = stack[-1][0]
+                        if low[v] < low[p]:
+                            low[p] = low[v]
+                        if p != root and low[v] >= disc[p]:
+                            cut[p] = True
+            if children > 1:
+                cut[root] = True
+        return np.array(label, dtype=np.int64), np.array(cut, dtype=bool)
+
+    def relay_path(self, source: int, target: int) -> Tuple[List[int], Optional[float]]:
+        """Path with the best weakest-link margin, then the fewest hops.
+
+        Returns ([], None) when the target is unreachable and
+        ([source], None) when it is the source.
+        """
+        if source == target:
+            return [source], None
+        indptr = self.indptr.tolist()
+        nbr = self.neighbors.tolist()
+        margin = self.margin_db.tolist()
+
+        # Widest path (Dijkstra on the bottleneck) for the best margin.
+        best = [-math.inf] * self.n
+        best[source] = math.inf
+        heap = [(-math.inf, source)]
+        while heap:
+            neg, v = heapq.heappop(heap)
+            if -neg < best[v]:
+                continue
+            if v == target:
+                break
+            for i in range(indptr[v], indptr[v + 1]):
+                width = min(-neg, margin[i])
+                w = nbr[i]
+                if width > best[w]:
+                    best[w] = width
+                    heapq.heappush(heap, (-width, w))
+        bottleneck = best[target]
+        if bottleneck == -math.inf:
+            return [], None
+
+        # Fewest hops over the links at least that good.
+        prev = [-1] * self.n
+        prev[source] = source
+        queue = deque([source])
+        while queue and prev[target] == -1:
+            v = queue.popleft()
+            for i in range(indptr[v], indptr[v + 1]):
+                w = nbr[i]
+                if prev[w] == -1 and margin[i] >= bottleneck:
+                    prev[w] = v
+                    queue.append(w)
+        path = [target]
+        while path[-1] != source:
+            path.append(prev[path[-1]])
+        return path[::-1], bottleneck
+
+
+def load_link_nodes(db: Session, node_ids: Optional[Sequence[int]]) -> List[models.NetworkNode]:
+    """Nodes (all when `node_ids` is None) with their device models."""
+    query = db.query(models.NetworkNode).options(joinedload(models.NetworkNode.device_model))
+    if node_ids is not None:
+        query = query.filter(models.NetworkNode.id.in_(list(node_ids)))
+    return query.all()
+
+
+def link_graph(db: Session,
+               req: schemas.NodeLinkRequest) -> Tuple[Optional[schemas.NodeLinkGraph], List[int]]:
+    """Links, graph structure and requested relay paths of the nodes in
+    `req`; returns (graph, ids of unknown nodes).
+
+    Raises `LinkMatrixTooLarge` for a dense matrix over
+    `MATRIX_MAX_NODES` nodes and `ValueError` for a route endpoint
+    outside the graph.
+    """
+    stored = load_link_nodes(db, req.node_ids)
+    if req.node_ids is not None:
+        found = {node.id for node in stored}
+        missing = [i for i in req.node_ids if i not in found]
+        if missing:
+            return None, missing
+
+    nodes, excluded = link_nodes(stored)
+    if req.include_matrix and len(nodes) > MATRIX_MAX_NODES:
+        raise LinkMatrixTooLarge(
+            f"{len(nodes)} nodes exceed the dense matrix limit of {MATRIX_MAX_NODES}"
+        )
+    position = {node_id: i for i, node_id in enumerate(nodes.ids.tolist())}
+    for route in req.routes:
+        for node_id in (route.source_id, route.target_id):
+            if node_id not in position:
+                raise ValueError(f"Route node {node_id} is not in the graph")
+
+    matrix = link_matrix(nodes, req.model, req.min_margin_db)
+    a, b, d_km, m_ab, m_ba = matrix.links(req.min_margin_db)
+    graph = LinkGraph.from_links(len(nodes), a, b, np.minimum(m_ab, m_ba))
+    label, cut = graph.structure()
+
+    ids = nodes.ids
+    order = np.argsort(label, kind="stable")
+    components = [ids[c].tolist() for c in np.split(order, np.flatnonzero(np.diff(label[order])) + 1)
+                  if c.size]
+    components.sort(key=len, reverse=True)
+
+    routes = []
+    for route in req.routes:
+        path, bottleneck = graph.relay_path(position[route.source_id], position[route.target_id])
+        routes.append(schemas.NodeRelayPath(
+            source_id=route.source_id,
+            target_id=route.target_id,
+            node_ids=ids[path].tolist(),
+            bottleneck_margin_db=bottleneck,
+        ))
+
+    margin_db = None
+    if req.include_matrix:
+        dense = matrix.dense()
+        cells = dense.astype(object)
+        cells[np.isnan(dense)] = None
+        margin_db = cells.tolist()
+
+    return schemas.NodeLinkGraph(
+        node_ids=ids.tolist(),
+        excluded=[schemas.NodeLinkExcluded(node_id=i, error=e) for i, e in excluded],
+        links=[
+            schemas.NodeLink(
+                a_id=int(ids[i]), b_id=int(ids[j]), distance_km=d,
+                margin_ab_db=f, margin_ba_db=r,
+            )
+            for i, j, d, f, r in zip(a.tolist(), b.tolist(), d_km.tolist(), m_ab.tolist(), m_ba.tolist())
+        ],
+        components=components,
+        articulation_points=ids[cut].tolist(),
+        routes=routes,
+        margin_db=margin_db,
+        evaluated_pairs=int(matrix.src.shape[0]),
+    ), []
@@ -0,0 +1,166 @@
+"""Registry of batch propagation models.
+
+Every model here has a path loss of the form `A + B * log10(d_km)`
+with `A` and `B` fixed per site for a given request, so a model only
+has to provide those terms (`site_terms`, computed once per request)
+and the engine evaluates whole cells x sites arrays from them. The
+same form gives the pruning reach in `site_index`.
+
+Models are looked up by name (`get_model`); `CoverageRequest.model`
+is validated against `MODELS`, so registering a model makes it
+available to every endpoint.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from ..coverage_schemas import Site
+
+
+@dataclass
+class SiteTerms:
+    """Per-site terms so that `rx_dbm = k - b * log10(d_km)`."""
+    k: np.ndarray
+    b: np.ndarray
+
+
+def _site_arrays(sites: Sequence["Site"]):
+    f = np.array([s.frequency_mhz for s in sites], dtype=np.float64)
+    h_bs = np.array([s.antenna_height_m for s in sites], dtype=np.float64)
+    eirp = np.array(
+        [s.tx_power_dbm + s.antenna_gain_dbi for s in sites], dtype=np.float64
+    )
+    return f, h_bs, eirp
+
+
+def _hata_a_hm(log_f: np.ndarray, rx_height_m: float) -> np.ndarray:
+    """Mobile antenna correction for small/medium cities."""
+    return (1.1 * log_f - 0.7) * rx_height_m - (1.56 * log_f - 0.8)
+
+
+class PropagationModel:
+    """Base class; subclasses set `name` and implement `site_terms`."""
+
+    name: str = ""
+    description: str = ""
+    # Whether the engine subtracts the terrain obstruction loss.
+    uses_terrain: bool = False
+
+    def site_terms(self, sites: Sequence["Site"], rx_height_m: float) -> SiteTerms:
+        raise NotImplementedError
+
+    def rx_level_dbm(self, terms: SiteTerms, d_km: np.ndarray) -> np.ndarray:
+        """Received level for distances broadcast against the sites (last axis)."""
+        return terms.k - terms.b * np.log10(np.maximum(d_km, 0.001))
+
+
+class HataUrban(PropagationModel):
+    name = "hata"
+    description = "Okumura-Hata, urban (small/medium city), 150-1500 MHz"
+
+    def _loss_terms(self, f, h_bs, rx_height_m):
+        log_f = np.log10(f)
+        log_hb = np.log10(h_bs)
+        a = 69.55 + 26.16 * log_f - 13.82 * log_hb - _hata_a_hm(log_f, rx_height_m)
+        return a, 44.9 - 6.55 * log_hb
+
+    def correction_db(self, f: np.ndarray) -> np.ndarray:
+        """Environment correction subtracted from the urban loss."""
+        return np.zeros_like(f)
+
+    def site_terms(self, sites, rx_height_m):
+        f, h_bs, eirp = _site_arrays(sites)
+        a, b = self._loss_terms(f, h_bs, rx_height_m)
+        return SiteTerms(k=eirp - (a - self.correction_db(f)), b=b)
+
+
+class HataSuburban(HataUrban):
+    name = "hata_suburban"
+    description = "Okumura-Hata, suburban"
+
+    def correction_db(self, f):
+        return 2.0 * np.log10(f / 28.0) ** 2 + 5.4
+
+
+class HataOpen(HataUrban):
+    name = "hata_open"
+    description = "Okumura-Hata, open/rural area"
+
+    def correction_db(self, f):
+        log_f = np.log10(f)
+        return 4.78 * log_f ** 2 - 18.33 * log_f + 40.94
+
+
+class HataTerrain(HataUrban):
+    name = "hata_terrain"
+    description = "Okumura-Hata urban plus knife-edge loss over the DEM in TERRAIN_DEM_DIR"
+    uses_terrain = True
+
+
+class LongleyRiceStub(HataUrban):
+    name = "longley_rice"
+    description = "Not implemented yet; falls back to Hata urban"
+
+
+class Cost231Hata(HataUrban):
+    name = "cost231_hata"
+    description = "COST-231 Hata, medium city/suburban, 1500-2000 MHz"
+    city_correction_db = 0.0
+
+    def _loss_terms(self, f, h_bs, rx_height_m):
+        log_f = np.log10(f)
+        log_hb = np.log10(h_bs)
+        a = (
+            46.3 + 33.9 * log_f - 13.82 * log_hb
+            - _hata_a_hm(log_f, rx_height_m) + self.city_correction_db
+        )
+        return a, 44.9 - 6.55 * log_hb
+
+
+class Cost231HataMetro(Cost231Hata):
+    name = "cost231_hata_metro"
+    description = "COST-231 Hata, metropolitan centre"
+    city_correction_db = 3.0
+
+
+class FreeSpace(PropagationModel):
+    name = "free_space"
+    description = "Free-space path loss"
+
+    def site_terms(self, sites, rx_height_m):
+        f, _, eirp = _site_arrays(sites)
+        return SiteTerms(
+            k=eirp - (32.45 + 20.0 * np.log10(f)),
+            b=np.full_like(f, 20.0),
+        )
+
+
+MODELS: Dict[str, PropagationModel] = {}
+
+
+def register(model: PropagationModel) -> PropagationModel:
+    MODELS[model.name] = model
+    return model
+
+
+def get_model(name: str) -> PropagationModel:
+    try:
+        return MODELS[name]
+    except KeyError:
+        raise ValueError(f"Unknown propagation model {name!r}") from None
+
+
+def model_names() -> List[str]:
+    return sorted(MODELS)
+
+
+for _model in (
+    HataUrban(), HataSuburban(), HataOpen(), HataTerrain(), LongleyRiceStub(),
+    Cost231Hata(), Cost231HataMetro(), FreeSpace(),
+):
+    register(_model)
@@ -2,8 +2,13 @@ from __future__ import annotations
 
 import math
 
+import numpy as np
+
 from ..coverage_schemas import Site
 from .grid_service import haversine_distance_km
+from .antenna_patterns import PatternLoss
+from .propagation_models import get_model
+from .terrain_service import TerrainLoss
 
 
 def hata_path_loss(f_mhz: float,
@@ -43,24 +48,22 @@ def calc_rx_level(
     """
     Calculate received signal level at target_lat/target_lon from a single site.
 
-    Currently only Hata is implemented; "longley_rice" falls back to Hata as stub.
+    `model` is a name from `propagation_models.MODELS`; terrain-aware
+    models add the terrain obstruction loss. A site with a `pattern`
+    is attenuated off boresight.
     """
     d_km = haversine_distance_km(site.lat, site.lon, target_lat, target_lon)
 
-    if model in ("hata", "longley_rice"):
-        pl = hata_path_loss(
-            f_mhz=site.frequency_mhz,
-            d_km=d_km,
-            h_bs_m=site.antenna_height_m,
-            h_ms_m=rx_height_m,
-        )
-    else:
-        pl = hata_path_loss(
-            f_mhz=site.frequency_mhz,
-            d_km=d_km,
-            h_bs_m=site.antenna_height_m,
-            h_ms_m=rx_height_m,
-        )
+    propagation = get_model(model)
+    terms = propagation.site_terms([site], rx_height_m)
+    prx_dbm = float(propagation.rx_level_dbm(terms, np.array([d_km]))[0])
 
-    prx_dbm = site.tx_power_dbm + site.antenna_gain_dbi - pl
+    if propagation.uses_terrain:
+        prx_dbm -= float(TerrainLoss([site], rx_height_m)(
+            np.array([target_lat]), np.array([target_lon]), np.array([0]),
+        )[0, 0])
+    if site.pattern is not None:
+        prx_dbm -= float(PatternLoss([site], rx_height_m)(
+            np.array([target_lat]), np.array([target_lon]), np.array([0]),
+        )[0, 0])
     return prx_dbm
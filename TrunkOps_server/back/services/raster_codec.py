@@ -0,0 +1,125 @@
+"""Compact raster encodings of coverage results.
+
+Instead of repeating lat/lon for every cell, a raster carries the
+grid geometry, a packed in-circle mask and the levels of the masked
+cells as float32 or quantized int16/int8. Two transports share the
+same header:
+
+* `CoverageRaster` JSON with base64 `mask` and `data` fields.
+* A raw binary body: `MAGIC`, a little-endian uint32 header length,
+  the UTF-8 JSON header (the `CoverageRaster` fields without `mask`
+  and `data`, plus their byte lengths), the mask bytes, the data bytes.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import struct
+from typing import Dict, Tuple
+
+import numpy as np
+
+from ..coverage_schemas import CoverageRaster
+from .grid_service import Grid
+
+
+MAGIC = b"TOCR"
+
+RASTER_JSON_MEDIA_TYPE = "application/vnd.trunkops.coverage-raster+json"
+RASTER_BINARY_MEDIA_TYPE = "application/vnd.trunkops.coverage-raster"
+
+# dtype -> (scale, offset) with rx_level_dbm = offset + scale * value.
+# int16 keeps 0.01 dB resolution; int8 keeps 1 dB over -200..55 dBm.
+QUANTIZATION: Dict[str, Tuple[float, float]] = {
+    "float32": (1.0, 0.0),
+    "int16": (0.01, 0.0),
+    "int8": (1.0, -72.0),
+}
+
+
+def quantize(values: np.ndarray, dtype: str) -> np.ndarray:
+    """Pack dBm levels into `dtype` using the `QUANTIZATION` table."""
+    scale, offset = QUANTIZATION[dtype]
+    if dtype == "float32":
+        return np.asarray(values, dtype="<f4")
+    info = np.iinfo(dtype)
+    q = np.rint((np.asarray(values, dtype=np.float64) - offset) / scale)
+    return np.clip(q, info.min, info.max).astype("<" + np.dtype(dtype).str[1:])
+
+
+def dequantize(data: np.ndarray, dtype: str) -> np.ndarray:
+    scale, offset = QUANTIZATION[dtype]
+    return offset + scale * data.astype(np.float64)
+
+
+def encode_parts(grid: Grid,
+                 rx_level_dbm: np.ndarray,
+                 grid_step_m: float,
+                 dtype: str = "float32") -> Tuple[dict, bytes, bytes]:
+    """Return `(header, mask_bytes, data_bytes)` for a computed grid."""
+    mask = np.zeros(grid.shape, dtype=bool)
+    mask[grid.rows, grid.cols] = True
+    # Grid points are already in row-major order.
+    data = quantize(rx_level_dbm, dtype)
+    scale, offset = QUANTIZATION[dtype]
+    header = {
+        "crs": "EPSG:4326",
+        "grid_step_m": grid_step_m,
+        "lat0": grid.lat0,
+        "lon0": grid.lon0,
+        "dlat_deg": grid.dlat_deg,
+        "dlon_deg": grid.dlon_deg,
+        "n_rows": grid.n_rows,
+        "n_cols": grid.n_cols,
+        "n_cells": len(grid),
+        "dtype": dtype,
+        "scale": scale,
+        "offset": offset,
+    }
+    return header, np.packbits(mask, axis=None).tobytes(), data.tobytes()
+
+
+def encode_json(grid: Grid,
+                rx_level_dbm: np.ndarray,
+                grid_step_m: float,
+                dtype: str = "float32") -> CoverageRaster:
+    header, mask, data = encode_parts(grid, rx_level_dbm, grid_step_m, dtype)
+    return CoverageRaster(
+        **header,
+        mask=base64.b64encode(mask).decode("ascii"),
+        data=base64.b64encode(data).decode("ascii"),
+    )
+
+
+def encode_binary(grid: Grid,
+                  rx_level_dbm: np.ndarray,
+                  grid_step_m: float,
+                  dtype: str = "float32") -> bytes:
+    header, mask, data = encode_parts(grid, rx_level_dbm, grid_step_m, dtype)
+    header["mask_bytes"] = len(mask)
+    header["data_bytes"] = len(data)
+    head = json.dumps(header, separators=(",", ":")).encode()
+    return b"".join((MAGIC, struct.pack("<I", len(head)), head, mask, data))
+
+
+def decode_binary(body: bytes) -> Tuple[dict, np.ndarray, np.ndarray]:
+    """Inverse of `encode_binary`: `(header, mask, rx_level_dbm)`.
+
+    `mask` is the (n_rows, n_cols) boolean raster and `rx_level_dbm`
+    the levels of its True cells in row-major order.
+    """
+    if body[:4] != MAGIC:
+        raise ValueError("Not a coverage raster")
+    (head_len,) = struct.unpack_from("<I", body, 4)
+    header = json.loads(body[8:8 + head_len])
+    pos = 8 + head_len
+    mask_raw = np.frombuffer(body, dtype=np.uint8, count=header["mask_bytes"], offset=pos)
+    pos += header["mask_bytes"]
+    n_rows, n_cols = header["n_rows"], header["n_cols"]
+    mask = np.unpackbits(mask_raw, count=n_rows * n_cols).astype(bool).reshape(n_rows, n_cols)
+    dtype = header["dtype"]
+    data = np.frombuffer(
+        body, dtype="<" + np.dtype(dtype).str[1:], count=header["n_cells"], offset=pos
+    )
+    return header, mask, dequantize(data, dtype)
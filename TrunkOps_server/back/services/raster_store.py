@@ -0,0 +1,345 @@
+"""Persistent store of coverage rasters for kept `CoverageZone`s.
+
+Each raster is keyed by zone id and algorithm and kept under
+`COVERAGE_RASTER_DIR/<zone_id>/` as a JSON header plus `.npy` arrays:
+the full (n_rows, n_cols) float32 levels raster (NaN outside the
+computed area) and overviews averaged over 2x2, 4x4, ... blocks down
+to `OVERVIEW_MIN_SIZE`. Arrays are read through `numpy.memmap`, so a
+window (bbox) of the full raster, or of the overview matching the
+requested output size, only touches the pages it covers.
+
+Files are written to a temporary directory and renamed into place,
+header last. The store is bounded by `COVERAGE_RASTER_BYTES`, evicting
+the least recently read rasters; `collect_garbage` removes rasters of
+zones that no longer exist (or were recomputed with another algorithm).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .grid_service import Grid
+
+
+RASTER_DIR: Optional[str] = os.getenv("COVERAGE_RASTER_DIR") or None
+BUDGET_BYTES: int = int(os.getenv("COVERAGE_RASTER_BYTES", str(4 * 1024 ** 3)))
+
+# Overviews stop once their longest side is at most this many cells.
+OVERVIEW_MIN_SIZE = 256
+
+HEADER_SUFFIX = ".json"
+
+# (south, west, north, east) in degrees.
+BBox = Tuple[float, float, float, float]
+
+
+def _slug(algorithm: str) -> str:
+    """Filesystem-safe, collision-free file stem of an algorithm name."""
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", algorithm)[:64]
+    return f"{safe}-{hashlib.sha256(algorithm.encode()).hexdigest()[:12]}"
+
+
+def _halve(levels: np.ndarray) -> np.ndarray:
+    """Mean of each 2x2 block, ignoring NaN (all-NaN blocks stay NaN)."""
+    rows, cols = levels.shape
+    pad = np.full((rows + rows % 2, cols + cols % 2), np.nan, dtype=np.float32)
+    pad[:rows, :cols] = levels
+    blocks = pad.reshape(pad.shape[0] // 2, 2, pad.shape[1] // 2, 2)
+    valid = ~np.isnan(blocks)
+    total = np.where(valid, blocks, 0.0).sum(axis=(1, 3), dtype=np.float64)
+    count = valid.sum(axis=(1, 3))
+    out = np.full(total.shape, np.nan, dtype=np.float32)
+    np.divide(total, count, out=out, where=count > 0, casting="unsafe")
+    return out
+
+
+def _write_npy(path: str, array: np.ndarray) -> None:
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=array.dtype, shape=array.shape)
+    out[...] = array
+    out.flush()
+    del out
+
+
+class RasterStore:
+    """Levels rasters on disk, read through memory maps."""
+
+    def __init__(self,
+                 directory: Optional[str] = RASTER_DIR,
+                 budget_bytes: int = BUDGET_BYTES) -> None:
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _zone_dir(self, zone_id: int) -> str:
+        return os.path.join(self.directory, str(int(zone_id)))
+
+    def _path(self, zone_id: int, algorithm: str, suffix: str) -> str:
+        return os.path.join(self._zone_dir(zone_id), _slug(algorithm) + suffix)
+
+    @staticmethod
+    def _array_suffix(factor: int) -> str:
+        return ".npy" if factor == 1 else f".ov{factor}.npy"
+
+    def put(self,
+            zone_id: int,
+            algorithm: str,
+            grid: Grid,
+            rx_level_dbm: np.ndarray,
+            grid_step_m: float) -> Optional[dict]:
+        """Store a computed grid for the zone; returns the header.
+
+        Like the disk cache, a failed write (full disk, permissions) is
+        not an error: the raster is simply not stored.
+        """
+        if not self.enabled:
+            return None
+        levels = grid.to_raster(np.asarray(rx_level_dbm, dtype=np.float32))
+        header = {
+            "zone_id": int(zone_id),
+            "algorithm": algorithm,
+            "crs": "EPSG:4326",
+            "grid_step_m": grid_step_m,
+            "lat0": grid.lat0,
+            "lon0": grid.lon0,
+            "dlat_deg": grid.dlat_deg,
+            "dlon_deg": grid.dlon_deg,
+            "n_rows": grid.n_rows,
+            "n_cols": grid.n_cols,
+            "n_cells": len(grid),
+            "overviews": [],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+        zone_dir = self._zone_dir(zone_id)
+        try:
+            os.makedirs(zone_dir, exist_ok=True)
+            tmp = tempfile.mkdtemp(dir=zone_dir, prefix=".tmp-")
+        except OSError:
+            return None
+        try:
+            names = []
+            factor = 1
+            level = levels
+            while True:
+                name = _slug(algorithm) + self._array_suffix(factor)
+                _write_npy(os.path.join(tmp, name), level)
+                names.append(name)
+                if max(level.shape) <= OVERVIEW_MIN_SIZE:
+                    break
+                factor *= 2
+                level = _halve(level)
+                header["overviews"].append(factor)
+            name = _slug(algorithm) + HEADER_SUFFIX
+            with open(os.path.join(tmp, name), "w") as fh:
+                json.dump(header, fh)
+            names.append(name)
+            # Header last: readers never see it before its arrays.
+            for name in names:
+                os.replace(os.path.join(tmp, name), os.path.join(zone_dir, name))
+        except OSError:
+            return None
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict()
+        return header
+
+    def header(self, zone_id: int, algorithm: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        path = self._path(zone_id, algorithm, HEADER_SUFFIX)
+        try:
+            with open(path) as fh:
+                header = json.load(fh)
+            os.utime(path, None)
+        except (OSError, ValueError):
+            return None
+        return header
+
+    def levels(self, zone_id: int, algorithm: str, factor: int = 1) -> np.memmap:
+        """The full raster (`factor` 1) or an overview, memory-mapped read-only."""
+        return np.load(
+            self._path(zone_id, algorithm, self._array_suffix(factor)), mmap_mode="r"
+        )
+
+    def window(self,
+               zone_id: int,
+               algorithm: str,
+               bbox: Optional[BBox] = None,
+               max_size: int = 1024) -> Optional[Tuple[Grid, np.ndarray, float]]:
+        """Cells of `bbox` (default: everything) at most `max_size` per side.
+
+        Returns `(grid, rx_level_dbm, grid_step_m)` where `grid` holds
+        the window's geometry and its cells with data, or None when the
+        raster is not stored. The finest level (full raster or overview)
+        that fits in `max_size` is read; beyond the last overview the
+        cells are subsampled.
+        """
+        header = self.header(zone_id, algorithm)
+        if header is None:
+            return None
+        lat0, lon0 = header["lat0"], header["lon0"]
+        dlat, dlon = header["dlat_deg"], header["dlon_deg"]
+        n_rows, n_cols = header["n_rows"], header["n_cols"]
+
+        r0, r1, c0, c1 = 0, n_rows, 0, n_cols
+        if bbox is not None:
+            south, west, north, east = bbox
+            r0 = max(0, math.floor((south - lat0) / dlat))
+            r1 = min(n_rows, math.ceil((north - lat0) / dlat) + 1)
+            c0 = max(0, math.floor((west - lon0) / dlon))
+            c1 = min(n_cols, math.ceil((east - lon0) / dlon) + 1)
+        r1, c1 = max(r1, r0), max(c1, c0)
+
+        max_size = max(1, max_size)
+        span = max(r1 - r0, c1 - c0, 1)
+        factor = 1
+        for factor in [1] + header["overviews"]:
+            if math.ceil(span / factor) <= max_size:
+                break
+
+        # Overview cell i covers full-raster rows [i * factor, (i + 1) * factor).
+        levels = self.levels(zone_id, algorithm, factor)
+        o_r0, o_c0 = r0 // factor, c0 // factor
+        o_r1 = min(levels.shape[0], -(-r1 // factor))
+        o_c1 = min(levels.shape[1], -(-c1 // factor))
+        stride = max(1, math.ceil(max(o_r1 - o_r0, o_c1 - o_c0) / max_size))
+        window = np.array(levels[o_r0:o_r1:stride, o_c0:o_c1:stride])
+        del levels
+
+        step = factor * stride
+        w_lat0 = lat0 + (o_r0 * factor + (factor - 1) / 2.0) * dlat
+        w_lon0 = lon0 + (o_c0 * factor + (factor - 1) / 2.0) * dlon
+        rows, cols = np.nonzero(~np.isnan(window))
+        grid = Grid(
+            lats=w_lat0 + rows * (dlat * step),
+            lons=w_lon0 + cols * (dlon * step),
+            rows=rows.astype(np.int32),
+            cols=cols.astype(np.int32),
+            lat0=w_lat0,
+            lon0=w_lon0,
+            dlat_deg=dlat * step,
+            dlon_deg=dlon * step,
+            n_rows=window.shape[0],
+            n_cols=window.shape[1],
+        )
+        return grid, window[rows, cols].astype(np.float64), header["grid_step_m"] * step
+
+    def _remove(self, zone_id: str, stem: str) -> int:
+        """Delete one raster's files; returns the bytes freed."""
+        zone_dir = os.path.join(self.directory, zone_id)
+        freed = 0
+        try:
+            names = os.listdir(zone_dir)
+        except OSError:
+            return 0
+        # Header first, so readers stop finding the raster.
+        for name in sorted(names, key=lambda n: not n.endswith(HEADER_SUFFIX)):
+            if name.startswith(stem + "."):
+                path = os.path.join(zone_dir, name)
+                try:
+                    freed += os.path.getsize(path)
+                    os.unlink(path)
+                except OSError:
+                    pass
+        try:
+            os.rmdir(zone_dir)
+        except OSError:
+            pass
+        return freed
+
+    def delete(self, zone_id: int, algorithm: Optional[str] = None) -> None:
+        """Drop the zone's raster for `algorithm`, or all of its rasters."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for _, _, stem in self._rasters(str(int(zone_id))):
+                if algorithm is None or stem == _slug(algorithm):
+                    self._remove(str(int(zone_id)), stem)
+
+    def _rasters(self, zone: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """`(header_path, zone_id, stem)` of stored rasters."""
+        found = []
+        zones = [zone] if zone is not None else os.listdir(self.directory)
+        for zone_id in zones:
+            zone_dir = os.path.join(self.directory, zone_id)
+            if not zone_id.isdigit() or not os.path.isdir(zone_dir):
+                continue
+            for name in os.listdir(zone_dir):
+                if name.endswith(HEADER_SUFFIX):
+                    found.append(
+                        (os.path.join(zone_dir, name), zone_id, name[:-len(HEADER_SUFFIX)])
+                    )
+        return found
+
+    def collect_garbage(self, live: Iterable[Tuple[int, str]]) -> int:
+        """Remove rasters whose (zone id, algorithm) is not in `live`."""
+        if not self.enabled:
+            return 0
+        keep = {(str(int(zone_id)), _slug(algorithm)) for zone_id, algorithm in live}
+        removed = 0
+        with self._lock:
+            for _, zone_id, stem in self._rasters():
+                if (zone_id, stem) not in keep:
+                    self._remove(zone_id, stem)
+                    removed += 1
+        return removed
+
+    def _sizes(self) -> Dict[Tuple[str, str], Tuple[float, int]]:
+        """(zone id, stem) -> (last read, total bytes)."""
+        sizes: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        for header_path, zone_id, stem in self._rasters():
+            zone_dir = os.path.dirname(header_path)
+            try:
+                mtime = os.path.getmtime(header_path)
+                total = sum(
+                    os.path.getsize(os.path.join(zone_dir, name))
+                    for name in os.listdir(zone_dir)
+                    if name.startswith(stem + ".")
+                )
+            except OSError:
+                continue
+            sizes[(zone_id, stem)] = (mtime, total)
+        return sizes
+
+    def _evict(self) -> None:
+        with self._lock:
+            sizes = self._sizes()
+            total = sum(size for _, size in sizes.values())
+            for (zone_id, stem), (_, size) in sorted(sizes.items(), key=lambda kv: kv[1][0]):
+                if total <= self.budget_bytes:
+                    break
+                total -= self._remove(zone_id, stem)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, object]:
+        if not self.enabled:
+            return {"directory": None}
+        sizes = self._sizes()
+        return {
+            "directory": self.directory,
+            "rasters": len(sizes),
+            "size_bytes": sum(size for _, size in sizes.values()),
+            "budget_bytes": self.budget_bytes,
+            "evictions": self.evictions,
+        }
+
+
+raster_store = RasterStore()
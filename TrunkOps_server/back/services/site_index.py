@@ -0,0 +1,99 @@
+"""Spatial index over base stations for coverage pruning.
+
+Sites are hashed into a fixed lat/lon bucket grid. A query returns
+the sites whose useful reach (`site_reach_km`) can touch a disc of
+the given radius, so each tile of a coverage grid only evaluates
+sites that could be above the floor level there.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .grid_service import EARTH_RADIUS_KM, haversine_distance_km_np
+
+
+KM_PER_DEG = EARTH_RADIUS_KM * math.pi / 180.0
+
+# Slack on the longitude extent of a query to absorb the difference
+# between great-circle and along-parallel distance.
+LON_QUERY_SLACK = 1.05
+
+
+def site_reach_km(k: np.ndarray, b: np.ndarray, floor_dbm: float) -> np.ndarray:
+    """Distance beyond which `k - b * log10(d)` drops below `floor_dbm`."""
+    with np.errstate(over="ignore"):
+        return np.power(10.0, (k - floor_dbm) / b)
+
+
+class SiteIndex:
+    """Bucket-grid index of sites with a per-site reach radius."""
+
+    def __init__(self,
+                 lats: np.ndarray,
+                 lons: np.ndarray,
+                 reach_km: np.ndarray,
+                 bucket_km: float = 10.0) -> None:
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.reach_km = np.asarray(reach_km, dtype=np.float64)
+        self.max_reach_km = float(self.reach_km.max()) if self.reach_km.size else 0.0
+
+        self.bucket_dlat = bucket_km / KM_PER_DEG
+        self.bucket_dlon = bucket_km / KM_PER_DEG
+
+        bi = np.floor(self.lats / self.bucket_dlat).astype(np.int64)
+        bj = np.floor(self.lons / self.bucket_dlon).astype(np.int64)
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for idx, key in enumerate(zip(bi.tolist(), bj.tolist())):
+            buckets.setdefault(key, []).append(idx)
+        self._buckets = {
+            key: np.array(ids, dtype=np.int64) for key, ids in buckets.items()
+        }
+
+    def __len__(self) -> int:
+        return int(self.lats.shape[0])
+
+    def query(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Sorted indices of sites whose reach intersects the disc.
+
+        A site is returned when its distance to (`lat`, `lon`) is at
+        most `reach_km + radius_km`.
+        """
+        search_km = radius_km + self.max_reach_km
+        dlat = search_km / KM_PER_DEG
+        max_abs_lat = min(abs(lat) + dlat, 90.0)
+        cos_lat = math.cos(math.radians(max_abs_lat))
+        if cos_lat < 0.01:
+            candidates = np.arange(len(self), dtype=np.int64)
+        else:
+            dlon = min(search_km / (KM_PER_DEG * cos_lat) * LON_QUERY_SLACK, 180.0)
+            i0 = math.floor((lat - dlat) / self.bucket_dlat)
+            i1 = math.floor((lat + dlat) / self.bucket_dlat)
+            j0 = math.floor((lon - dlon) / self.bucket_dlon)
+            j1 = math.floor((lon + dlon) / self.bucket_dlon)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._buckets):
+                parts = [
+                    ids for (i, j), ids in self._buckets.items()
+                    if i0 <= i <= i1 and j0 <= j <= j1
+                ]
+            else:
+                parts = [
+                    self._buckets[(i, j)]
+                    for i in range(i0, i1 + 1)
+                    for j in range(j0, j1 + 1)
+                    if (i, j) in self._buckets
+                ]
+            if not parts:
+                return np.empty(0, dtype=np.int64)
+            candidates = np.concatenate(parts)
+
+        d_km = haversine_distance_km_np(
+            lat, lon, self.lats[candidates], self.lons[candidates]
+        )
+        hit = candidates[d_km <= self.reach_km[candidates] + radius_km]
+        hit.sort()
+        return hit
@@ -0,0 +1,166 @@
+"""Per-site received-level rasters and incremental best-server.
+
+Each site's level over the grid is cached under a key made of the
+site's radio parameters, the grid and the model. The best-server map
+is then the element-wise maximum over the cached rasters, so moving
+or retuning one site recomputes only that site's raster.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from ..coverage_schemas import GridConfig, Site
+from .byte_cache import ByteLRU
+from .coverage_engine import (
+    FLOOR_DBM,
+    BestServer,
+    NO_SIGNAL_DBM,
+    ServerMetrics,
+    site_levels_on_grid,
+)
+from .coverage_pool import best_server_tiled
+from .grid_service import Grid
+from .propagation_models import get_model
+
+
+BUDGET_BYTES: int = int(os.getenv("COVERAGE_SITE_RASTER_BYTES", str(512 * 1024 * 1024)))
+
+# Requests with more sites go through the pruned engine instead: every
+# cached raster spans the whole grid, which stops paying off when most
+# sites only reach a small part of it.
+MAX_SITES: int = int(os.getenv("COVERAGE_SITE_RASTER_MAX_SITES", "32"))
+
+
+def site_raster_key(site: Site,
+                    grid: GridConfig,
+                    rx_height_m: float,
+                    model: str) -> str:
+    """Key of one site's raster; the site id does not affect levels."""
+    payload = json.dumps(
+        {
+            "site": site.model_dump(mode="json", exclude={"id"}),
+            "grid": grid.model_dump(mode="json"),
+            "rx_height_m": rx_height_m,
+            "model": model,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SiteRasterCache:
+    """Memory-bounded LRU of per-site level rasters."""
+
+    def __init__(self, budget_bytes: int = BUDGET_BYTES) -> None:
+        self.rasters: ByteLRU[np.ndarray] = ByteLRU(budget_bytes)
+        self.computed = 0
+
+    def eligible(self, n_sites: int, n_cells: int) -> bool:
+        """Whether caching `n_sites` rasters of `n_cells` fits the budget."""
+        return (
+            0 < n_sites <= MAX_SITES
+            and n_sites * n_cells * 8 <= self.rasters.budget_bytes
+        )
+
+    def site_raster(self,
+                    site: Site,
+                    grid: Grid,
+                    grid_config: GridConfig,
+                    rx_height_m: float,
+                    model: str) -> np.ndarray:
+        key = site_raster_key(site, grid_config, rx_height_m, model)
+        raster = self.rasters.get(key)
+        if raster is None:
+            if get_model(model).uses_terrain:
+                raster = best_server_tiled(
+                    grid.lats, grid.lons, [site], rx_height_m, model
+                ).rx_level_dbm
+            else:
+                raster = site_levels_on_grid(grid, site, rx_height_m, model)
+            raster.flags.writeable = False
+            self.computed += 1
+            self.rasters.put(key, raster, raster.nbytes)
+        return raster
+
+    def best_server(self,
+                    grid: Grid,
+                    grid_config: GridConfig,
+                    sites: Sequence[Site],
+                    rx_height_m: float,
+                    model: str = "hata",
+                    on_site: Optional[Callable[[int, int], None]] = None,
+                    server_threshold_dbm: Optional[float] = None) -> BestServer:
+        """Best server as the element-wise max of per-site rasters.
+
+        Ties go to the earliest site, as in the exhaustive reduction,
+        so the result is identical to `coverage_engine.best_server`
+        (`ServerMetrics`, when `server_threshold_dbm` is given, up to
+        rounding of the C/I sum). `on_site(done_sites, total_sites)`
+        is called after each site.
+        """
+        n_cells = len(grid)
+        best_rx = np.full(n_cells, NO_SIGNAL_DBM, dtype=np.float64)
+        best_idx = np.full(n_cells, -1, dtype=np.int32)
+        with_metrics = server_threshold_dbm is not None
+        if with_metrics:
+            second_rx = np.full(n_cells, -np.inf, dtype=np.float64)
+            second_idx = np.full(n_cells, -1, dtype=np.int32)
+            count = np.zeros(n_cells, dtype=np.int32)
+            rasters = []
+        for i, site in enumerate(sites):
+            rx = self.site_raster(site, grid, grid_config, rx_height_m, model)
+            if with_metrics:
+                rasters.append(rx)
+            if i == 0:
+                best_rx[:] = rx
+                best_idx[:] = 0
+            else:
+                better = rx > best_rx
+                if with_metrics:
+                    runner_up = ~better & (rx > second_rx)
+                    second_rx[better] = best_rx[better]
+                    second_idx[better] = best_idx[better]
+                    second_rx[runner_up] = rx[runner_up]
+                    second_idx[runner_up] = i
+                best_rx[better] = rx[better]
+                best_idx[better] = i
+            if with_metrics:
+                count += rx >= server_threshold_dbm
+            if on_site is not None:
+                on_site(i + 1, len(sites))
+
+        metrics = None
+        if with_metrics:
+            # Co-channel interference needs the winner, so it takes a
+            # second pass over the rasters of the first one.
+            floor_dbm = min(FLOOR_DBM, server_threshold_dbm)
+            best_freq = np.array([s.frequency_mhz for s in sites])[np.maximum(best_idx, 0)]
+            interference = np.zeros(n_cells, dtype=np.float64)
+            for i, (site, rx) in enumerate(zip(sites, rasters)):
+                co = (best_freq == site.frequency_mhz) & (best_idx != i) & (rx >= floor_dbm)
+                interference[co] += np.power(10.0, rx[co] / 10.0)
+            with np.errstate(divide="ignore"):
+                ci_db = np.where(
+                    interference > 0, best_rx - 10.0 * np.log10(interference), np.nan
+                )
+            found = second_idx >= 0
+            metrics = ServerMetrics(
+                second_rx_level_dbm=np.where(found, second_rx, NO_SIGNAL_DBM),
+                second_site_index=second_idx,
+                server_count=count,
+                ci_db=ci_db,
+            )
+        return BestServer(rx_level_dbm=best_rx, site_index=best_idx, metrics=metrics)
+
+    def stats(self):
+        return {**self.rasters.stats(), "computed": self.computed}
+
+
+site_raster_cache = SiteRasterCache()
@@ -0,0 +1,209 @@
+"""XYZ (web-mercator) coverage tiles.
+
+Tiles are rendered on demand for a registered site set: the level at
+every pixel centre is computed with the batched engine and mapped to
+a colour, then encoded as PNG. Rendering takes its work from the
+server-wide coverage budget (`coverage_budget.admission`). Rendered tiles are kept in a memory
+LRU (`COVERAGE_TILE_CACHE_BYTES`) and, when `COVERAGE_TILE_CACHE_DIR`
+is set, in a disk LRU shared by all workers.
+
+Registered sets are kept in memory and, with the disk tier, as JSON
+next to the tiles, so every worker can serve a set registered by
+another one, also after a restart or once the memory LRU dropped it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import struct
+import zlib
+from typing import Dict, Optional
+
+import numpy as np
+
+from ..coverage_schemas import CoverageTileSet
+from .byte_cache import ByteLRU, DiskLRU, SingleFlight
+from .coverage_budget import admission, work_units
+from .coverage_engine import ENGINE_VERSION, FLOOR_DBM, best_server
+
+
+TILE_SIZE = 256
+MAX_ZOOM = 20
+
+MEMORY_BUDGET_BYTES: int = int(os.getenv("COVERAGE_TILE_CACHE_BYTES", str(64 * 1024 * 1024)))
+DISK_DIR: Optional[str] = os.getenv("COVERAGE_TILE_CACHE_DIR") or None
+DISK_BUDGET_BYTES: int = int(os.getenv("COVERAGE_TILE_CACHE_DISK_BYTES", str(1024 ** 3)))
+TILE_SET_BUDGET_BYTES: int = int(os.getenv("COVERAGE_TILE_SET_BYTES", str(16 * 1024 * 1024)))
+TILE_SET_DISK_BYTES: int = int(os.getenv("COVERAGE_TILE_SET_DISK_BYTES", str(64 * 1024 * 1024)))
+
+# `tile_set_id` output; anything else is never looked up on disk.
+SET_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+# Level classes as drawn by the mobile client (RGBA).
+LEVEL_RAMP = (
+    (-80.0, (76, 175, 80, 204)),
+    (-95.0, (255, 235, 59, 204)),
+    (-110.0, (255, 152, 0, 204)),
+    (FLOOR_DBM, (244, 67, 54, 77)),
+)
+
+SERVER_PALETTE = np.array(
+    [
+        (31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40),
+        (148, 103, 189), (140, 86, 75), (227, 119, 194), (127, 127, 127),
+        (188, 189, 34), (23, 190, 207), (57, 59, 121), (173, 73, 74),
+    ],
+    dtype=np.uint8,
+)
+SERVER_ALPHA = 160
+
+
+def tile_set_id(tile_set: CoverageTileSet) -> str:
+    payload = json.dumps(tile_set.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def tile_pixel_centres(z: int, x: int, y: int, size: int = TILE_SIZE):
+    """Lat/lon of the pixel centres of tile (z, x, y), row-major from the north."""
+    n = 2 ** z
+    px = (x + (np.arange(size) + 0.5) / size) / n
+    py = (y + (np.arange(size) + 0.5) / size) / n
+    lons = px * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * py))))
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
+    return lat_grid.ravel(), lon_grid.ravel()
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Minimal RGBA8 PNG encoder (no external imaging dependency)."""
+    height, width, _ = rgba.shape
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data)) + tag + data
+            + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+        )
+
+    raw = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 0] = 0  # filter type: none
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)),
+        chunk(b"IEND", b""),
+    ))
+
+
+def colourize(rx_level_dbm: np.ndarray, site_index: np.ndarray, layer: str) -> np.ndarray:
+    """RGBA pixels for the `level` or `server` layer; transparent below the floor."""
+    rgba = np.zeros(rx_level_dbm.shape + (4,), dtype=np.uint8)
+    covered = rx_level_dbm >= FLOOR_DBM
+    if layer == "server":
+        idx = site_index[covered] % len(SERVER_PALETTE)
+        rgba[covered, :3] = SERVER_PALETTE[idx]
+        rgba[covered, 3] = SERVER_ALPHA
+        return rgba
+    painted = np.zeros(rx_level_dbm.shape, dtype=bool)
+    for threshold, colour in LEVEL_RAMP:
+        sel = (rx_level_dbm >= threshold) & ~painted
+        rgba[sel] = colour
+        painted |= sel
+    return rgba
+
+
+def tile_work_units(tile_set: CoverageTileSet) -> int:
+    """Work of rendering one tile of the set (see `coverage_budget`)."""
+    return work_units(TILE_SIZE * TILE_SIZE, len(tile_set.sites), tile_set.model)
+
+
+def render_tile(tile_set: CoverageTileSet, z: int, x: int, y: int, layer: str) -> bytes:
+    lats, lons = tile_pixel_centres(z, x, y)
+    best = best_server(lats, lons, tile_set.sites, tile_set.rx_height_m, tile_set.model)
+    rgba = colourize(best.rx_level_dbm, best.site_index, layer)
+    return encode_png(rgba.reshape(TILE_SIZE, TILE_SIZE, 4))
+
+
+class TileService:
+    """Registry of tile sets plus the rendered-tile caches."""
+
+    def __init__(self,
+                 memory_budget_bytes: int = MEMORY_BUDGET_BYTES,
+                 disk_dir: Optional[str] = DISK_DIR,
+                 disk_budget_bytes: int = DISK_BUDGET_BYTES) -> None:
+        self.tile_sets: ByteLRU[CoverageTileSet] = ByteLRU(TILE_SET_BUDGET_BYTES)
+        self.memory: ByteLRU[bytes] = ByteLRU(memory_budget_bytes)
+        self.disk: Optional[DiskLRU] = (
+            DiskLRU(disk_dir, disk_budget_bytes, suffix=".png") if disk_dir else None
+        )
+        self.set_disk: Optional[DiskLRU] = (
+            DiskLRU(disk_dir, TILE_SET_DISK_BYTES, suffix=".json") if disk_dir else None
+        )
+        self._flights = SingleFlight()
+        self.rendered = 0
+
+    def register(self, tile_set: CoverageTileSet) -> str:
+        set_id = tile_set_id(tile_set)
+        data = tile_set.model_dump_json()
+        self.tile_sets.put(set_id, tile_set, len(data))
+        if self.set_disk is not None:
+            self.set_disk.put(set_id, data.encode())
+        return set_id
+
+    def tile_set(self, set_id: str) -> Optional[CoverageTileSet]:
+        """Registered set from memory, else from the disk tier."""
+        tile_set = self.tile_sets.get(set_id)
+        if tile_set is not None or self.set_disk is None or not SET_ID_RE.fullmatch(set_id):
+            return tile_set
+        data = self.set_disk.get(set_id)
+        if data is None:
+            return None
+        try:
+            tile_set = CoverageTileSet.model_validate_json(data)
+        except ValueError:
+            # e.g. a pattern or model no longer available
+            return None
+        self.tile_sets.put(set_id, tile_set, len(data))
+        return tile_set
+
+    def get_tile(self, set_id: str, z: int, x: int, y: int, layer: str) -> Optional[bytes]:
+        """PNG for the tile, or None when the set is unknown.
+
+        Raises `AdmissionTimeout` when a render waits too long for budget.
+        """
+        key = f"{set_id}_v{ENGINE_VERSION}_{layer}_{z}_{x}_{y}"
+        png = self.memory.get(key)
+        if png is not None:
+            return png
+        tile_set = self.tile_set(set_id)
+        if tile_set is None:
+            return None
+        return self._flights.do(key, lambda: self._load_or_render(key, tile_set, z, x, y, layer))
+
+    def _load_or_render(self, key, tile_set, z, x, y, layer) -> bytes:
+        png = self.disk.get(key) if self.disk is not None else None
+        if png is None:
+            with admission.admit(tile_work_units(tile_set)):
+                png = render_tile(tile_set, z, x, y, layer)
+            self.rendered += 1
+            if self.disk is not None:
+                self.disk.put(key, png)
+        self.memory.put(key, png, len(png))
+        return png
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "tile_sets": len(self.tile_sets),
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "tile_set_disk": self.set_disk.stats() if self.set_disk is not None else None,
+            "coalesced": self._flights.coalesced,
+            "rendered": self.rendered,
+        }
+
+
+tile_service = TileService()
@@ -1,4 +1,5 @@
 import 'dart:convert';
+import 'dart:typed_data';
 
 /// Single base station (site) used for coverage calculation.
 class Site {
@@ -109,3 +110,129 @@ class CoverageResponse {
     );
   }
 }
+
+/// Registered site set for XYZ coverage tiles (`POST /coverage/tiles`).
+class CoverageTileSetRef {
+  final String id;
+
+  /// Template relative to the API root, with `{z}`, `{x}`, `{y}`.
+  final String tileUrl;
+
+  CoverageTileSetRef({required this.id, required this.tileUrl});
+
+  factory CoverageTileSetRef.fromJson(Map<String, dynamic> json) =>
+      CoverageTileSetRef(
+        id: json['id'] as String,
+        tileUrl: json['tile_url'] as String,
+      );
+}
+
+/// Compact raster form of a coverage result
+/// (`application/vnd.trunkops.coverage-raster`).
+///
+/// Cell (row, col) lies at `lat0 + row * dlatDeg`, `lon0 + col * dlonDeg`;
+/// [levels] holds the levels of the in-circle cells in row-major order.
+class CoverageRaster {
+  static const List<int> magic = [0x54, 0x4F, 0x43, 0x52]; // "TOCR"
+
+  final double gridStepM;
+  final double lat0;
+  final double lon0;
+  final double dlatDeg;
+  final double dlonDeg;
+  final int nRows;
+  final int nCols;
+  final Uint8List mask;
+  final Float64List levels;
+
+  CoverageRaster({
+    required this.gridStepM,
+    required this.lat0,
+    required this.lon0,
+    required this.dlatDeg,
+    required this.dlonDeg,
+    required this.nRows,
+    required this.nCols,
+    required this.mask,
+    required this.levels,
+  });
+
+  bool isInside(int row, int col) {
+    final i = row * nCols + col;
+    return (mask[i >> 3] & (0x80 >> (i & 7))) != 0;
+  }
+
+  /// Parse the binary body returned with `format=binary`.
+  factory CoverageRaster.fromBytes(Uint8List body) {
+    for (var i = 0; i < magic.length; i++) {
+      if (body[i] != magic[i]) {
+        throw const FormatException('Not a coverage raster');
+      }
+    }
+    final view = ByteData.sublistView(body);
+    final headLen = view.getUint32(4, Endian.little);
+    final header =
+        jsonDecode(utf8.decode(body.sublist(8, 8 + headLen)))
+            as Map<String, dynamic>;
+
+    var pos = 8 + headLen;
+    final maskBytes = header['mask_bytes'] as int;
+    final mask = Uint8List.sublistView(body, pos, pos + maskBytes);
+    pos += maskBytes;
+
+    final nCells = header['n_cells'] as int;
+    final scale = (header['scale'] as num).toDouble();
+    final offset = (header['offset'] as num).toDouble();
+    final levels = Float64List(nCells);
+    switch (header['dtype'] as String) {
+      case 'float32':
+        for (var i = 0; i < nCells; i++) {
+          levels[i] = view.getFloat32(pos + 4 * i, Endian.little);
+        }
+      case 'int16':
+        for (var i = 0; i < nCells; i++) {
+          levels[i] = offset + scale * view.getInt16(pos + 2 * i, Endian.little);
+        }
+      case 'int8':
+        for (var i = 0; i < nCells; i++) {
+          levels[i] = offset + scale * view.getInt8(pos + i);
+        }
+      default:
+        throw FormatException('Unsupported dtype ${header['dtype']}');
+    }
+
+    return CoverageRaster(
+      gridStepM: (header['grid_step_m'] as num).toDouble(),
+      lat0: (header['lat0'] as num).toDouble(),
+      lon0: (header['lon0'] as num).toDouble(),
+      dlatDeg: (header['dlat_deg'] as num).toDouble(),
+      dlonDeg: (header['dlon_deg'] as num).toDouble(),
+      nRows: header['n_rows'] as int,
+      nCols: header['n_cols'] as int,
+      mask: mask,
+      levels: levels,
+    );
+  }
+
+  /// Expand to the per-cell form used by the map layers.
+  List<CoverageCell> toCells() {
+    final cells = <CoverageCell>[];
+    var k = 0;
+    for (var row = 0; row < nRows; row++) {
+      for (var col = 0; col < nCols; col++) {
+        if (!isInside(row, col)) continue;
+        cells.add(
+          CoverageCell(
+            lat: lat0 + row * dlatDeg,
+            lon: lon0 + col * dlonDeg,
+            rxLevelDbm: levels[k++],
+          ),
+        );
+      }
+    }
+    return cells;
+  }
+
+  CoverageResponse toResponse() =>
+      CoverageResponse(gridStepM: gridStepM, cells: toCells());
+}
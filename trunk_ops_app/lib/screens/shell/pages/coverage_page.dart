@@ -230,12 +230,16 @@ class _CoverageMapCardState extends State<_CoverageMapCard> {
         grid: grid,
       );
 
-      final resp = await _api.calculateCoverage(req);
-
-      if (!mounted) return;
+      // Потоковий режим: малюємо клітинки по мірі надходження
+      final cells = <CoverageCell>[];
       setState(() {
-        _coverage = resp;
+        _coverage = CoverageResponse(gridStepM: stepM, cells: cells);
       });
+
+      await for (final batch in _api.calculateCoverageStream(req)) {
+        if (!mounted) return;
+        setState(() => cells.addAll(batch));
+      }
     } catch (e) {
       if (!mounted) return;
       ScaffoldMessenger.of(
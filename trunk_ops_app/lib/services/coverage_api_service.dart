@@ -11,6 +11,9 @@ class CoverageApiService {
   /// - все інше → 127.0.0.1
   final String baseUrl;
 
+  /// Скільки клітинок віддавати UI за одну пачку у потоковому режимі.
+  static const int streamBatchSize = 2000;
+
   CoverageApiService({String? baseUrl})
     : baseUrl = baseUrl ?? _resolveDefaultBaseUrl();
 
@@ -40,4 +43,110 @@ class CoverageApiService {
     final data = jsonDecode(resp.body) as Map<String, dynamic>;
     return CoverageResponse.fromJson(data);
   }
+
+  /// Реєструє набір станцій для тайлового шару покриття.
+  ///
+  /// Далі мапа сама запитує лише видимі тайли
+  /// (див. [coverageTileUrlTemplate]) з роздільністю під масштаб.
+  Future<CoverageTileSetRef> registerTileSet({
+    required List<Site> sites,
+    double rxHeightM = 1.5,
+    String model = 'hata',
+  }) async {
+    final url = Uri.parse('$baseUrl/coverage/tiles');
+
+    final resp = await http.post(
+      url,
+      headers: const {'Content-Type': 'application/json'},
+      body: jsonEncode({
+        'sites': sites.map((s) => s.toJson()).toList(),
+        'rx_height_m': rxHeightM,
+        'model': model,
+      }),
+    );
+
+    if (resp.statusCode != 200) {
+      throw Exception('Помилка API (${resp.statusCode}): ${resp.body}');
+    }
+
+    return CoverageTileSetRef.fromJson(
+      jsonDecode(resp.body) as Map<String, dynamic>,
+    );
+  }
+
+  /// Шаблон URL для `TileLayer(urlTemplate: ...)`.
+  /// [layer]: `level` (класи рівня сигналу) або `server` (найкраща БС).
+  String coverageTileUrlTemplate(
+    CoverageTileSetRef tileSet, {
+    String layer = 'level',
+  }) => '$baseUrl${tileSet.tileUrl}&layer=$layer';
+
+  /// Розрахунок покриття у компактному бінарному растровому форматі.
+  ///
+  /// [dtype]: `float32`, `int16` (0.01 дБ) або `int8` (1 дБ) — у 10–50
+  /// разів менше за JSON зі списком клітинок.
+  Future<CoverageRaster> calculateCoverageRaster(
+    CoverageRequest req, {
+    String dtype = 'int16',
+  }) async {
+    final url = Uri.parse(
+      '$baseUrl/coverage/calc',
+    ).replace(queryParameters: {'format': 'binary', 'dtype': dtype});
+
+    final resp = await http.post(
+      url,
+      headers: const {'Content-Type': 'application/json'},
+      body: jsonEncode(req.toJson()),
+    );
+
+    if (resp.statusCode != 200) {
+      throw Exception('Помилка API (${resp.statusCode}): ${resp.body}');
+    }
+
+    return CoverageRaster.fromBytes(resp.bodyBytes);
+  }
+
+  /// Потоковий розрахунок покриття (NDJSON, `/coverage/calc/stream`).
+  ///
+  /// Клітинки приходять пачками по мірі розрахунку на бекенді, тож
+  /// мапу можна малювати ще до завершення прогону. Перший рядок
+  /// відповіді — заголовок (`crs`, `grid_step_m`), його пропускаємо.
+  Stream<List<CoverageCell>> calculateCoverageStream(
+    CoverageRequest req,
+  ) async* {
+    final url = Uri.parse('$baseUrl/coverage/calc/stream');
+    final client = http.Client();
+
+    try {
+      final request = http.Request('POST', url)
+        ..headers['Content-Type'] = 'application/json'
+        ..body = jsonEncode(req.toJson());
+
+      final resp = await client.send(request);
+
+      if (resp.statusCode != 200) {
+        final body = await resp.stream.bytesToString();
+        throw Exception('Помилка API (${resp.statusCode}): $body');
+      }
+
+      final lines = resp.stream
+          .transform(utf8.decoder)
+          .transform(const LineSplitter());
+
+      var batch = <CoverageCell>[];
+      await for (final line in lines) {
+        if (line.isEmpty) continue;
+        final data = jsonDecode(line) as Map<String, dynamic>;
+        if (!data.containsKey('rx_level_dbm')) continue;
+        batch.add(CoverageCell.fromJson(data));
+        if (batch.length >= streamBatchSize) {
+          yield batch;
+          batch = <CoverageCell>[];
+        }
+      }
+      if (batch.isNotEmpty) yield batch;
+    } finally {
+      client.close();
+    }
+  }
 }